@@ -38,6 +38,9 @@ class SubagentSpec(BaseModel):
 
     path: Path = Field(description="Subagent file path")
     description: str = Field(description="Subagent description")
+    model: str | None = Field(
+        default=None, description="Model to run the subagent with, the main model if not set"
+    )
 
 
 @dataclass(frozen=True, slots=True, kw_only=True)
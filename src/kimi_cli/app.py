@@ -1,9 +1,10 @@
 from __future__ import annotations
 
+import asyncio
 import contextlib
 import os
 import warnings
-from collections.abc import Generator
+from collections.abc import AsyncGenerator
 from pathlib import Path
 from typing import Any
 
@@ -16,9 +17,12 @@ from kimi_cli.llm import augment_provider_with_env_vars, create_llm
 from kimi_cli.session import Session
 from kimi_cli.soul import LLMNotSet, LLMNotSupported
 from kimi_cli.soul.agent import load_agent
+from kimi_cli.soul.blob import BlobStore
 from kimi_cli.soul.context import Context
+from kimi_cli.soul.history import convert_session_history
 from kimi_cli.soul.kimisoul import KimiSoul
 from kimi_cli.soul.runtime import Runtime
+from kimi_cli.soul.tokens import create_token_estimator
 from kimi_cli.utils.logging import StreamToLogger, logger
 
 
@@ -82,13 +86,30 @@ class KimiCLI:
             llm = create_llm(provider, model, session_id=session.id)
 
         runtime = await Runtime.create(config, llm, session, yolo)
+        if llm is not None:
+            runtime.link_fallbacks(llm, model)
 
         if agent_file is None:
             agent_file = DEFAULT_AGENT_FILE
         agent = await load_agent(agent_file, runtime, mcp_configs=mcp_configs or [])
 
-        context = Context(session.history_file)
-        await context.restore()
+        n_converted = await asyncio.to_thread(
+            convert_session_history, session.history_file, config.context.format
+        )
+        if n_converted:
+            logger.info(
+                "Converted {n} history files to {format} format",
+                n=n_converted,
+                format=config.context.format,
+            )
+        context = Context(
+            session.history_file,
+            durability=config.context.durability,
+            format=config.context.format,
+            blob_store=BlobStore(session.blob_dir, threshold=config.context.blob_threshold),
+            token_estimator=create_token_estimator(config.context.tokenizer_table),
+        )
+        await context.restore(lazy=config.context.lazy_restore)
 
         soul = KimiSoul(
             agent,
@@ -121,8 +142,8 @@ class KimiCLI:
         """Get the Session instance."""
         return self._runtime.session
 
-    @contextlib.contextmanager
-    def _app_env(self) -> Generator[None]:
+    @contextlib.asynccontextmanager
+    async def _app_env(self) -> AsyncGenerator[None]:
         original_cwd = Path.cwd()
         os.chdir(self._runtime.session.work_dir)
         try:
@@ -131,6 +152,8 @@ class KimiCLI:
             with contextlib.redirect_stderr(StreamToLogger()):
                 yield
         finally:
+            await self._soul.context.close()
+            await self._runtime.workspace.aclose()
             os.chdir(original_cwd)
 
     async def run_shell_mode(self, command: str | None = None) -> bool:
@@ -180,7 +203,7 @@ class KimiCLI:
                     level=WelcomeInfoItem.Level.INFO,
                 )
             )
-        with self._app_env():
+        async with self._app_env():
             app = ShellApp(self._soul, welcome_info=welcome_info)
             return await app.run(command)
 
@@ -192,7 +215,7 @@ class KimiCLI:
     ) -> bool:
         from kimi_cli.ui.print import PrintApp
 
-        with self._app_env():
+        async with self._app_env():
             app = PrintApp(
                 self._soul,
                 input_format,
@@ -204,13 +227,13 @@ class KimiCLI:
     async def run_acp_server(self) -> bool:
         from kimi_cli.ui.acp import ACPServer
 
-        with self._app_env():
+        async with self._app_env():
             app = ACPServer(self._soul)
             return await app.run()
 
     async def run_wire_server(self) -> bool:
         from kimi_cli.ui.wire import WireServer
 
-        with self._app_env():
+        async with self._app_env():
             server = WireServer(self._soul)
             return await server.run()
@@ -27,6 +27,8 @@ cli = typer.Typer(
 UIMode = Literal["shell", "print", "acp", "wire"]
 InputFormat = Literal["text", "stream-json"]
 OutputFormat = Literal["text", "stream-json"]
+# same as `kimi_cli.usage.UsageGroup`, which is not imported here to keep the startup fast
+UsageGroup = Literal["model", "session", "work_dir", "subagent", "kind", "day"]
 
 
 def _version_callback(value: bool) -> None:
@@ -35,8 +37,9 @@ def _version_callback(value: bool) -> None:
         raise typer.Exit()
 
 
-@cli.command()
+@cli.callback(invoke_without_command=True)
 def kimi(
+    ctx: typer.Context,
     version: Annotated[
         bool,
         typer.Option(
@@ -196,6 +199,8 @@ def kimi(
 ):
     """Kimi, your next CLI agent."""
     del version  # handled in the callback
+    if ctx.invoked_subcommand is not None:
+        return
 
     from kimi_cli.app import KimiCLI
     from kimi_cli.session import Session
@@ -350,6 +355,52 @@ def kimi(
             continue
 
 
+@cli.command()
+def usage(
+    by: Annotated[
+        UsageGroup,
+        typer.Option(
+            "--by",
+            "-b",
+            help="Group the usage by this. Default: model.",
+        ),
+    ] = "model",
+    work_dir: Annotated[
+        Path | None,
+        typer.Option(
+            "--work-dir",
+            "-w",
+            file_okay=False,
+            dir_okay=True,
+            help="Only count the usage in this working directory. Default: all.",
+        ),
+    ] = None,
+    session_id: Annotated[
+        str | None,
+        typer.Option(
+            "--session",
+            "-s",
+            help="Only count the usage in this session. Default: all.",
+        ),
+    ] = None,
+):
+    """Show the token usage of LLM calls across sessions."""
+    from kimi_cli.usage import aggregate_usage, format_usage, iter_usage_records
+
+    records = iter_usage_records()
+    if work_dir is not None:
+        work_dir_str = str(work_dir.absolute())
+        records = (record for record in records if record.work_dir == work_dir_str)
+    if session_id is not None:
+        records = (record for record in records if record.session_id == session_id)
+
+    totals = aggregate_usage(records, by)
+    if not totals:
+        typer.echo("No usage recorded yet.")
+        return
+    typer.echo(format_usage(totals, by))
+
+
 if __name__ == "__main__":
     if "kimi_cli.cli" not in sys.modules:
         sys.modules["kimi_cli.cli"] = sys.modules[__name__]
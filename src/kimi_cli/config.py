@@ -2,7 +2,7 @@ from __future__ import annotations
 
 import json
 from pathlib import Path
-from typing import Self
+from typing import Literal, Self
 
 from pydantic import BaseModel, Field, SecretStr, ValidationError, field_serializer, model_validator
 
@@ -40,6 +40,11 @@ class LLMModel(BaseModel):
     """Maximum context size (unit: tokens)"""
     capabilities: set[ModelCapability] | None = None
     """Model capabilities"""
+    fallback_models: list[str] | None = None
+    """
+    Names of the models to fall back to, in order, when requests keep failing with retryable
+    errors
+    """
 
 
 class LoopControl(BaseModel):
@@ -49,6 +54,103 @@ class LoopControl(BaseModel):
     """Maximum number of steps in one run"""
     max_retries_per_step: int = 3
     """Maximum number of retries in one step"""
+    reserved_tokens: int | None = Field(default=None, gt=0)
+    """
+    Tokens to reserve in the context window for the output and tool results of the next step,
+    compacting the context once exceeded. `None` to estimate from the steps of the session
+    """
+    compaction_watermark: float | None = Field(default=None, gt=0, lt=1)
+    """
+    Start compacting the context in background once it reaches this ratio of the size that
+    triggers compaction (e.g. 0.7), so that the result is ready when needed. This makes extra
+    LLM calls, whose result is discarded if the context changes in a way it cannot follow.
+    `None` to disable
+    """
+    max_tool_concurrency: int = Field(default=8, ge=1)
+    """Maximum number of tool calls of one step running at the same time"""
+    speculative_tool_calls: bool = False
+    """
+    Start side-effect free tool calls (e.g. `ReadFile`, `Glob` and `Grep`) as soon as their
+    arguments are complete, while the rest of the LLM response is still streaming
+    """
+    hedge_delay_ms: int | None = Field(default=None, gt=0)
+    """
+    If the LLM has not started responding within this many milliseconds, send the same
+    request to its first fallback model as well, and take whichever responds first.
+    `None` to disable
+    """
+    cache_tool_results: bool = True
+    """
+    Reuse the results of identical `ReadFile`, `Glob` and `Grep` calls within a run, until the
+    files are modified
+    """
+
+
+type HistoryDurability = Literal["record", "step", "checkpoint"]
+"""
+When context history records are written to the file backend:
+
+- `record`: write each record as soon as it is appended
+- `step`: buffer records and write them in one go at the end of each agent step
+- `checkpoint`: write each record as soon as it is appended, and fsync at each checkpoint
+"""
+
+type HistoryFormat = Literal["jsonl", "framed"]
+"""
+How context history files are stored:
+
+- `jsonl`: one JSON record per line
+- `framed`: zlib-compressed frames of JSON records, with random access per frame
+"""
+
+
+class ContextConfig(BaseModel):
+    """Context storage configuration."""
+
+    durability: HistoryDurability = "step"
+    """When history records are written to the file backend"""
+    format: HistoryFormat = "jsonl"
+    """The format of new history files. Existing sessions are converted when continued"""
+    lazy_restore: bool = True
+    """Only load recent history when continuing a session, and the rest when first needed"""
+    blob_threshold: int | None = Field(default=None, gt=0)
+    """
+    Tool output texts longer than this many characters (e.g. 16384) are stored once in the blob
+    store of the session and referenced from the history. `None` to keep them inline
+    """
+    stable_prefix: bool = False
+    """
+    Keep the prefix of LLM requests byte-stable across runs and continued sessions, so that it
+    can be served from the prompt cache of the provider: the date and the work directory listing
+    in the system prompt are frozen when the session starts, the current time is appended to
+    each user message instead, and compaction keeps the earliest summaries as they are
+    """
+    tokenizer_table: str | None = None
+    """
+    Path to a tokenizer vocabulary table in the `tiktoken` format, for estimating tokens of
+    messages not counted by the LLM provider yet. A character heuristic is used if not set
+    """
+
+
+class WorkspaceConfig(BaseModel):
+    """Workspace configuration."""
+
+    trigram_index: bool = False
+    """
+    Keep a trigram index of the files in the work directory under the share directory, for
+    `Grep` to narrow down the files to search. `Grep` also searches without ripgrep when it is
+    not available, from the index if enabled
+    """
+    file_index: bool = True
+    """
+    Keep an index of the paths in the work directory in memory, kept up to date by watching
+    the file system, for `Glob`, `Grep`, `@` file mention completion and the system prompt
+    """
+    ignore: list[str] = Field(default_factory=list)
+    """
+    Patterns in the `.gitignore` format of directories for `Glob`, `Grep` and the file index not
+    to descend into, in addition to `.gitignore` files and well-known build and cache directories
+    """
 
 
 class MoonshotSearchConfig(BaseModel):
@@ -77,20 +179,40 @@ class Config(BaseModel):
     """Main configuration structure."""
 
     default_model: str = Field(default="", description="Default model to use")
+    compaction_model: str | None = Field(
+        default=None, description="Model to compact the context with, the main model if not set"
+    )
     models: dict[str, LLMModel] = Field(default_factory=dict, description="List of LLM models")
     providers: dict[str, LLMProvider] = Field(
         default_factory=dict, description="List of LLM providers"
     )
     loop_control: LoopControl = Field(default_factory=LoopControl, description="Agent loop control")
+    context: ContextConfig = Field(
+        default_factory=ContextConfig, description="Context storage configuration"
+    )
+    workspace: WorkspaceConfig = Field(
+        default_factory=WorkspaceConfig, description="Workspace configuration"
+    )
     services: Services = Field(default_factory=Services, description="Services configuration")
 
     @model_validator(mode="after")
     def validate_model(self) -> Self:
         if self.default_model and self.default_model not in self.models:
             raise ValueError(f"Default model {self.default_model} not found in models")
-        for model in self.models.values():
+        if self.compaction_model and self.compaction_model not in self.models:
+            raise ValueError(f"Compaction model {self.compaction_model} not found in models")
+        for name, model in self.models.items():
             if model.provider not in self.providers:
                 raise ValueError(f"Provider {model.provider} not found in providers")
+            for fallback in model.fallback_models or []:
+                if fallback not in self.models or fallback == name:
+                    raise ValueError(f"Invalid fallback model {fallback} of model {name}")
+            reserved_tokens = self.loop_control.reserved_tokens
+            if reserved_tokens is not None and reserved_tokens >= model.max_context_size:
+                raise ValueError(
+                    f"Reserved tokens {reserved_tokens} exceed the max context size "
+                    f"{model.max_context_size} of model {name}"
+                )
         return self
 
 
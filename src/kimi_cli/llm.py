@@ -1,7 +1,7 @@
 from __future__ import annotations
 
 import os
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from typing import TYPE_CHECKING, Literal, cast, get_args
 
 from kosong.chat_provider import ChatProvider
@@ -23,6 +23,8 @@ class LLM:
     chat_provider: ChatProvider
     max_context_size: int
     capabilities: set[ModelCapability]
+    fallbacks: list[LLM] = field(default_factory=list["LLM"])
+    """The LLMs to fall back to, in order, when requests keep failing with retryable errors."""
 
     @property
     def model_name(self) -> str:
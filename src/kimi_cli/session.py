@@ -16,6 +16,16 @@ class Session:
     work_dir: Path
     history_file: Path
 
+    @property
+    def blob_dir(self) -> Path:
+        """The directory of the content-addressed blob store of the session."""
+        return self.history_file.with_suffix(".blobs")
+
+    @property
+    def prompt_args_file(self) -> Path:
+        """The file of the system prompt arguments frozen for the session, see `stable_prefix`."""
+        return self.history_file.with_suffix(".prompt.json")
+
     @staticmethod
     def create(work_dir: Path, _history_file: Path | None = None) -> Session:
         """Create a new session for a work directory."""
@@ -39,6 +49,11 @@ class Session:
                 assert _history_file.is_file()
             history_file = _history_file
 
+        session = Session(
+            id=session_id,
+            work_dir=work_dir,
+            history_file=history_file,
+        )
         if history_file.exists():
             # truncate if exists
             logger.warning(
@@ -46,14 +61,11 @@ class Session:
             )
             history_file.unlink()
             history_file.touch()
+            session.prompt_args_file.unlink(missing_ok=True)
 
         save_metadata(metadata)
 
-        return Session(
-            id=session_id,
-            work_dir=work_dir,
-            history_file=history_file,
-        )
+        return session
 
     @staticmethod
     def continue_(work_dir: Path) -> Session | None:
@@ -49,6 +49,24 @@ class MaxStepsReached(Exception):
 class StatusSnapshot:
     context_usage: float
     """The usage of the context, in percentage."""
+    context_tokens: int | None = None
+    """The projected token count of the context."""
+    tokens_by_role: dict[str, int] | None = None
+    """The tokens of the context by message role."""
+    tokens_by_tool: dict[str, int] | None = None
+    """The tokens of tool results in the context by tool name, in descending order."""
+    avg_time_to_first_token: float | None = None
+    """The average time to first token of LLM responses, in seconds."""
+    avg_tokens_per_second: float | None = None
+    """The output tokens per second of LLM responses, over all steps."""
+    cache_hit_rate: float | None = None
+    """The ratio of input tokens read from the prompt cache, over all steps."""
+    llm_time: float | None = None
+    """The total time of LLM requests, in seconds."""
+    tool_time: float | None = None
+    """The total time of tool calls, in seconds. Parallel tool calls are added up."""
+    overhead_time: float | None = None
+    """The total time spent on managing and compacting the context, in seconds."""
 
 
 @runtime_checkable
@@ -18,6 +18,7 @@ from kimi_cli.soul.runtime import BuiltinSystemPromptArgs, Runtime
 from kimi_cli.soul.toolset import CustomToolset
 from kimi_cli.tools import SkipThisTool
 from kimi_cli.utils.logging import logger
+from kimi_cli.workspace import WorkspaceIndex
 
 
 @dataclass(frozen=True, slots=True, kw_only=True)
@@ -59,12 +60,16 @@ async def load_agent(
         Session: runtime.session,
         DenwaRenji: runtime.denwa_renji,
         Approval: runtime.approval,
+        WorkspaceIndex: runtime.workspace,
     }
     tools = agent_spec.tools
     if agent_spec.exclude_tools:
         logger.debug("Excluding tools: {tools}", tools=agent_spec.exclude_tools)
         tools = [tool for tool in tools if tool not in agent_spec.exclude_tools]
-    toolset = CustomToolset()
+    toolset = CustomToolset(
+        max_concurrency=runtime.config.loop_control.max_tool_concurrency,
+        cache_results=runtime.config.loop_control.cache_tool_results,
+    )
     bad_tools = _load_tools(toolset, tools, tool_deps)
     if bad_tools:
         raise ValueError(f"Invalid tools: {bad_tools}")
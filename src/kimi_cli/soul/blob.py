@@ -0,0 +1,137 @@
+"""
+Content-addressed blob store of a session.
+
+Large tool outputs are stored once under their SHA-256 digest, and the messages in the
+context only hold a `BlobRefPart` referencing them. References are resolved back into
+`TextPart`s when a request is built, so that repeated outputs (e.g. reading the same file
+version again) cost neither extra disk nor resident memory.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import os
+import zlib
+from collections import OrderedDict
+from collections.abc import Sequence
+from pathlib import Path
+
+from kosong.message import ContentPart, Message, TextPart
+
+from kimi_cli.utils.logging import logger
+
+DEFAULT_CACHE_SIZE = 8 << 20
+"""The number of characters of resolved blobs kept in memory."""
+
+
+class BlobRefPart(ContentPart):
+    """A reference to a text part stored in the blob store of the session."""
+
+    type: str = "blob_ref"
+    digest: str
+    """The SHA-256 hex digest of the UTF-8 encoded text."""
+    size: int
+    """The length of the text, in characters."""
+
+
+class BlobStore:
+    """
+    A content-addressed store of texts under a directory, one zlib-compressed file per blob.
+
+    Args:
+        root (Path): The directory of the store. Created on the first write.
+        threshold (int | None): Tool output texts longer than this many characters are moved
+            into the store by `externalize`. `None` only resolves existing references.
+        cache_size (int): The number of characters of resolved blobs kept in memory.
+    """
+
+    def __init__(
+        self,
+        root: Path,
+        *,
+        threshold: int | None = None,
+        cache_size: int = DEFAULT_CACHE_SIZE,
+    ):
+        self._root = root
+        self._threshold = threshold
+        self._cache: OrderedDict[str, str] = OrderedDict()
+        self._cache_size = cache_size
+        self._cached_chars = 0
+
+    @property
+    def root(self) -> Path:
+        return self._root
+
+    def put(self, text: str) -> BlobRefPart:
+        """Store a text if not stored yet, and return the reference to it."""
+        data = text.encode("utf-8")
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._path(digest)
+        if not path.exists():
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+            tmp_path.write_bytes(zlib.compress(data))
+            os.replace(tmp_path, path)
+            logger.debug("Stored blob {digest} of {size} bytes", digest=digest, size=len(data))
+        self._remember(digest, text)
+        return BlobRefPart(digest=digest, size=len(text))
+
+    def get(self, ref: BlobRefPart) -> str:
+        """
+        Return the text of a reference.
+
+        Raises:
+            FileNotFoundError: When the blob is missing from the store.
+        """
+        if (text := self._cache.get(ref.digest)) is not None:
+            self._cache.move_to_end(ref.digest)
+            return text
+        text = zlib.decompress(self._path(ref.digest).read_bytes()).decode("utf-8")
+        self._remember(ref.digest, text)
+        return text
+
+    def externalize(self, message: Message) -> Message:
+        """
+        Move the large text parts of a tool message into the store.
+        Return a copy of the message referencing them, or the message itself if nothing moved.
+        """
+        threshold = self._threshold
+        if threshold is None or message.role != "tool" or isinstance(message.content, str):
+            return message
+        content: list[ContentPart] = []
+        for part in message.content:
+            if isinstance(part, TextPart) and len(part.text) > threshold:
+                content.append(self.put(part.text))
+            else:
+                content.append(part)
+        if all(a is b for a, b in zip(content, message.content, strict=True)):
+            return message
+        return message.model_copy(update={"content": content})
+
+    def resolve(self, messages: Sequence[Message]) -> list[Message]:
+        """Return the messages with all blob references replaced by the referenced texts."""
+        resolved: list[Message] = []
+        for message in messages:
+            if isinstance(message.content, str) or not any(
+                isinstance(part, BlobRefPart) for part in message.content
+            ):
+                resolved.append(message)
+                continue
+            content: list[ContentPart] = [
+                TextPart(text=self.get(part)) if isinstance(part, BlobRefPart) else part
+                for part in message.content
+            ]
+            resolved.append(message.model_copy(update={"content": content}))
+        return resolved
+
+    def _path(self, digest: str) -> Path:
+        return self._root / digest[:2] / digest[2:]
+
+    def _remember(self, digest: str, text: str):
+        if len(text) > self._cache_size or digest in self._cache:
+            return
+        self._cache[digest] = text
+        self._cached_chars += len(text)
+        while self._cached_chars > self._cache_size:
+            _, evicted = self._cache.popitem(last=False)
+            self._cached_chars -= len(evicted)
@@ -1,6 +1,10 @@
 from __future__ import annotations
 
-from collections.abc import Sequence
+import asyncio
+import json
+import os
+import time
+from collections.abc import Iterator, Sequence
 from string import Template
 from typing import TYPE_CHECKING, Protocol, runtime_checkable
 
@@ -9,8 +13,16 @@ from kosong.message import ContentPart, Message, TextPart
 
 import kimi_cli.prompts as prompts
 from kimi_cli.llm import LLM
+from kimi_cli.soul.blob import BlobRefPart
 from kimi_cli.soul.message import system
+from kimi_cli.soul.tokens import HeuristicTokenEstimator, TokenEstimator
+from kimi_cli.soul.toolset import get_current_tool_call_or_none
+from kimi_cli.usage import UsageLedger
 from kimi_cli.utils.logging import logger
+from kimi_cli.utils.message import message_extract_text, message_stringify
+
+COMPACTION_HEADER = "Previous context has been compacted. Here is the compaction output:"
+PRUNED_OUTPUT_HEADER = "Tool output pruned from the context:"
 
 
 @runtime_checkable
@@ -32,24 +44,26 @@ class Compaction(Protocol):
         ...
 
 
+def is_compaction_summary(message: Message) -> bool:
+    """Whether the message is a summary produced by a compaction."""
+    if message.role != "assistant" or isinstance(message.content, str) or not message.content:
+        return False
+    return message.content[0] == system(COMPACTION_HEADER)
+
+
 class SimpleCompaction(Compaction):
     MAX_PRESERVED_MESSAGES = 2
 
+    def __init__(self, *, usage_ledger: UsageLedger | None = None):
+        self._usage_ledger = usage_ledger
+
     async def compact(self, messages: Sequence[Message], llm: LLM) -> Sequence[Message]:
         history = list(messages)
         if not history:
             return history
 
-        preserve_start_index = len(history)
-        n_preserved = 0
-        for index in range(len(history) - 1, -1, -1):
-            if history[index].role in {"user", "assistant"}:
-                n_preserved += 1
-                if n_preserved == self.MAX_PRESERVED_MESSAGES:
-                    preserve_start_index = index
-                    break
-
-        if n_preserved < self.MAX_PRESERVED_MESSAGES:
+        preserve_start_index = _find_preserve_start(history, self.MAX_PRESERVED_MESSAGES)
+        if preserve_start_index is None:
             return history
 
         to_compact = history[:preserve_start_index]
@@ -64,34 +78,9 @@ class SimpleCompaction(Compaction):
             f"## Message {i + 1}\nRole: {msg.role}\nContent: {msg.content}"
             for i, msg in enumerate(to_compact)
         )
+        compacted_msg = await _generate_summary(history_text, llm, self._usage_ledger)
 
-        # Build the compact prompt using string template
-        compact_template = Template(prompts.COMPACT)
-        compact_prompt = compact_template.substitute(CONTEXT=history_text)
-
-        # Create input message for compaction
-        compact_message = Message(role="user", content=compact_prompt)
-
-        # Call generate to get the compacted context
-        # TODO: set max completion tokens
-        logger.debug("Compacting context...")
-        result = await generate(
-            chat_provider=llm.chat_provider,
-            system_prompt="You are a helpful assistant that compacts conversation context.",
-            tools=[],
-            history=[compact_message],
-        )
-        if result.usage:
-            logger.debug(
-                "Compaction used {input} input tokens and {output} output tokens",
-                input=result.usage.input,
-                output=result.usage.output,
-            )
-
-        content: list[ContentPart] = [
-            system("Previous context has been compacted. Here is the compaction output:")
-        ]
-        compacted_msg = result.message
+        content: list[ContentPart] = [system(COMPACTION_HEADER)]
         content.extend(
             [TextPart(text=compacted_msg.content)]
             if isinstance(compacted_msg.content, str)
@@ -102,7 +91,362 @@ class SimpleCompaction(Compaction):
         return compacted_messages
 
 
+class IncrementalCompaction(Compaction):
+    """
+    Compact only what is new since the last compaction.
+
+    Summaries from previous compactions are kept as they are, and only the span of messages
+    after them is summarized into a new summary. Once there are more than `MAX_SUMMARIES`
+    summaries, the oldest ones are merged into one, or the newest ones with `stable_prefix`, so
+    that the summaries at the head of the history stay the same and can be served from the
+    prompt cache. A span too large for one request is split into chunks that are summarized
+    separately and then merged (map-reduce), and a message too large for one chunk is split
+    into parts across chunks.
+    """
+
+    MAX_PRESERVED_MESSAGES = 2
+    MAX_SUMMARIES = 4
+    CHUNK_RATIO = 0.5
+    """The ratio of the max context size that the input of one summarization may take."""
+    MAX_REDUCE_ROUNDS = 4
+
+    def __init__(
+        self,
+        *,
+        usage_ledger: UsageLedger | None = None,
+        token_estimator: TokenEstimator | None = None,
+        stable_prefix: bool = False,
+    ):
+        self._estimator = token_estimator or HeuristicTokenEstimator()
+        self._usage_ledger = usage_ledger
+        self._stable_prefix = stable_prefix
+
+    async def compact(self, messages: Sequence[Message], llm: LLM) -> Sequence[Message]:
+        history = list(messages)
+        preserve_start_index = _find_preserve_start(history, self.MAX_PRESERVED_MESSAGES)
+        if preserve_start_index is None:
+            return history
+
+        summaries = [m for m in history[:preserve_start_index] if is_compaction_summary(m)]
+        span = [m for m in history[:preserve_start_index] if not is_compaction_summary(m)]
+        to_preserve = history[preserve_start_index:]
+        if not span:
+            return history
+
+        chunk_tokens = int(llm.max_context_size * self.CHUNK_RATIO)
+        logger.debug(
+            "Compacting {n_span} new messages, keeping {n_summaries} previous summaries",
+            n_span=len(span),
+            n_summaries=len(summaries),
+        )
+        summary_texts = [_extract_summary_text(m) for m in summaries]
+        summary_texts.append(await self._summarize_span(span, llm, chunk_tokens))
+        if len(summary_texts) > self.MAX_SUMMARIES:
+            n_merged = len(summary_texts) - self.MAX_SUMMARIES + 1
+            merged_slice = slice(-n_merged, None) if self._stable_prefix else slice(n_merged)
+            merged = await self._reduce(summary_texts[merged_slice], llm, chunk_tokens)
+            summary_texts[merged_slice] = [merged]
+
+        compacted_messages: list[Message] = [
+            Message(role="assistant", content=[system(COMPACTION_HEADER), TextPart(text=text)])
+            for text in summary_texts
+        ]
+        compacted_messages.extend(to_preserve)
+        return compacted_messages
+
+    async def _summarize_span(self, span: Sequence[Message], llm: LLM, chunk_tokens: int) -> str:
+        chunks: list[list[str]] = [[]]
+        n_chunk_tokens = 0
+        for section in self._format_sections(span, chunk_tokens):
+            n_tokens = self._estimator.count_text(section)
+            if chunks[-1] and n_chunk_tokens + n_tokens > chunk_tokens:
+                chunks.append([])
+                n_chunk_tokens = 0
+            chunks[-1].append(section)
+            n_chunk_tokens += n_tokens
+
+        if len(chunks) > 1:
+            logger.info("Compacting a large span in {n} chunks", n=len(chunks))
+        summaries = await asyncio.gather(
+            *(self._summarize_text("\n\n".join(chunk), llm) for chunk in chunks)
+        )
+        if len(summaries) == 1:
+            return summaries[0]
+        return await self._reduce(summaries, llm, chunk_tokens)
+
+    def _format_sections(self, messages: Sequence[Message], max_tokens: int) -> Iterator[str]:
+        """
+        Format each message into a section of the summarization input. A message larger than
+        `max_tokens` is split into several sections, each of which fits into a chunk.
+        """
+        for i, message in enumerate(messages):
+            heading = f"## Message {i + 1}"
+            section = _format_message(message)
+            if self._estimator.count_text(f"{heading}\n{section}") <= max_tokens:
+                yield f"{heading}\n{section}"
+                continue
+            # leave room for the heading of each part
+            n_heading_tokens = self._estimator.count_text(f"{heading} (part 100 of 100)\n")
+            parts = _split_text(section, max(1, max_tokens - n_heading_tokens), self._estimator)
+            logger.debug("Splitting message {i} of the span into {n} parts", i=i + 1, n=len(parts))
+            for j, part in enumerate(parts):
+                yield f"{heading} (part {j + 1} of {len(parts)})\n{part}"
+
+    async def _reduce(self, texts: Sequence[str], llm: LLM, chunk_tokens: int) -> str:
+        """Merge summaries into one, in batches that fit into one request."""
+        texts = list(texts)
+        for _ in range(self.MAX_REDUCE_ROUNDS):
+            batches: list[list[str]] = [[]]
+            n_batch_tokens = 0
+            for text in texts:
+                n_tokens = self._estimator.count_text(text)
+                if batches[-1] and n_batch_tokens + n_tokens > chunk_tokens:
+                    batches.append([])
+                    n_batch_tokens = 0
+                batches[-1].append(text)
+                n_batch_tokens += n_tokens
+            texts = await asyncio.gather(
+                *(self._summarize_text(_format_summaries(batch), llm) for batch in batches)
+            )
+            if len(texts) == 1:
+                return texts[0]
+        return "\n\n".join(texts)
+
+    async def _summarize_text(self, text: str, llm: LLM) -> str:
+        return message_extract_text(await _generate_summary(text, llm, self._usage_ledger))
+
+
+FILE_READING_TOOLS = frozenset({"ReadFile"})
+"""Tools whose output is the content of the file at the `path` argument."""
+FILE_WRITING_TOOLS = frozenset({"WriteFile", "StrReplaceFile", "PatchFile"})
+"""Tools that modify the file at the `path` argument."""
+REPEATABLE_TOOLS = frozenset({"ReadFile", "Glob", "Grep", "FetchURL", "SearchWeb"})
+"""Tools without side effects, whose output is superseded by a later call with the same args."""
+MIN_PRUNED_OUTPUT_SIZE = 512
+"""Tool outputs smaller than this (in characters) are not worth pruning."""
+
+
+def is_pruned_output(message: Message) -> bool:
+    """Whether the message is a tool result whose output has been pruned."""
+    return message.role == "tool" and _starts_with_system(message, PRUNED_OUTPUT_HEADER)
+
+
+def prune_stale_tool_outputs(messages: Sequence[Message]) -> list[Message]:
+    """
+    Replace the outputs of stale tool calls with a short placeholder, without calling the LLM.
+
+    A tool output is stale when a later call of the same tool with the same arguments
+    supersedes it (for tools without side effects, see `REPEATABLE_TOOLS`), or when it is the
+    content of a file that is modified by a later successful call of a file writing tool.
+    Modifications by other means (e.g. shell commands) are not tracked.
+
+    Args:
+        messages (Sequence[Message]): The messages to prune.
+
+    Returns:
+        list[Message]: The pruned messages. Messages that are not pruned are kept as they are.
+    """
+    calls: dict[str, tuple[str, str, str | None]] = {}
+    """Tool call ID -> (tool name, canonical arguments, file path)"""
+    for message in messages:
+        for tool_call in message.tool_calls or []:
+            arguments = _canonicalize_arguments(tool_call.function.arguments)
+            calls[tool_call.id] = (
+                tool_call.function.name,
+                arguments,
+                _extract_path(arguments),
+            )
+
+    pruned = list(messages)
+    later_calls: set[tuple[str, str]] = set()
+    later_written_paths: set[str] = set()
+    failed_call_ids: set[str] = set()
+    # walk backwards, so that what is seen is what happens later
+    for index in range(len(pruned) - 1, -1, -1):
+        message = pruned[index]
+        if message.role == "assistant":
+            # tool calls of the same step are not ordered, so they only affect earlier steps
+            for tool_call in message.tool_calls or []:
+                if tool_call.id not in calls or tool_call.id in failed_call_ids:
+                    continue
+                name, arguments, path = calls[tool_call.id]
+                if name in REPEATABLE_TOOLS:
+                    later_calls.add((name, arguments))
+                if name in FILE_WRITING_TOOLS and path is not None:
+                    later_written_paths.add(path)
+            continue
+        if message.role != "tool" or message.tool_call_id not in calls:
+            continue
+        if _is_error_output(message):
+            failed_call_ids.add(message.tool_call_id)
+            continue
+        if is_pruned_output(message) or _output_size(message) < MIN_PRUNED_OUTPUT_SIZE:
+            continue
+
+        name, arguments, path = calls[message.tool_call_id]
+        reason: str | None = None
+        if name in REPEATABLE_TOOLS and (name, arguments) in later_calls:
+            reason = "the same call was made again later"
+        elif name in FILE_READING_TOOLS and path is not None and path in later_written_paths:
+            reason = f"the file `{path}` was modified afterwards"
+        if reason is not None:
+            pruned[index] = Message(
+                role="tool",
+                content=[
+                    system(f"{PRUNED_OUTPUT_HEADER} {name} output is stale, because {reason}.")
+                ],
+                tool_call_id=message.tool_call_id,
+            )
+
+    n_pruned = sum(1 for old, new in zip(messages, pruned, strict=True) if old is not new)
+    if n_pruned:
+        logger.debug("Pruned {n} stale tool outputs", n=n_pruned)
+    return pruned
+
+
+def _canonicalize_arguments(arguments: str | None) -> str:
+    if not arguments:
+        return "{}"
+    try:
+        return json.dumps(json.loads(arguments), sort_keys=True, ensure_ascii=False)
+    except json.JSONDecodeError:
+        return arguments
+
+
+def _extract_path(arguments: str) -> str | None:
+    try:
+        parsed = json.loads(arguments)
+    except json.JSONDecodeError:
+        return None
+    if not isinstance(parsed, dict):
+        return None
+    path = parsed.get("path")  # pyright: ignore[reportUnknownMemberType, reportUnknownVariableType]
+    return os.path.normpath(path) if isinstance(path, str) and path else None
+
+
+def _is_error_output(message: Message) -> bool:
+    """Whether the tool result is an error, see `tool_result_to_message`."""
+    return _starts_with_system(message, "ERROR:")
+
+
+def _starts_with_system(message: Message, prefix: str) -> bool:
+    if isinstance(message.content, str):
+        return message.content.startswith(f"<system>{prefix}")
+    return (
+        bool(message.content)
+        and isinstance(first := message.content[0], TextPart)
+        and first.text.startswith(f"<system>{prefix}")
+    )
+
+
+def _output_size(message: Message) -> int:
+    if isinstance(message.content, str):
+        return len(message.content)
+    size = 0
+    for part in message.content:
+        if isinstance(part, TextPart):
+            size += len(part.text)
+        elif isinstance(part, BlobRefPart):
+            size += part.size
+    return size
+
+
+def _find_preserve_start(history: Sequence[Message], n_preserved_messages: int) -> int | None:
+    """
+    Find the start of the last `n_preserved_messages` user or assistant messages and what
+    follows them, or `None` if there are not that many.
+    """
+    n_preserved = 0
+    for index in range(len(history) - 1, -1, -1):
+        if history[index].role in {"user", "assistant"} and not is_compaction_summary(
+            history[index]
+        ):
+            n_preserved += 1
+            if n_preserved == n_preserved_messages:
+                return index
+    return None
+
+
+def _format_message(message: Message) -> str:
+    section = f"Role: {message.role}\nContent: {message_stringify(message)}"
+    for tool_call in message.tool_calls or []:
+        section += f"\nTool call: {tool_call.function.name}({tool_call.function.arguments})"
+    return section
+
+
+def _split_text(text: str, max_tokens: int, estimator: TokenEstimator) -> list[str]:
+    """Split a text into parts of at most `max_tokens` tokens each, at line breaks if possible."""
+    parts: list[str] = []
+    current: list[str] = []
+    n_current_tokens = 0
+    for line in text.splitlines(keepends=True):
+        for segment in _split_line(line, max_tokens, estimator):
+            n_tokens = estimator.count_text(segment)
+            if current and n_current_tokens + n_tokens > max_tokens:
+                parts.append("".join(current))
+                current.clear()
+                n_current_tokens = 0
+            current.append(segment)
+            n_current_tokens += n_tokens
+    if current:
+        parts.append("".join(current))
+    return parts
+
+
+def _split_line(line: str, max_tokens: int, estimator: TokenEstimator) -> Iterator[str]:
+    """Split a line into halves until each of them fits into `max_tokens` tokens."""
+    if len(line) <= 1 or estimator.count_text(line) <= max_tokens:
+        yield line
+        return
+    middle = len(line) // 2
+    yield from _split_line(line[:middle], max_tokens, estimator)
+    yield from _split_line(line[middle:], max_tokens, estimator)
+
+
+def _format_summaries(summaries: Sequence[str]) -> str:
+    return "\n\n".join(
+        f"## Earlier Compaction Output {i + 1}\n{summary}" for i, summary in enumerate(summaries)
+    )
+
+
+def _extract_summary_text(message: Message) -> str:
+    assert not isinstance(message.content, str)
+    return "\n".join(part.text for part in message.content[1:] if isinstance(part, TextPart))
+
+
+async def _generate_summary(context: str, llm: LLM, usage_ledger: UsageLedger | None) -> Message:
+    """Ask the LLM to compact the given context text, and return its output message."""
+    compact_prompt = Template(prompts.COMPACT).substitute(CONTEXT=context)
+
+    # TODO: set max completion tokens
+    logger.debug("Compacting context...")
+    start = time.monotonic()
+    result = await generate(
+        chat_provider=llm.chat_provider,
+        system_prompt="You are a helpful assistant that compacts conversation context.",
+        tools=[],
+        history=[Message(role="user", content=compact_prompt)],
+    )
+    if result.usage:
+        logger.debug(
+            "Compaction used {input} input tokens and {output} output tokens",
+            input=result.usage.input,
+            output=result.usage.output,
+        )
+        if usage_ledger is not None:
+            tool_call = get_current_tool_call_or_none()
+            await usage_ledger.record(
+                "compaction",
+                llm.model_name,
+                result.usage,
+                time.monotonic() - start,
+                tool_call_id=tool_call.id if tool_call is not None else None,
+            )
+    return result.message
+
+
 if TYPE_CHECKING:
 
-    def type_check(simple: SimpleCompaction):
+    def type_check(simple: SimpleCompaction, incremental: IncrementalCompaction):
         _: Compaction = simple
+        _: Compaction = incremental
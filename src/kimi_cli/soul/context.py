@@ -1,27 +1,208 @@
 from __future__ import annotations
 
+import asyncio
 import json
-from collections.abc import Sequence
+import os
+from collections.abc import Mapping, Sequence
+from dataclasses import dataclass, replace
+from io import BufferedWriter
 from pathlib import Path
+from typing import Any
 
-import aiofiles
 import aiofiles.os
-from kosong.message import Message
+from kosong.message import ContentPart, Message, TextPart
 
+from kimi_cli.config import HistoryDurability, HistoryFormat
+from kimi_cli.soul.blob import BlobStore
+from kimi_cli.soul.history import (
+    FRAMED_MAGIC,
+    convert_history_file,
+    detect_format,
+    encode_frame,
+    iter_records,
+    iter_records_reversed,
+)
 from kimi_cli.soul.message import system
+from kimi_cli.soul.tokens import (
+    HeuristicTokenEstimator,
+    TokenBreakdown,
+    TokenEstimator,
+    break_down_tokens,
+    estimate_message_tokens,
+)
 from kimi_cli.utils.logging import logger
 from kimi_cli.utils.path import next_available_rotation
 
+_COPY_CHUNK_SIZE = 1 << 20
+
+LAZY_RESTORE_TAIL_RUNS = 5
+"""The number of most recent user runs that are loaded eagerly by a lazy restore."""
+
+
+def is_checkpoint_message(message: Message) -> bool:
+    """Whether the message is a checkpoint marker injected by `Context.checkpoint`."""
+    if message.role != "user" or isinstance(message.content, str):
+        return False
+    return len(message.content) == 1 and _is_checkpoint_part(message.content[0])
+
+
+def _is_checkpoint_part(part: ContentPart) -> bool:
+    return isinstance(part, TextPart) and part.text.startswith("<system>CHECKPOINT ")
+
+
+@dataclass(frozen=True, slots=True)
+class _CheckpointMark:
+    """Where a checkpoint sits in the history, so that reverting needs no re-parsing."""
+
+    offset: int
+    """The byte offset of the checkpoint record in the file backend."""
+    n_messages: int
+    """The number of messages in the history before the checkpoint."""
+    token_count: int | None
+    """
+    The token count before the checkpoint, or `None` if it is in the part left unloaded
+    by a lazy restore.
+    """
+    pending_tokens: int
+    """
+    The estimated tokens of the messages between the last token count and the checkpoint.
+    Only counts the loaded part if `token_count` is `None`.
+    """
+
+
+class _HistoryWriter:
+    """
+    A long-lived append writer of the history file.
+    Records are buffered in memory and written in one go according to the durability policy.
+
+    An existing file keeps its format, and a new file is created in the given format.
+    In the framed format, the records of each write-out go into one frame.
+    """
+
+    def __init__(self, path: Path, durability: HistoryDurability, format: HistoryFormat):
+        self._path = path
+        self._durability: HistoryDurability = durability
+        self._format: HistoryFormat = format
+        self._file: BufferedWriter | None = None
+        self._buffer: list[bytes] = []
+        self._frame: list[bytes] = []
+        """Records of the framed format not sealed into a frame yet."""
+        self._end: int = 0
+        """The offset of the end of the file, including buffered records and sealed frames."""
+
+    async def tell(self) -> int:
+        """
+        Return the offset at which the next record will be written.
+        In the framed format, this starts a new frame to make the next record addressable.
+        """
+        await self._ensure_open()
+        self._seal_frame()
+        return self._end
+
+    async def write(self, records: Sequence[bytes], *, checkpoint: bool = False):
+        await self._ensure_open()
+        if self._format == "framed":
+            self._frame.extend(records)
+        else:
+            self._buffer.extend(records)
+            self._end += sum(len(record) for record in records)
+        match self._durability:
+            case "record":
+                await self.flush()
+            case "checkpoint":
+                await self.flush(fsync=checkpoint)
+            case "step":
+                pass
+
+    async def flush(self, *, fsync: bool = False):
+        """Write all buffered records to the file, in a single thread hop."""
+        self._seal_frame()
+        if self._file is None or (not self._buffer and not fsync):
+            return
+        data = b"".join(self._buffer)
+        self._buffer.clear()
+        await asyncio.to_thread(_write_file, self._file, data, fsync)
+
+    async def close(self):
+        """Flush and close the file. It will be reopened on the next write."""
+        if self._file is None:
+            return
+        await self.flush()
+        await asyncio.to_thread(self._file.close)
+        self._file = None
+
+    async def _ensure_open(self):
+        if self._file is not None:
+            return
+        self._format = await asyncio.to_thread(detect_format, self._path) or self._format
+        self._file = await asyncio.to_thread(open, self._path, "ab")
+        self._end = self._file.tell()
+        if self._end == 0 and self._format == "framed":
+            self._buffer.append(FRAMED_MAGIC)
+            self._end = len(FRAMED_MAGIC)
+
+    def _seal_frame(self):
+        if not self._frame:
+            return
+        frame = encode_frame(self._frame)
+        self._frame.clear()
+        self._buffer.append(frame)
+        self._end += len(frame)
+
 
 class Context:
-    def __init__(self, file_backend: Path):
+    def __init__(
+        self,
+        file_backend: Path,
+        *,
+        durability: HistoryDurability = "step",
+        format: HistoryFormat = "jsonl",
+        blob_store: BlobStore | None = None,
+        token_estimator: TokenEstimator | None = None,
+    ):
         self._file_backend = file_backend
+        self._writer = _HistoryWriter(file_backend, durability, format)
+        self._blob_store = blob_store
+        """Where large tool outputs are moved to. `None` to keep them in the history."""
+        self._token_estimator = token_estimator or HeuristicTokenEstimator()
         self._history: list[Message] = []
+        self._message_tokens: list[int] = []
+        """The tokens of each message in `_history`, measured if possible or estimated."""
+        self._token_breakdown: TokenBreakdown | None = None
+        """The cached breakdown of `_message_tokens`, reset whenever they change."""
         self._token_count: int = 0
+        self._pending_tokens: int = 0
+        """The estimated tokens of the messages appended after the last token count."""
+        self._pending_start: int | None = 0
+        """
+        The index of the first message appended after the last token count,
+        or `None` if unknown (after a revert).
+        """
         self._next_checkpoint_id: int = 0
         """The ID of the next checkpoint, starting from 0, incremented after each checkpoint."""
+        self._checkpoint_marks: dict[int, _CheckpointMark] = {}
+        """The index of checkpoints, keyed by checkpoint ID."""
+        self._unloaded_prefix: int = 0
+        """
+        The number of leading bytes of the file backend not loaded yet by a lazy restore.
+        Message counts in `_checkpoint_marks` are relative to the loaded part.
+        """
+
+    async def restore(self, *, lazy: bool = False) -> bool:
+        """
+        Restore the context from the file backend.
+
+        Args:
+            lazy (bool): Only load the tail of the history which contains the last
+                `LAZY_RESTORE_TAIL_RUNS` user runs, the latest token count and checkpoint.
+                Older messages are loaded when the full history is first needed.
 
-    async def restore(self) -> bool:
+        Returns:
+            bool: Whether anything is restored.
+
+        Raises:
+            RuntimeError: When the context is already modified.
+        """
         logger.debug("Restoring context from file: {file_backend}", file_backend=self._file_backend)
         if self._history:
             logger.error("The context storage is already modified")
@@ -33,41 +214,110 @@ class Context:
             logger.debug("Empty context file, skipping restoration")
             return False
 
-        async with aiofiles.open(self._file_backend, encoding="utf-8") as f:
-            async for line in f:
-                if not line.strip():
-                    continue
-                line_json = json.loads(line)
-                if line_json["role"] == "_usage":
-                    self._token_count = line_json["token_count"]
-                    continue
-                if line_json["role"] == "_checkpoint":
-                    self._next_checkpoint_id = line_json["id"] + 1
-                    continue
-                message = Message.model_validate(line_json)
-                self._history.append(message)
+        if not lazy:
+            await asyncio.to_thread(self._load_span, 0, None)
+            return True
 
+        tail_start, tail_records = await asyncio.to_thread(
+            _scan_tail, self._file_backend, LAZY_RESTORE_TAIL_RUNS
+        )
+        usage_seen = False
+        for offset, record in tail_records:
+            self._load_record(offset, record)
+            match record["role"]:
+                case "_usage":
+                    usage_seen = True
+                case "_checkpoint" if tail_start and not usage_seen:
+                    # the token count before this checkpoint is in the unloaded part
+                    mark = self._checkpoint_marks[record["id"]]
+                    self._checkpoint_marks[record["id"]] = replace(mark, token_count=None)
+                case _:
+                    pass
+        self._unloaded_prefix = tail_start
+        logger.debug(
+            "Lazily restored {n} messages, leaving {n_bytes} bytes unloaded",
+            n=len(self._history),
+            n_bytes=tail_start,
+        )
         return True
 
+    async def materialize(self):
+        """Load the messages left behind by a lazy restore, if any."""
+        if self._unloaded_prefix:
+            prefix = await asyncio.to_thread(self._load_prefix)
+            # the history may have been materialized meanwhile, on a synchronous access
+            if self._unloaded_prefix:
+                self._prepend(prefix)
+
     @property
     def history(self) -> Sequence[Message]:
+        if self._unloaded_prefix:
+            logger.debug("Materializing lazily restored history on access")
+            self._materialize()
         return self._history
 
+    @property
+    def message_tokens(self) -> Sequence[int]:
+        """The tokens of each message in the history, measured if possible or estimated."""
+        if self._unloaded_prefix:
+            logger.debug("Materializing lazily restored history on access")
+            self._materialize()
+        return self._message_tokens
+
+    def token_breakdown(self) -> TokenBreakdown:
+        """Break down the tokens of the loaded history by role and by tool."""
+        if self._token_breakdown is None:
+            self._token_breakdown = break_down_tokens(self._history, self._message_tokens)
+        return self._token_breakdown
+
+    @property
+    def token_estimator(self) -> TokenEstimator:
+        """The estimator of the tokens of messages not counted by the LLM provider."""
+        return self._token_estimator
+
+    @property
+    def loaded_history(self) -> Sequence[Message]:
+        """
+        The history that is loaded so far, without loading anything.
+        After a lazy restore, this contains at least the last `LAZY_RESTORE_TAIL_RUNS` user runs.
+        """
+        return self._history
+
+    async def resolved_history(self) -> list[Message]:
+        """
+        The full history with blob references replaced by the referenced texts,
+        for building requests to the LLM.
+        """
+        await self.materialize()
+        if self._blob_store is None:
+            return list(self._history)
+        return await asyncio.to_thread(self._blob_store.resolve, self._history)
+
     @property
     def token_count(self) -> int:
+        """The token count reported by the LLM provider for the last request."""
         return self._token_count
 
+    @property
+    def projected_token_count(self) -> int:
+        """
+        The token count of the next request, i.e. the last reported token count plus
+        the local estimate of the messages appended since then.
+        """
+        return self._token_count + self._pending_tokens
+
     @property
     def n_checkpoints(self) -> int:
         return self._next_checkpoint_id
 
     async def checkpoint(self, add_user_message: bool):
         checkpoint_id = self._next_checkpoint_id
-        self._next_checkpoint_id += 1
         logger.debug("Checkpointing, ID: {id}", id=checkpoint_id)
 
-        async with aiofiles.open(self._file_backend, "a", encoding="utf-8") as f:
-            await f.write(json.dumps({"role": "_checkpoint", "id": checkpoint_id}) + "\n")
+        self._mark_checkpoint(checkpoint_id, await self._writer.tell())
+        await self._writer.write(
+            [_encode_record({"role": "_checkpoint", "id": checkpoint_id})], checkpoint=True
+        )
         if add_user_message:
             await self.append_message(
                 Message(role="user", content=[system(f"CHECKPOINT {checkpoint_id}")])
@@ -92,6 +342,10 @@ class Context:
             logger.error("Checkpoint {checkpoint_id} does not exist", checkpoint_id=checkpoint_id)
             raise ValueError(f"Checkpoint {checkpoint_id} does not exist")
 
+        await self.materialize()
+        mark = self._checkpoint_marks[checkpoint_id]
+        await self._writer.close()
+
         # rotate the history file
         rotated_file_path = await next_available_rotation(self._file_backend)
         if rotated_file_path is None:
@@ -102,43 +356,313 @@ class Context:
             "Rotated history file: {rotated_file_path}", rotated_file_path=rotated_file_path
         )
 
-        # restore the context until the specified checkpoint
-        self._history.clear()
-        self._token_count = 0
-        self._next_checkpoint_id = 0
-        async with (
-            aiofiles.open(rotated_file_path, encoding="utf-8") as old_file,
-            aiofiles.open(self._file_backend, "w", encoding="utf-8") as new_file,
-        ):
-            async for line in old_file:
-                if not line.strip():
-                    continue
-
-                line_json = json.loads(line)
-                if line_json["role"] == "_checkpoint" and line_json["id"] == checkpoint_id:
-                    break
-
-                await new_file.write(line)
-                if line_json["role"] == "_usage":
-                    self._token_count = line_json["token_count"]
-                elif line_json["role"] == "_checkpoint":
-                    self._next_checkpoint_id = line_json["id"] + 1
-                else:
-                    message = Message.model_validate(line_json)
-                    self._history.append(message)
+        # keep everything before the checkpoint record, byte by byte
+        await asyncio.to_thread(
+            _copy_file_prefix, rotated_file_path, self._file_backend, mark.offset
+        )
+
+        # restore the in-memory state from the checkpoint index
+        del self._history[mark.n_messages :]
+        del self._message_tokens[mark.n_messages :]
+        self._token_breakdown = None
+        self._checkpoint_marks = {
+            id: mark for id, mark in self._checkpoint_marks.items() if id < checkpoint_id
+        }
+        assert mark.token_count is not None, "marks are complete after materialization"
+        self._token_count = mark.token_count
+        self._pending_tokens = mark.pending_tokens
+        self._pending_start = None
+        self._next_checkpoint_id = checkpoint_id
 
     async def append_message(self, message: Message | Sequence[Message]):
         logger.debug("Appending message(s) to context: {message}", message=message)
-        messages = message if isinstance(message, Sequence) else [message]
+        messages: Sequence[Message] = message if isinstance(message, Sequence) else [message]
+        messages, message_tokens = await asyncio.to_thread(self._prepare_messages, messages)
         self._history.extend(messages)
+        self._message_tokens.extend(message_tokens)
+        self._token_breakdown = None
+        self._pending_tokens += sum(message_tokens)
+
+        await self._writer.write(
+            [
+                (message.model_dump_json(exclude_none=True) + "\n").encode("utf-8")
+                for message in messages
+            ]
+        )
+
+    async def replace_messages(self, replacements: Mapping[int, Message]):
+        """
+        Replace messages of the history in place, keeping the checkpoints. The token counts
+        recorded after a replaced message are reduced by the tokens it no longer takes.
+        File backend will be rewritten, and the old one rotated.
 
-        async with aiofiles.open(self._file_backend, "a", encoding="utf-8") as f:
-            for message in messages:
-                await f.write(message.model_dump_json(exclude_none=True) + "\n")
+        Args:
+            replacements (Mapping[int, Message]): The new messages, keyed by their index in
+                the history.
+
+        Raises:
+            RuntimeError: When no available rotation path is found.
+        """
+        logger.debug("Replacing {n} messages in context", n=len(replacements))
+        await self.materialize()
+        messages, message_tokens = await asyncio.to_thread(
+            self._prepare_messages, list(replacements.values())
+        )
+        records = {
+            index: _ReplacedRecord(
+                line=(message.model_dump_json(exclude_none=True) + "\n").encode("utf-8"),
+                n_tokens=n_tokens,
+                n_saved_tokens=self._message_tokens[index] - n_tokens,
+            )
+            for index, message, n_tokens in zip(replacements, messages, message_tokens, strict=True)
+        }
+        await self._writer.close()
+
+        rotated_file_path = await next_available_rotation(self._file_backend)
+        if rotated_file_path is None:
+            logger.error("No available rotation path found")
+            raise RuntimeError("No available rotation path found")
+        await aiofiles.os.replace(self._file_backend, rotated_file_path)
+        logger.debug(
+            "Rotated history file: {rotated_file_path}", rotated_file_path=rotated_file_path
+        )
+
+        await asyncio.to_thread(_rewrite_messages, rotated_file_path, self._file_backend, records)
+
+        # reload from the rewritten file, which also moves the checkpoint marks
+        reloaded = Context(self._file_backend, token_estimator=self._token_estimator)
+        await asyncio.to_thread(reloaded._load_span, 0, None)
+        self._history = reloaded._history
+        self._message_tokens = reloaded._message_tokens
+        self._token_breakdown = None
+        self._token_count = reloaded._token_count
+        self._pending_tokens = reloaded._pending_tokens
+        self._pending_start = reloaded._pending_start
+        self._next_checkpoint_id = reloaded._next_checkpoint_id
+        self._checkpoint_marks = reloaded._checkpoint_marks
 
     async def update_token_count(self, token_count: int):
+        """
+        Update the token count reported by the LLM provider. The growth since the last token
+        count is attributed to the messages appended in between, in proportion to their
+        estimates, and recorded as their measured tokens.
+        """
         logger.debug("Updating token count in context: {token_count}", token_count=token_count)
+        records: list[bytes] = []
+        pending_start = self._pending_start
+        if (
+            pending_start is not None
+            and pending_start < len(self._history)
+            and 0 < self._token_count < token_count
+        ):
+            measured = _distribute(
+                token_count - self._token_count, self._message_tokens[pending_start:]
+            )
+            self._message_tokens[pending_start:] = measured
+            self._token_breakdown = None
+            records.append(_encode_record({"role": "_tokens", "counts": measured}))
         self._token_count = token_count
+        self._pending_tokens = 0
+        self._pending_start = len(self._history)
+
+        records.append(_encode_record({"role": "_usage", "token_count": token_count}))
+        await self._writer.write(records)
+
+    async def flush(self):
+        """Write all buffered records to the file backend."""
+        await self._writer.flush()
+
+    async def close(self):
+        """Flush buffered records and release the file backend."""
+        await self._writer.close()
+
+    def _mark_checkpoint(self, checkpoint_id: int, offset: int):
+        self._checkpoint_marks[checkpoint_id] = _CheckpointMark(
+            offset=offset,
+            n_messages=len(self._history),
+            token_count=self._token_count,
+            pending_tokens=self._pending_tokens,
+        )
+        self._next_checkpoint_id = checkpoint_id + 1
+
+    def _load_record(self, offset: int | None, record: dict[str, Any]):
+        match record["role"]:
+            case "_usage":
+                self._token_count = record["token_count"]
+                self._pending_tokens = 0
+                self._pending_start = len(self._history)
+            case "_tokens":
+                # measured tokens of the last messages, which may be partly unloaded
+                counts: list[int] = record["counts"]
+                counts = counts[max(0, len(counts) - len(self._message_tokens)) :]
+                if counts:
+                    self._message_tokens[-len(counts) :] = counts
+            case "_checkpoint":
+                if offset is None:
+                    raise ValueError(f"Checkpoint {record['id']} is not at a frame boundary")
+                self._mark_checkpoint(record["id"], offset)
+            case _:
+                message = Message.model_validate(record)
+                n_tokens = estimate_message_tokens(message, self._token_estimator)
+                self._history.append(message)
+                self._message_tokens.append(n_tokens)
+                self._pending_tokens += n_tokens
+
+    def _load_span(self, start: int, end: int | None):
+        for offset, line in iter_records(self._file_backend, start, end):
+            self._load_record(offset, json.loads(line))
+
+    def _prepare_messages(self, messages: Sequence[Message]) -> tuple[list[Message], list[int]]:
+        """Estimate the tokens of new messages and move their large outputs to the blob store."""
+        message_tokens = [estimate_message_tokens(m, self._token_estimator) for m in messages]
+        if self._blob_store is not None:
+            messages = [self._blob_store.externalize(m) for m in messages]
+        return list(messages), message_tokens
+
+    def _materialize(self):
+        self._prepend(self._load_prefix())
+
+    def _load_prefix(self) -> Context:
+        """
+        Load the part of the file backend left unloaded by a lazy restore into a new context,
+        without touching this one, so that it can run in a worker thread.
+        """
+        prefix = Context(self._file_backend, token_estimator=self._token_estimator)
+        prefix._load_span(0, self._unloaded_prefix)
+        return prefix
+
+    def _prepend(self, prefix: Context):
+        """Prepend the loaded prefix to the history, in one go on the event loop."""
+        n_prefix_messages = len(prefix._history)
+        for id, mark in self._checkpoint_marks.items():
+            if mark.token_count is None:
+                mark = replace(
+                    mark,
+                    token_count=prefix._token_count,
+                    pending_tokens=prefix._pending_tokens + mark.pending_tokens,
+                )
+            prefix._checkpoint_marks[id] = replace(
+                mark, n_messages=mark.n_messages + n_prefix_messages
+            )
+        self._history[:0] = prefix._history
+        self._message_tokens[:0] = prefix._message_tokens
+        self._token_breakdown = None
+        if self._pending_start is not None:
+            self._pending_start += n_prefix_messages
+        self._checkpoint_marks = prefix._checkpoint_marks
+        self._unloaded_prefix = 0
+        logger.debug("Materialized {n} messages", n=n_prefix_messages)
+
+
+@dataclass(frozen=True, slots=True)
+class _ReplacedRecord:
+    """A message record to put in place of another by `Context.replace_messages`."""
+
+    line: bytes
+    """The encoded record of the new message."""
+    n_tokens: int
+    """The estimated tokens of the new message."""
+    n_saved_tokens: int
+    """The tokens of the old message that the new one no longer takes."""
+
+
+def _rewrite_messages(src: Path, dst: Path, records: Mapping[int, _ReplacedRecord]):
+    """
+    Copy a history file with some of its message records replaced, keeping it in its format.
+    Measured tokens of the replaced messages are replaced by their estimates, and the token
+    counts after them are reduced by the tokens they save.
+    """
+    format = detect_format(src)
+    n_messages = 0
+    n_saved_tokens = 0
+    with open(dst, "wb") as out:
+        for _, line in iter_records(src):
+            record: dict[str, Any] = json.loads(line)
+            match record["role"]:
+                case "_usage":
+                    token_count = max(0, record["token_count"] - n_saved_tokens)
+                    line = _encode_record({**record, "token_count": token_count})
+                case "_tokens":
+                    counts: list[int] = record["counts"]
+                    start = n_messages - len(counts)
+                    counts = [
+                        records[index].n_tokens if index in records else count
+                        for index, count in enumerate(counts, start)
+                    ]
+                    line = _encode_record({**record, "counts": counts})
+                case "_checkpoint":
+                    pass
+                case _:
+                    if (replaced := records.get(n_messages)) is not None:
+                        line = replaced.line
+                        n_saved_tokens += replaced.n_saved_tokens
+                    n_messages += 1
+            out.write(line if line.endswith(b"\n") else line + b"\n")
+    if format == "framed":
+        convert_history_file(dst, "framed")
+
+
+def _encode_record(record: dict[str, object]) -> bytes:
+    return (json.dumps(record) + "\n").encode("utf-8")
+
+
+def _distribute(total: int, weights: Sequence[int]) -> list[int]:
+    """Split `total` into integers in proportion to `weights`, summing up to `total`."""
+    weight_sum = sum(weights) or 1
+    shares = [total * weight // weight_sum for weight in weights]
+    shares[-1] += total - sum(shares)
+    return shares
+
+
+def _scan_tail(path: Path, n_runs: int) -> tuple[int, list[tuple[int | None, dict[str, Any]]]]:
+    """
+    Scan a history file backwards until the tail contains `n_runs` user runs, at least
+    one checkpoint and one token count record, and starts at an addressable record, so that
+    loading the tail alone yields the latest token count, checkpoint ID and checkpoint marks.
+
+    Returns:
+        The offset of the tail and the records in it, in file order.
+    """
+    records: list[tuple[int | None, dict[str, Any]]] = []
+    runs_seen = 0
+    checkpoint_seen = False
+    usage_seen = False
+
+    for offset, line in iter_records_reversed(path):
+        record: dict[str, Any] = json.loads(line)
+        records.append((offset, record))
+        match record["role"]:
+            case "_checkpoint":
+                checkpoint_seen = True
+            case "_usage":
+                usage_seen = True
+            case "user":
+                if not is_checkpoint_message(Message.model_validate(record)):
+                    runs_seen += 1
+            case _:
+                pass
+        if offset is not None and runs_seen >= n_runs and checkpoint_seen and usage_seen:
+            records.reverse()
+            return offset, records
+    records.reverse()
+    return 0, records
+
+
+def _write_file(file: BufferedWriter, data: bytes, fsync: bool):
+    if data:
+        file.write(data)
+    file.flush()
+    if fsync:
+        os.fsync(file.fileno())
+
 
-        async with aiofiles.open(self._file_backend, "a", encoding="utf-8") as f:
-            await f.write(json.dumps({"role": "_usage", "token_count": token_count}) + "\n")
+def _copy_file_prefix(src: Path, dst: Path, length: int):
+    """Copy the first `length` bytes of `src` to `dst`, overwriting `dst`."""
+    with open(src, "rb") as src_file, open(dst, "wb") as dst_file:
+        remaining = length
+        while remaining > 0:
+            chunk = src_file.read(min(remaining, _COPY_CHUNK_SIZE))
+            if not chunk:
+                break
+            dst_file.write(chunk)
+            remaining -= len(chunk)
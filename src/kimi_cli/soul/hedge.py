@@ -0,0 +1,66 @@
+from __future__ import annotations
+
+import asyncio
+from collections.abc import Callable, Coroutine
+from typing import Any
+
+from kosong.chat_provider import StreamedMessagePart
+
+from kimi_cli.utils.logging import logger
+
+type OnMessagePart = Callable[[StreamedMessagePart], None]
+type StreamingRequest[T] = Callable[[OnMessagePart], Coroutine[Any, Any, T]]
+"""A request that streams message parts to the given callback, and returns its result."""
+
+
+async def hedge[T](
+    primary: StreamingRequest[T],
+    backup: StreamingRequest[T],
+    *,
+    delay: float,
+    on_message_part: OnMessagePart,
+) -> T:
+    """
+    Run the primary request, and if it streams no message part within `delay` seconds or
+    fails before that, run the backup request as well. The request that streams first wins:
+    only its message parts are forwarded, and the other request is cancelled.
+
+    Raises:
+        Exception: The error of the winning request, or of the primary request if neither
+            has streamed anything.
+    """
+    winner: int | None = None
+    tasks: list[asyncio.Task[T]] = []
+
+    def _gate(index: int) -> OnMessagePart:
+        def _on_message_part(part: StreamedMessagePart) -> None:
+            nonlocal winner
+            if winner is None:
+                winner = index
+                for i, task in enumerate(tasks):
+                    if i != index:
+                        task.cancel()
+            if winner == index:
+                on_message_part(part)
+
+        return _on_message_part
+
+    tasks.append(asyncio.create_task(primary(_gate(0))))
+    try:
+        await asyncio.wait(tasks, timeout=delay)
+        if winner is None and (not tasks[0].done() or tasks[0].exception() is not None):
+            logger.info("No response from the primary request in {delay}s, hedging", delay=delay)
+            tasks.append(asyncio.create_task(backup(_gate(1))))
+
+        while winner is None and (pending := [task for task in tasks if not task.done()]):
+            await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        if winner is not None:
+            if winner == 1:
+                logger.info("The hedged backup request won")
+            return await tasks[winner]
+        # neither has streamed anything, which means both have failed
+        return await tasks[0]
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
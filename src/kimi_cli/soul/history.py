@@ -0,0 +1,183 @@
+"""
+Storage formats of context history files.
+
+Two formats are supported, and the format of an existing file is detected from its content:
+
+- `jsonl`: one JSON record per line.
+- `framed`: a magic header followed by zlib-compressed frames, each holding one or more
+  JSONL records. Every frame is length-prefixed and length-suffixed, so that the file can
+  be read frame by frame in both directions and any frame can be read at its offset.
+
+Readers yield `(offset, line)` pairs. The offset is where reading can start to reach the
+record, or `None` if the record is in the middle of a frame. Writers must start a new frame
+at each checkpoint record so that every checkpoint is addressable.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import re
+import struct
+import zlib
+from collections.abc import Iterator, Sequence
+from pathlib import Path
+from typing import BinaryIO
+
+from kimi_cli.config import HistoryFormat
+
+FRAMED_MAGIC = b"KIMIHIST\x01\n"
+"""The header of framed history files. JSONL records never start with this."""
+
+_FRAME_LENGTH = struct.Struct("<I")
+_SCAN_CHUNK_SIZE = 1 << 16
+
+type HistoryRecord = tuple[int | None, bytes]
+"""A record line of a history file and the offset to read it from, if addressable."""
+
+
+def detect_format(path: Path) -> HistoryFormat | None:
+    """Detect the format of a history file, or `None` if the file is missing or empty."""
+    try:
+        with open(path, "rb") as f:
+            head = f.read(len(FRAMED_MAGIC))
+    except FileNotFoundError:
+        return None
+    if not head:
+        return None
+    return "framed" if head == FRAMED_MAGIC else "jsonl"
+
+
+def encode_frame(lines: Sequence[bytes]) -> bytes:
+    """Encode JSONL record lines into one frame."""
+    payload = zlib.compress(b"".join(lines))
+    length = _FRAME_LENGTH.pack(len(payload))
+    return length + payload + length
+
+
+def iter_records(path: Path, start: int = 0, end: int | None = None) -> Iterator[HistoryRecord]:
+    """
+    Iterate over the records within `[start, end)` of a history file, in file order.
+    `start` and `end` must be offsets of addressable records or the end of the file.
+    """
+    with open(path, "rb") as f:
+        if f.read(len(FRAMED_MAGIC)) == FRAMED_MAGIC:
+            yield from _iter_frames(f, max(start, len(FRAMED_MAGIC)), end)
+        else:
+            yield from _iter_lines(f, start, end)
+
+
+def iter_records_reversed(path: Path) -> Iterator[HistoryRecord]:
+    """Iterate over the records of a history file, from the last to the first."""
+    with open(path, "rb") as f:
+        if f.read(len(FRAMED_MAGIC)) == FRAMED_MAGIC:
+            yield from _iter_frames_reversed(f)
+        else:
+            yield from _iter_lines_reversed(f)
+
+
+def read_frame(f: BinaryIO, offset: int) -> list[bytes]:
+    """Read the record lines of the frame at `offset` of a framed history file."""
+    f.seek(offset)
+    (length,) = _FRAME_LENGTH.unpack(f.read(_FRAME_LENGTH.size))
+    payload = f.read(length)
+    return zlib.decompress(payload).splitlines(keepends=True)
+
+
+def convert_history_file(path: Path, format: HistoryFormat) -> bool:
+    """
+    Convert a history file to the given format in place. Frames of the output start at
+    checkpoint records, so that every checkpoint stays addressable.
+
+    Returns:
+        bool: Whether the file is converted, i.e. it exists and is in the other format.
+    """
+    current = detect_format(path)
+    if current is None or current == format:
+        return False
+
+    tmp_path = path.with_name(f".{path.name}.converting")
+    with open(tmp_path, "wb") as out:
+        if format == "framed":
+            out.write(FRAMED_MAGIC)
+        frame: list[bytes] = []
+        for _, line in iter_records(path):
+            line = line if line.endswith(b"\n") else line + b"\n"
+            if format == "jsonl":
+                out.write(line)
+                continue
+            if frame and json.loads(line)["role"] == "_checkpoint":
+                out.write(encode_frame(frame))
+                frame = []
+            frame.append(line)
+        if frame:
+            out.write(encode_frame(frame))
+    os.replace(tmp_path, path)
+    return True
+
+
+def convert_session_history(path: Path, format: HistoryFormat) -> int:
+    """
+    Convert a history file, its rotations (`<stem>_<n><suffix>`) and its subagent histories
+    (`<stem>_sub_<n><suffix>`) to the given format.
+
+    Returns:
+        int: The number of files converted.
+    """
+    pattern = re.compile(rf"^{re.escape(path.stem)}_(sub_)?\d+{re.escape(path.suffix)}$")
+    paths = [path] + [p for p in path.parent.iterdir() if pattern.match(p.name)]
+    return sum(convert_history_file(p, format) for p in paths)
+
+
+def _iter_lines(f: BinaryIO, start: int, end: int | None) -> Iterator[HistoryRecord]:
+    f.seek(start)
+    offset = start
+    for line in f:
+        if end is not None and offset >= end:
+            break
+        if line.strip():
+            yield offset, line
+        offset += len(line)
+
+
+def _iter_lines_reversed(f: BinaryIO) -> Iterator[HistoryRecord]:
+    pos = f.seek(0, os.SEEK_END)
+    partial = b""
+    while pos > 0:
+        read_size = min(_SCAN_CHUNK_SIZE, pos)
+        pos -= read_size
+        f.seek(pos)
+        data = f.read(read_size) + partial
+        lines = data.split(b"\n")
+        partial = lines[0]  # may continue in the previous chunk
+        offset = pos + len(data)
+        for line in reversed(lines[1:]):
+            offset -= len(line) + 1
+            if line.strip():
+                yield offset + 1, line + b"\n"
+    if partial.strip():
+        yield 0, partial + b"\n"
+
+
+def _iter_frames(f: BinaryIO, start: int, end: int | None) -> Iterator[HistoryRecord]:
+    offset = start
+    file_size = f.seek(0, os.SEEK_END)
+    while offset < file_size and (end is None or offset < end):
+        lines = read_frame(f, offset)
+        for i, line in enumerate(lines):
+            if line.strip():
+                yield (offset if i == 0 else None), line
+        offset = f.tell() + _FRAME_LENGTH.size
+
+
+def _iter_frames_reversed(f: BinaryIO) -> Iterator[HistoryRecord]:
+    end = f.seek(0, os.SEEK_END)
+    while end > len(FRAMED_MAGIC):
+        f.seek(end - _FRAME_LENGTH.size)
+        (length,) = _FRAME_LENGTH.unpack(f.read(_FRAME_LENGTH.size))
+        offset = end - length - 2 * _FRAME_LENGTH.size
+        lines = read_frame(f, offset)
+        for i in range(len(lines) - 1, -1, -1):
+            if lines[i].strip():
+                yield (offset if i == 0 else None), lines[i]
+        end = offset
@@ -1,8 +1,11 @@
 from __future__ import annotations
 
 import asyncio
+import time
 from collections.abc import Sequence
+from dataclasses import dataclass
 from functools import partial
+from itertools import pairwise
 from typing import TYPE_CHECKING
 
 import kosong
@@ -14,13 +17,14 @@ from kosong.chat_provider import (
     APIStatusError,
     APITimeoutError,
     ChatProviderError,
+    StreamedMessagePart,
     ThinkingEffort,
 )
 from kosong.message import ContentPart, Message
 from kosong.tooling import ToolResult
 from tenacity import RetryCallState, retry_if_exception, stop_after_attempt, wait_exponential_jitter
 
-from kimi_cli.llm import ModelCapability
+from kimi_cli.llm import LLM, ModelCapability
 from kimi_cli.soul import (
     LLMNotSet,
     LLMNotSupported,
@@ -30,10 +34,23 @@ from kimi_cli.soul import (
     wire_send,
 )
 from kimi_cli.soul.agent import Agent
-from kimi_cli.soul.compaction import SimpleCompaction
-from kimi_cli.soul.context import Context
-from kimi_cli.soul.message import check_message, system, tool_result_to_message
+from kimi_cli.soul.compaction import IncrementalCompaction, prune_stale_tool_outputs
+from kimi_cli.soul.context import Context, is_checkpoint_message
+from kimi_cli.soul.hedge import OnMessagePart, hedge
+from kimi_cli.soul.message import (
+    check_message,
+    system,
+    tool_result_to_message,
+    with_current_time,
+)
+from kimi_cli.soul.metrics import MetricsAggregate, StepTimer
+from kimi_cli.soul.reserve import ReservedTokenBudget
 from kimi_cli.soul.runtime import Runtime
+from kimi_cli.soul.toolset import (
+    CustomToolset,
+    ToolCallSpeculator,
+    get_current_tool_call_or_none,
+)
 from kimi_cli.tools.dmail import NAME as SendDMail_NAME
 from kimi_cli.tools.utils import ToolRejectedError
 from kimi_cli.utils.logging import logger
@@ -44,6 +61,7 @@ from kimi_cli.wire.message import (
     StepBegin,
     StepInterrupted,
 )
+from kimi_cli.workspace import WorkspaceIndex
 
 if TYPE_CHECKING:
 
@@ -51,7 +69,16 @@ if TYPE_CHECKING:
         _: Soul = soul
 
 
-RESERVED_TOKENS = 50_000
+@dataclass(slots=True)
+class _BackgroundCompaction:
+    """A compaction of a prefix of the history, running while the agent keeps working."""
+
+    task: asyncio.Task[Sequence[Message] | None]
+    """The compaction task, resulting in `None` if it failed."""
+    n_messages: int
+    """The number of messages in the compacted prefix."""
+    last_message: Message
+    """The last message of the compacted prefix, to check that the prefix is not reverted."""
 
 
 class KimiSoul(Soul):
@@ -78,11 +105,27 @@ class KimiSoul(Soul):
         self._approval = runtime.approval
         self._context = context
         self._loop_control = runtime.config.loop_control
-        self._compaction = SimpleCompaction()  # TODO: maybe configurable and composable
-        self._reserved_tokens = RESERVED_TOKENS
-        if self._runtime.llm is not None:
-            assert self._reserved_tokens <= self._runtime.llm.max_context_size
+        # TODO: maybe configurable and composable
+        self._compaction = IncrementalCompaction(
+            usage_ledger=runtime.usage_ledger,
+            token_estimator=context.token_estimator,
+            stable_prefix=runtime.config.context.stable_prefix,
+        )
+        self._reserved_token_budget = ReservedTokenBudget()
+        self._background_compaction: _BackgroundCompaction | None = None
+        self._metrics = MetricsAggregate()
         self._thinking_effort: ThinkingEffort = "off"
+        if (
+            self._runtime.llm is not None
+            and (reserved_tokens := self._loop_control.reserved_tokens) is not None
+            and reserved_tokens >= self._runtime.llm.max_context_size
+        ):
+            logger.warning(
+                "Reserved tokens {reserved_tokens} do not fit in the context window of "
+                "{max_context_size} tokens, estimating them instead",
+                reserved_tokens=reserved_tokens,
+                max_context_size=self._runtime.llm.max_context_size,
+            )
 
         for tool in agent.toolset.tools:
             if tool.name == SendDMail_NAME:
@@ -107,18 +150,48 @@ class KimiSoul(Soul):
 
     @property
     def status(self) -> StatusSnapshot:
-        return StatusSnapshot(context_usage=self._context_usage)
+        breakdown = self._context.token_breakdown()
+        return StatusSnapshot(
+            context_usage=self._context_usage,
+            context_tokens=self._context.projected_token_count,
+            tokens_by_role=breakdown.by_role,
+            tokens_by_tool=breakdown.by_tool,
+            avg_time_to_first_token=self._metrics.avg_time_to_first_token,
+            avg_tokens_per_second=self._metrics.avg_tokens_per_second,
+            cache_hit_rate=self._metrics.cache_hit_rate,
+            llm_time=self._metrics.llm_time if self._metrics.n_steps else None,
+            tool_time=self._metrics.tool_time if self._metrics.n_steps else None,
+            overhead_time=self._metrics.overhead_time if self._metrics.n_steps else None,
+        )
 
     @property
     def context(self) -> Context:
         return self._context
 
+    @property
+    def workspace(self) -> WorkspaceIndex:
+        return self._runtime.workspace
+
     @property
     def _context_usage(self) -> float:
         if self._runtime.llm is not None:
-            return self._context.token_count / self._runtime.llm.max_context_size
+            return self._context.projected_token_count / self._runtime.llm.max_context_size
         return 0.0
 
+    @property
+    def _reserved_tokens(self) -> int:
+        """
+        The tokens to reserve in the context window for the next step. The configured value is
+        ignored for a model whose context window it does not fit in, e.g. that of a subagent.
+        """
+        assert self._runtime.llm is not None
+        reserved_tokens = self._loop_control.reserved_tokens
+        if reserved_tokens is not None and reserved_tokens < self._runtime.llm.max_context_size:
+            return reserved_tokens
+        return self._reserved_token_budget.estimate(
+            self._runtime.llm.max_context_size, self._thinking_effort
+        )
+
     @property
     def thinking(self) -> bool:
         """Whether thinking mode is enabled."""
@@ -145,10 +218,19 @@ class KimiSoul(Soul):
         if self._runtime.llm is None:
             raise LLMNotSet()
 
+        if isinstance(self._agent.toolset, CustomToolset):
+            # files may have been modified between runs
+            self._agent.toolset.clear_cache()
+
         user_message = Message(role="user", content=user_input)
         if missing_caps := check_message(user_message, self._runtime.llm.capabilities):
             raise LLMNotSupported(self._runtime.llm, list(missing_caps))
 
+        if self._runtime.config.context.stable_prefix:
+            # the system prompt only has the date, so that it is the same across runs
+            user_message = with_current_time(user_message)
+
+        await self._context.materialize()  # the full history is needed from now on
         await self._checkpoint()  # this creates the checkpoint 0 on first run
         await self._context.append_message(user_message)
         logger.debug("Appended user message to context")
@@ -171,21 +253,26 @@ class KimiSoul(Soul):
             # from the main agent. We must ensure that the Task tool will redirect them
             # to the main wire. See `_SubWire` for more details. Later we need to figure
             # out a better solution.
+            timer = StepTimer()
             try:
-                # compact the context if needed
-                if (
-                    self._context.token_count + self._reserved_tokens
-                    >= self._runtime.llm.max_context_size
+                # compact the context if the next request is projected to be too long,
+                # unless pruning stale tool outputs is enough
+                if self._is_context_too_long() and (
+                    not await self.prune_context() or self._is_context_too_long()
                 ):
                     logger.info("Context too long, compacting...")
                     wire_send(CompactionBegin())
+                    compaction_start = time.monotonic()
                     await self.compact_context()
+                    timer.compaction_time = time.monotonic() - compaction_start
                     wire_send(CompactionEnd())
+                else:
+                    await self._maybe_compact_in_background()
 
                 logger.debug("Beginning step {step_no}", step_no=step_no)
                 await self._checkpoint()
                 self._denwa_renji.set_n_checkpoints(self._context.n_checkpoints)
-                finished = await self._step()
+                finished = await self._step(timer)
             except BackToTheFuture as e:
                 await self._context.revert_to(e.checkpoint_id)
                 await self._checkpoint()
@@ -197,6 +284,7 @@ class KimiSoul(Soul):
                 raise
             finally:
                 approval_task.cancel()  # stop piping approval requests to the wire
+                await self._context.flush()  # persist the records of this step in one go
 
             if finished:
                 return
@@ -205,11 +293,12 @@ class KimiSoul(Soul):
             if step_no > self._loop_control.max_steps_per_run:
                 raise MaxStepsReached(self._loop_control.max_steps_per_run)
 
-    async def _step(self) -> bool:
+    async def _step(self, timer: StepTimer) -> bool:
         """Run an single step and return whether the run should be stopped."""
         # already checked in `run`
         assert self._runtime.llm is not None
-        chat_provider = self._runtime.llm.chat_provider
+        llms = [self._runtime.llm, *self._fitting_fallbacks(self._runtime.llm)]
+        hedge_delay_ms = self._loop_control.hedge_delay_ms
 
         @tenacity.retry(
             retry=retry_if_exception(self._is_retryable_error),
@@ -218,18 +307,77 @@ class KimiSoul(Soul):
             stop=stop_after_attempt(self._loop_control.max_retries_per_step),
             reraise=True,
         )
-        async def _kosong_step_with_retry() -> StepResult:
-            # run an LLM step (may be interrupted)
-            return await kosong.step(
-                chat_provider.with_thinking(self._thinking_effort),
-                self._agent.system_prompt,
-                self._agent.toolset,
-                self._context.history,
-                on_message_part=wire_send,
-                on_tool_result=wire_send,
+        async def _kosong_step_with_retry(llm: LLM, backup: LLM | None) -> tuple[LLM, StepResult]:
+            context_start = time.monotonic()
+            history = await self._context.resolved_history()
+            timer.context_time += time.monotonic() - context_start
+
+            toolset = self._agent.toolset
+            speculator = (
+                ToolCallSpeculator(toolset)
+                if self._loop_control.speculative_tool_calls and isinstance(toolset, CustomToolset)
+                else None
             )
 
-        result = await _kosong_step_with_retry()
+            def _on_message_part(part: StreamedMessagePart) -> None:
+                timer.on_message_part(part)
+                if speculator is not None:
+                    speculator.feed(part)
+                wire_send(part)
+
+            def _on_tool_result(result: ToolResult) -> None:
+                timer.on_tool_result(result)
+                wire_send(result)
+
+            async def _request(llm: LLM, on_message_part: OnMessagePart) -> tuple[LLM, StepResult]:
+                # run an LLM step (may be interrupted)
+                return llm, await kosong.step(
+                    llm.chat_provider.with_thinking(
+                        self._thinking_effort if "thinking" in llm.capabilities else "off"
+                    ),
+                    self._agent.system_prompt,
+                    toolset,
+                    history,
+                    on_message_part=on_message_part,
+                    on_tool_result=_on_tool_result,
+                )
+
+            timer.begin_llm()
+            try:
+                if backup is None:
+                    result = await _request(llm, _on_message_part)
+                else:
+                    assert hedge_delay_ms is not None
+                    result = await hedge(
+                        partial(_request, llm),
+                        partial(_request, backup),
+                        delay=hedge_delay_ms / 1000,
+                        on_message_part=_on_message_part,
+                    )
+            finally:
+                if speculator is not None:
+                    speculator.cancel()  # discard speculative calls not handled by the step
+            timer.end_llm()
+            return result
+
+        async def _kosong_step_with_fallbacks() -> tuple[LLM, StepResult]:
+            for llm, fallback in pairwise(llms):
+                try:
+                    return await _kosong_step_with_retry(
+                        llm, fallback if hedge_delay_ms is not None else None
+                    )
+                except Exception as e:
+                    if not self._is_retryable_error(e):
+                        raise
+                    logger.warning(
+                        "Requests to {model} keep failing, falling back to {fallback}: {error}",
+                        model=llm.model_name,
+                        fallback=fallback.model_name,
+                        error=e,
+                    )
+            return await _kosong_step_with_retry(llms[-1], None)
+
+        served_by, result = await _kosong_step_with_fallbacks()
         logger.debug("Got step result: {result}", result=result)
         if result.usage is not None:
             # mark the token count for the context before the step
@@ -241,7 +389,27 @@ class KimiSoul(Soul):
         logger.debug("Got tool results: {results}", results=results)
 
         # shield the context manipulation from interruption
+        context_start = time.monotonic()
         await asyncio.shield(self._grow_context(result, results))
+        timer.context_time += time.monotonic() - context_start
+        self._reserved_token_budget.observe(
+            result.usage.output if result.usage is not None else None,
+            sum(self._context.message_tokens[-len(results) :]) if results else 0,
+        )
+
+        metrics = timer.metrics(result.usage)
+        logger.debug("Step metrics: {metrics}", metrics=metrics)
+        self._metrics.add(metrics)
+        wire_send(metrics)
+        if result.usage is not None and self._runtime.usage_ledger is not None:
+            tool_call = get_current_tool_call_or_none()  # the `Task` tool call of a subagent
+            await self._runtime.usage_ledger.record(
+                "step",
+                served_by.model_name,
+                result.usage,
+                metrics.llm_time,
+                tool_call_id=tool_call.id if tool_call is not None else None,
+            )
 
         rejected = any(isinstance(result.result, ToolRejectedError) for result in results)
         if rejected:
@@ -297,17 +465,69 @@ class KimiSoul(Soul):
             "Appending tool messages to context: {tool_messages}", tool_messages=tool_messages
         )
         await self._context.append_message(tool_messages)
-        # token count of tool results are not available yet
+        # token count of tool results are estimated locally until the next step
+
+    def _is_context_too_long(self) -> bool:
+        assert self._runtime.llm is not None
+        return (
+            self._context.projected_token_count + self._reserved_tokens
+            >= self._runtime.llm.max_context_size
+        )
+
+    async def prune_context(self) -> bool:
+        """
+        Prune stale tool outputs from the context, without calling the LLM.
+
+        Returns:
+            bool: Whether anything has been pruned.
+        """
+        await self._context.materialize()
+        history = self._context.history
+        pruned = prune_stale_tool_outputs(history)
+        replacements = {
+            index: new
+            for index, (old, new) in enumerate(zip(history, pruned, strict=True))
+            if old is not new
+        }
+        if not replacements:
+            return False
+
+        logger.info("Pruned {n} stale tool outputs from the context", n=len(replacements))
+        # unlike compaction, this keeps the checkpoints that D-Mails can be sent to
+        await self._context.replace_messages(replacements)
+        return True
 
     async def compact_context(self) -> None:
         """
-        Compact the context.
+        Compact the context. If a background compaction of the current history has been
+        started, its result is swapped in, together with the messages appended since then.
 
         Raises:
             LLMNotSet: When the LLM is not set.
             ChatProviderError: When the chat provider returns an error.
         """
+        await self._context.materialize()
+
+        compacted_messages: Sequence[Message] | None = None
+        appended_messages: list[Message] = []
+        if (background := self._take_background_compaction()) is not None:
+            compacted_messages = await background.task
+            appended_messages = [
+                message
+                for message in self._context.history[background.n_messages :]
+                if not is_checkpoint_message(message)  # checkpoint IDs restart from 0
+            ]
+        if compacted_messages is None:
+            compacted_messages = await self._compact_with_retry(
+                await self._context.resolved_history()
+            )
 
+        await self._context.revert_to(0)
+        await self._checkpoint()
+        await self._context.append_message([*compacted_messages, *appended_messages])
+        await self._context.flush()
+
+    async def _compact_with_retry(self, messages: Sequence[Message]) -> Sequence[Message]:
         @tenacity.retry(
             retry=retry_if_exception(self._is_retryable_error),
             before_sleep=partial(self._retry_log, "compaction"),
@@ -315,15 +535,81 @@ class KimiSoul(Soul):
             stop=stop_after_attempt(self._loop_control.max_retries_per_step),
             reraise=True,
         )
-        async def _compact_with_retry() -> Sequence[Message]:
-            if self._runtime.llm is None:
+        async def _compact() -> Sequence[Message]:
+            if (llm := self._runtime.compaction_llm) is None:
                 raise LLMNotSet()
-            return await self._compaction.compact(self._context.history, self._runtime.llm)
+            return await self._compaction.compact(messages, llm)
+
+        return await _compact()
+
+    async def _maybe_compact_in_background(self):
+        """Start a background compaction if the context has reached the watermark."""
+        watermark = self._loop_control.compaction_watermark
+        if watermark is None or self._runtime.llm is None:
+            return
+        threshold = self._runtime.llm.max_context_size - self._reserved_tokens
+        if self._context.projected_token_count < watermark * threshold:
+            return
+        if self._background_compaction is not None:
+            if self._is_valid_background_compaction(self._background_compaction):
+                return
+            self._background_compaction.task.cancel()
 
-        compacted_messages = await _compact_with_retry()
-        await self._context.revert_to(0)
-        await self._checkpoint()
-        await self._context.append_message(compacted_messages)
+        history = self._context.history
+        if not history:
+            return
+        last_message = history[-1]
+        messages = await self._context.resolved_history()
+        logger.info(
+            "Context reached the compaction watermark, compacting {n} messages in background",
+            n=len(messages),
+        )
+        self._background_compaction = _BackgroundCompaction(
+            task=asyncio.create_task(self._compact_in_background(messages)),
+            n_messages=len(messages),
+            last_message=last_message,
+        )
+
+    async def _compact_in_background(self, messages: Sequence[Message]) -> Sequence[Message] | None:
+        try:
+            return await self._compact_with_retry(messages)
+        except Exception as e:
+            logger.warning("Background compaction failed: {error}", error=e)
+            return None
+
+    def _take_background_compaction(self) -> _BackgroundCompaction | None:
+        """Take the background compaction out, if it is still valid for the current history."""
+        background, self._background_compaction = self._background_compaction, None
+        if background is None:
+            return None
+        if not self._is_valid_background_compaction(background):
+            logger.debug("Discarding background compaction of a reverted history")
+            background.task.cancel()
+            return None
+        return background
+
+    def _is_valid_background_compaction(self, background: _BackgroundCompaction) -> bool:
+        history = self._context.history
+        return (
+            len(history) >= background.n_messages
+            and history[background.n_messages - 1] is background.last_message
+        )
+
+    def _fitting_fallbacks(self, llm: LLM) -> list[LLM]:
+        """
+        The fallbacks of an LLM whose context window can hold the context, which is only kept
+        within the context window of the main LLM.
+        """
+        fallbacks: list[LLM] = []
+        for fallback in llm.fallbacks:
+            if self._context.projected_token_count >= fallback.max_context_size:
+                logger.debug(
+                    "Skipping fallback {model}, the context does not fit in it",
+                    model=fallback.model_name,
+                )
+                continue
+            fallbacks.append(fallback)
+        return fallbacks
 
     @staticmethod
     def _is_retryable_error(exception: BaseException) -> bool:
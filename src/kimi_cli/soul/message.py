@@ -1,6 +1,7 @@
 from __future__ import annotations
 
 from collections.abc import Sequence
+from datetime import datetime
 
 from kosong.message import ContentPart, ImageURLPart, Message, TextPart, ThinkPart
 from kosong.tooling import ToolError, ToolOk, ToolResult
@@ -13,6 +14,36 @@ def system(message: str) -> ContentPart:
     return TextPart(text=f"<system>{message}</system>")
 
 
+_CURRENT_TIME_NOTE = "The current date and time in ISO format is "
+
+
+def with_current_time(message: Message) -> Message:
+    """Append the current time to a message, keeping it out of the cached request prefix."""
+    content = (
+        [TextPart(text=message.content)] if isinstance(message.content, str) else message.content
+    )
+    now = datetime.now().astimezone().isoformat()
+    return message.model_copy(update={"content": [*content, system(f"{_CURRENT_TIME_NOTE}{now}")]})
+
+
+def without_current_time(message: Message) -> Message:
+    """Remove the current time appended by `with_current_time` from a message."""
+    if isinstance(message.content, str):
+        return message
+    return message.model_copy(
+        update={
+            "content": [
+                part
+                for part in message.content
+                if not (
+                    isinstance(part, TextPart)
+                    and part.text.startswith(f"<system>{_CURRENT_TIME_NOTE}")
+                )
+            ]
+        }
+    )
+
+
 def tool_result_to_message(tool_result: ToolResult) -> Message:
     """Convert a tool result to a message."""
     if isinstance(tool_result.result, ToolError):
@@ -0,0 +1,140 @@
+from __future__ import annotations
+
+import time
+from dataclasses import dataclass
+
+from kosong.chat_provider import StreamedMessagePart, TokenUsage
+from kosong.message import ToolCall, ToolCallPart
+from kosong.tooling import ToolResult
+
+from kimi_cli.wire.message import StepMetrics
+
+
+class StepTimer:
+    """
+    Measure the timings of an agent step, from the callbacks of `kosong.step`.
+
+    A tool call starts to run once its arguments are fully streamed, that is, when the next
+    message part that does not continue it arrives, or when the response ends.
+    """
+
+    def __init__(self):
+        self._llm_start: float | None = None
+        self._llm_end: float | None = None
+        self._first_token: float | None = None
+        self._streaming_tool_call: str | None = None
+        self._tool_starts: dict[str, float] = {}
+        self._tool_times: dict[str, float] = {}
+        self.context_time = 0.0
+        """The time spent on reading and growing the context, in seconds."""
+        self.compaction_time: float | None = None
+        """The time spent on compacting the context before the step, in seconds."""
+
+    def begin_llm(self) -> None:
+        """Mark the start of an LLM request. Called again on retry, which resets the timings."""
+        self._llm_start = time.monotonic()
+        self._llm_end = None
+        self._first_token = None
+        self._streaming_tool_call = None
+        self._tool_starts.clear()
+        self._tool_times.clear()
+
+    def end_llm(self) -> None:
+        """Mark the end of the LLM response."""
+        self._llm_end = time.monotonic()
+        self._start_streaming_tool_call(self._llm_end)
+
+    def on_message_part(self, part: StreamedMessagePart) -> None:
+        now = time.monotonic()
+        if self._first_token is None:
+            self._first_token = now
+        if isinstance(part, ToolCallPart):
+            return
+        self._start_streaming_tool_call(now)
+        if isinstance(part, ToolCall):
+            self._streaming_tool_call = part.id
+
+    def on_tool_result(self, result: ToolResult) -> None:
+        now = time.monotonic()
+        start = self._tool_starts.get(result.tool_call_id)
+        if start is None:  # the response has not been marked as ended yet
+            start = self._llm_end or now
+        self._tool_times[result.tool_call_id] = now - start
+
+    def _start_streaming_tool_call(self, now: float) -> None:
+        if self._streaming_tool_call is not None:
+            self._tool_starts.setdefault(self._streaming_tool_call, now)
+            self._streaming_tool_call = None
+
+    def metrics(self, usage: TokenUsage | None) -> StepMetrics:
+        """Collect the metrics of the step, given the token usage reported by the provider."""
+        output_tokens = usage.output if usage is not None else None
+        assert self._llm_start is not None and self._llm_end is not None
+        time_to_first_token = (
+            self._first_token - self._llm_start if self._first_token is not None else None
+        )
+        tokens_per_second: float | None = None
+        if output_tokens and self._first_token is not None and self._llm_end > self._first_token:
+            tokens_per_second = output_tokens / (self._llm_end - self._first_token)
+        return StepMetrics(
+            llm_time=self._llm_end - self._llm_start,
+            time_to_first_token=time_to_first_token,
+            input_tokens=usage.input if usage is not None else None,
+            cached_tokens=usage.input_cache_read if usage is not None else None,
+            output_tokens=output_tokens,
+            tokens_per_second=tokens_per_second,
+            tool_times=dict(self._tool_times),
+            context_time=self.context_time,
+            compaction_time=self.compaction_time,
+        )
+
+
+@dataclass(slots=True)
+class MetricsAggregate:
+    """Aggregates of the metrics of the steps in a soul."""
+
+    n_steps: int = 0
+    """The number of measured steps."""
+    llm_time: float = 0.0
+    """The total time of LLM requests, in seconds."""
+    tool_time: float = 0.0
+    """The total time of tool calls, in seconds. Parallel tool calls are added up."""
+    overhead_time: float = 0.0
+    """The total time spent on the context and compaction, in seconds."""
+    input_tokens: int = 0
+    """The total input tokens reported by the provider."""
+    cached_tokens: int = 0
+    """The total input tokens read from the prompt cache."""
+    _ttft_sum: float = 0.0
+    _n_ttft: int = 0
+    _output_tokens: int = 0
+    _generation_time: float = 0.0
+
+    def add(self, metrics: StepMetrics) -> None:
+        self.n_steps += 1
+        self.llm_time += metrics.llm_time
+        self.tool_time += sum(metrics.tool_times.values())
+        self.overhead_time += metrics.context_time + (metrics.compaction_time or 0.0)
+        self.input_tokens += metrics.input_tokens or 0
+        self.cached_tokens += metrics.cached_tokens or 0
+        if metrics.time_to_first_token is not None:
+            self._ttft_sum += metrics.time_to_first_token
+            self._n_ttft += 1
+        if metrics.output_tokens and metrics.tokens_per_second:
+            self._output_tokens += metrics.output_tokens
+            self._generation_time += metrics.output_tokens / metrics.tokens_per_second
+
+    @property
+    def avg_time_to_first_token(self) -> float | None:
+        """The average time to first token, in seconds."""
+        return self._ttft_sum / self._n_ttft if self._n_ttft else None
+
+    @property
+    def avg_tokens_per_second(self) -> float | None:
+        """The output tokens per second of generation, over all steps."""
+        return self._output_tokens / self._generation_time if self._generation_time else None
+
+    @property
+    def cache_hit_rate(self) -> float | None:
+        """The ratio of input tokens read from the prompt cache, over all steps."""
+        return self.cached_tokens / self.input_tokens if self.input_tokens else None
@@ -0,0 +1,80 @@
+from __future__ import annotations
+
+import math
+from collections import deque
+from collections.abc import Iterable
+
+from kosong.chat_provider import ThinkingEffort
+
+N_SAMPLES = 50
+"""The number of recent steps to estimate from."""
+
+PERCENTILE = 0.95
+"""The percentile of the observed tokens per step to reserve for."""
+
+MIN_OUTPUT_TOKENS: dict[ThinkingEffort, int] = {
+    "off": 4_096,
+    "low": 8_192,
+    "medium": 16_384,
+    "high": 32_768,
+}
+"""The least output tokens to reserve for, by thinking effort, since thinking counts as output."""
+
+DEFAULT_TOOL_RESULT_TOKENS = 8_192
+"""The tool result tokens to reserve for before any step is observed."""
+
+SAFETY_MARGIN = 1.2
+"""The factor applied to the estimate, to absorb the error of local token estimation."""
+
+MAX_RESERVED_RATIO = 0.5
+"""The largest part of the context window to reserve."""
+
+
+class ReservedTokenBudget:
+    """
+    Estimate the tokens to reserve in the context window for the next step, i.e. its output
+    and the results of the tool calls it makes, from the steps observed in the session.
+    """
+
+    def __init__(self):
+        self._output_tokens: deque[int] = deque(maxlen=N_SAMPLES)
+        self._tool_result_tokens: deque[int] = deque(maxlen=N_SAMPLES)
+
+    def observe(self, output_tokens: int | None, tool_result_tokens: int) -> None:
+        """
+        Record the tokens of a finished step.
+
+        Args:
+            output_tokens (int | None): The output tokens reported by the LLM provider, if any.
+            tool_result_tokens (int): The estimated tokens of the tool results of the step.
+        """
+        if output_tokens is not None:
+            self._output_tokens.append(output_tokens)
+        self._tool_result_tokens.append(tool_result_tokens)
+
+    def estimate(self, max_context_size: int, thinking_effort: ThinkingEffort) -> int:
+        """
+        Estimate the tokens to reserve for the next step.
+
+        Args:
+            max_context_size (int): The context window of the LLM.
+            thinking_effort (ThinkingEffort): The thinking effort of the next step.
+
+        Returns:
+            int: The tokens to reserve, at most `MAX_RESERVED_RATIO` of the context window.
+        """
+        output = max(_percentile(self._output_tokens), MIN_OUTPUT_TOKENS[thinking_effort])
+        tool_results = (
+            _percentile(self._tool_result_tokens)
+            if self._tool_result_tokens
+            else DEFAULT_TOOL_RESULT_TOKENS
+        )
+        reserved = math.ceil((output + tool_results) * SAFETY_MARGIN)
+        return min(reserved, int(max_context_size * MAX_RESERVED_RATIO))
+
+
+def _percentile(samples: Iterable[int]) -> int:
+    ordered = sorted(samples)
+    if not ordered:
+        return 0
+    return ordered[math.ceil(PERCENTILE * len(ordered)) - 1]
@@ -1,18 +1,20 @@
 from __future__ import annotations
 
 import asyncio
-import subprocess
-import sys
-from dataclasses import dataclass
+import json
+from dataclasses import dataclass, field
 from datetime import datetime
 from pathlib import Path
+from typing import cast
 
-from kimi_cli.config import Config
-from kimi_cli.llm import LLM
+from kimi_cli.config import Config, LLMModel
+from kimi_cli.llm import LLM, create_llm
 from kimi_cli.session import Session
 from kimi_cli.soul.approval import Approval
 from kimi_cli.soul.denwarenji import DenwaRenji
+from kimi_cli.usage import UsageLedger, get_usage_ledger_file
 from kimi_cli.utils.logging import logger
+from kimi_cli.workspace import WorkspaceIndex
 
 
 @dataclass(frozen=True, slots=True, kw_only=True)
@@ -20,11 +22,14 @@ class BuiltinSystemPromptArgs:
     """Builtin system prompt arguments."""
 
     KIMI_NOW: str
-    """The current datetime."""
+    """The current datetime, or the date the session started with `stable_prefix`."""
     KIMI_WORK_DIR: Path
     """The current working directory."""
     KIMI_WORK_DIR_LS: str
-    """The directory listing of current working directory."""
+    """
+    The directory listing of current working directory, as of the start of the session with
+    `stable_prefix`.
+    """
     KIMI_AGENTS_MD: str  # TODO: move to first message from system prompt
     """The content of AGENTS.md."""
 
@@ -42,24 +47,30 @@ def load_agents_md(work_dir: Path) -> str | None:
     return None
 
 
-def _list_work_dir(work_dir: Path) -> str:
-    if sys.platform == "win32":
-        ls = subprocess.run(
-            ["cmd", "/c", "dir", work_dir],
-            capture_output=True,
-            text=True,
-            encoding="utf-8",
-            errors="replace",
-        )
-    else:
-        ls = subprocess.run(
-            ["ls", "-la", work_dir],
-            capture_output=True,
-            text=True,
-            encoding="utf-8",
-            errors="replace",
-        )
-    return ls.stdout.strip()
+def freeze_prompt_args(file: Path, args: dict[str, str]) -> dict[str, str]:
+    """
+    Freeze system prompt arguments that change over time for a session, so that the system
+    prompt stays the same when the session is continued.
+
+    Args:
+        file (Path): The file to keep the frozen arguments in.
+        args (dict[str, str]): The current values of the arguments.
+
+    Returns:
+        dict[str, str]: The values frozen in the file, or the current values if none are.
+    """
+    try:
+        data = json.loads(file.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        data = None
+    frozen = cast(dict[str, object], data) if isinstance(data, dict) else {}
+    values = {key: value for key in args if isinstance(value := frozen.get(key), str)}
+    if len(values) == len(args):
+        logger.debug("Using frozen system prompt arguments: {file}", file=file)
+        return values
+    file.parent.mkdir(parents=True, exist_ok=True)
+    file.write_text(json.dumps(args, ensure_ascii=False), encoding="utf-8")
+    return args
 
 
 @dataclass(frozen=True, slots=True, kw_only=True)
@@ -72,6 +83,54 @@ class Runtime:
     builtin_args: BuiltinSystemPromptArgs
     denwa_renji: DenwaRenji
     approval: Approval
+    workspace: WorkspaceIndex
+    """The index of the paths in the work directory, shared by the tools and the UI."""
+    llms: dict[str, LLM] = field(default_factory=dict[str, LLM])
+    """The LLMs of the models in the config bound to specific purposes, by model name."""
+    usage_ledger: UsageLedger | None = None
+    """The ledger to record the token usage of LLM calls to."""
+
+    @property
+    def compaction_llm(self) -> LLM | None:
+        """The LLM to compact the context with."""
+        return self.get_llm(self.config.compaction_model)
+
+    def get_llm(self, model_name: str | None) -> LLM | None:
+        """
+        Get the LLM of a model in the config, creating it on first use.
+
+        Args:
+            model_name (str | None): The name of the model in the config. If None, or if the
+                model is not found in the config, the main LLM is returned.
+        """
+        if model_name is None:
+            return self.llm
+        if (llm := self.llms.get(model_name)) is not None:
+            return llm
+        if (model := self.config.models.get(model_name)) is None:
+            logger.warning(
+                "Model not found in config, using the main LLM: {model}", model=model_name
+            )
+            return self.llm
+
+        logger.info("Creating LLM for model: {model}", model=model_name)
+        llm = create_llm(self.config.providers[model.provider], model, session_id=self.session.id)
+        self.llms[model_name] = llm
+        self.link_fallbacks(llm, model)
+        return llm
+
+    def link_fallbacks(self, llm: LLM, model: LLMModel) -> None:
+        """
+        Append the LLMs of the fallback models of a model to its LLM. They are created by
+        `get_llm`, so each has its own fallbacks linked in turn.
+
+        Args:
+            llm (LLM): The LLM of the model.
+            model (LLMModel): The model configuration.
+        """
+        for fallback_name in model.fallback_models or []:
+            if (fallback := self.get_llm(fallback_name)) is not None:
+                llm.fallbacks.append(fallback)
 
     @staticmethod
     async def create(
@@ -80,21 +139,38 @@ class Runtime:
         session: Session,
         yolo: bool,
     ) -> Runtime:
-        ls_output, agents_md = await asyncio.gather(
-            asyncio.to_thread(_list_work_dir, session.work_dir),
+        workspace = WorkspaceIndex(session.work_dir, ignore=config.workspace.ignore)
+        _, agents_md = await asyncio.gather(
+            workspace.start(build=config.workspace.file_index),
             asyncio.to_thread(load_agents_md, session.work_dir),
         )
 
+        now = datetime.now().astimezone()
+        changing_args = {
+            "KIMI_NOW": now.isoformat(),
+            "KIMI_WORK_DIR_LS": "\n".join(workspace.list_dir(session.work_dir)),
+        }
+        if config.context.stable_prefix:
+            changing_args = await asyncio.to_thread(
+                freeze_prompt_args,
+                session.prompt_args_file,
+                {**changing_args, "KIMI_NOW": now.date().isoformat()},
+            )
+
         return Runtime(
             config=config,
             llm=llm,
             session=session,
             builtin_args=BuiltinSystemPromptArgs(
-                KIMI_NOW=datetime.now().astimezone().isoformat(),
+                KIMI_NOW=changing_args["KIMI_NOW"],
                 KIMI_WORK_DIR=session.work_dir,
-                KIMI_WORK_DIR_LS=ls_output,
+                KIMI_WORK_DIR_LS=changing_args["KIMI_WORK_DIR_LS"],
                 KIMI_AGENTS_MD=agents_md or "",
             ),
             denwa_renji=DenwaRenji(),
             approval=Approval(yolo=yolo),
+            workspace=workspace,
+            usage_ledger=UsageLedger(
+                get_usage_ledger_file(), session_id=session.id, work_dir=session.work_dir
+            ),
         )
@@ -0,0 +1,181 @@
+from __future__ import annotations
+
+import base64
+import functools
+import math
+import re
+from collections.abc import Sequence
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Protocol, runtime_checkable
+
+from kosong.message import AudioURLPart, ImageURLPart, Message, TextPart, ThinkPart
+
+from kimi_cli.soul.blob import BlobRefPart
+from kimi_cli.utils.logging import logger
+
+MESSAGE_OVERHEAD_TOKENS = 4
+"""The tokens taken by the role and delimiters of each message."""
+MEDIA_PART_TOKENS = 1_000
+"""A rough estimate of the tokens taken by an image or audio part."""
+
+
+@runtime_checkable
+class TokenEstimator(Protocol):
+    def count_text(self, text: str) -> int:
+        """
+        Estimate the number of tokens of a text, without calling the LLM provider.
+
+        Args:
+            text (str): The text to estimate.
+
+        Returns:
+            int: The estimated number of tokens.
+        """
+        ...
+
+
+class HeuristicTokenEstimator(TokenEstimator):
+    """
+    Estimate tokens from character counts: ASCII text takes about `chars_per_token` characters
+    per token, and other characters (e.g. CJK) about one token each.
+    """
+
+    def __init__(self, chars_per_token: float = 4.0):
+        self._chars_per_token = chars_per_token
+
+    def count_text(self, text: str) -> int:
+        if not text:
+            return 0
+        if text.isascii():
+            return math.ceil(len(text) / self._chars_per_token)
+        # a non-ASCII character takes 2 to 4 bytes in UTF-8, mostly 3 for CJK
+        n_non_ascii = min(len(text), (len(text.encode("utf-8")) - len(text) + 1) // 2)
+        return math.ceil((len(text) - n_non_ascii) / self._chars_per_token) + n_non_ascii
+
+
+_PRE_TOKENIZE_PATTERN = re.compile(r" ?[^\W\d_]+| ?\d{1,3}| ?[^\s\w]+|\s+(?!\S)|\s+")
+
+
+class TableTokenEstimator(TokenEstimator):
+    """
+    Estimate tokens with the vocabulary table of a BPE tokenizer, in the `tiktoken` format
+    (one base64-encoded token and its rank per line). The text is pre-tokenized into words,
+    and each word is split greedily by the longest tokens in the table.
+    """
+
+    def __init__(self, vocab: set[bytes]):
+        self._vocab = vocab
+        self._max_token_len = max((len(token) for token in vocab), default=1)
+
+    @staticmethod
+    def load(path: Path) -> TableTokenEstimator:
+        """
+        Load the vocabulary table from a file.
+
+        Raises:
+            OSError: When the file cannot be read.
+            ValueError: When the file is not a valid vocabulary table.
+        """
+        vocab: set[bytes] = set()
+        with open(path, "rb") as f:
+            for line in f:
+                if line := line.strip():
+                    token, _ = line.split()
+                    vocab.add(base64.b64decode(token))
+        if not vocab:
+            raise ValueError(f"Empty tokenizer table: {path}")
+        return TableTokenEstimator(vocab)
+
+    def count_text(self, text: str) -> int:
+        n_tokens = 0
+        for match in _PRE_TOKENIZE_PATTERN.finditer(text):
+            n_tokens += self._count_word(match.group().encode("utf-8"))
+        return n_tokens
+
+    def _count_word(self, word: bytes) -> int:
+        if word in self._vocab:
+            return 1
+        n_tokens = 0
+        i = 0
+        while i < len(word):
+            length = min(self._max_token_len, len(word) - i)
+            while length > 1 and word[i : i + length] not in self._vocab:
+                length -= 1
+            i += length
+            n_tokens += 1
+        return n_tokens
+
+
+def estimate_message_tokens(message: Message, estimator: TokenEstimator) -> int:
+    """Estimate the number of tokens a message takes in a request."""
+    n_tokens = MESSAGE_OVERHEAD_TOKENS
+    if isinstance(message.content, str):
+        n_tokens += estimator.count_text(message.content)
+    else:
+        for part in message.content:
+            match part:
+                case TextPart(text=text):
+                    n_tokens += estimator.count_text(text)
+                case ThinkPart(think=think):
+                    n_tokens += estimator.count_text(think)
+                case BlobRefPart(size=size):
+                    # the content is not at hand, assume plain text
+                    n_tokens += math.ceil(size / 4)
+                case ImageURLPart() | AudioURLPart():
+                    n_tokens += MEDIA_PART_TOKENS
+                case _:
+                    n_tokens += estimator.count_text(part.model_dump_json())
+    for tool_call in message.tool_calls or []:
+        n_tokens += MESSAGE_OVERHEAD_TOKENS + estimator.count_text(tool_call.function.name)
+        n_tokens += estimator.count_text(tool_call.function.arguments or "")
+    return n_tokens
+
+
+@dataclass(frozen=True, slots=True)
+class TokenBreakdown:
+    """How the tokens of a history are distributed."""
+
+    total: int = 0
+    """The total tokens of all messages."""
+    by_role: dict[str, int] = field(default_factory=dict[str, int])
+    """The tokens of messages by role."""
+    by_tool: dict[str, int] = field(default_factory=dict[str, int])
+    """The tokens of tool result messages by tool name, in descending order."""
+
+
+def break_down_tokens(history: Sequence[Message], message_tokens: Sequence[int]) -> TokenBreakdown:
+    """Break down the tokens of a history, given the tokens of each message."""
+    tool_names: dict[str, str] = {}
+    by_role: dict[str, int] = {}
+    by_tool: dict[str, int] = {}
+    for message, n_tokens in zip(history, message_tokens, strict=True):
+        by_role[message.role] = by_role.get(message.role, 0) + n_tokens
+        for tool_call in message.tool_calls or []:
+            tool_names[tool_call.id] = tool_call.function.name
+        if message.role == "tool":
+            tool_name = tool_names.get(message.tool_call_id or "", "unknown")
+            by_tool[tool_name] = by_tool.get(tool_name, 0) + n_tokens
+    return TokenBreakdown(
+        total=sum(by_role.values()),
+        by_role=by_role,
+        by_tool=dict(sorted(by_tool.items(), key=lambda item: item[1], reverse=True)),
+    )
+
+
+@functools.cache
+def create_token_estimator(tokenizer_table: str | None = None) -> TokenEstimator:
+    """
+    Create a token estimator, from a tokenizer table file if given and loadable,
+    or falling back to the character heuristic.
+    """
+    if tokenizer_table is not None:
+        try:
+            return TableTokenEstimator.load(Path(tokenizer_table).expanduser())
+        except (OSError, ValueError) as e:
+            logger.warning(
+                "Failed to load tokenizer table {path}, using heuristic estimation: {error}",
+                path=tokenizer_table,
+                error=e,
+            )
+    return HeuristicTokenEstimator()
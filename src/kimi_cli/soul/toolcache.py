@@ -0,0 +1,103 @@
+from __future__ import annotations
+
+import json
+import os
+from dataclasses import dataclass, replace
+
+from kosong.message import ToolCall
+from kosong.tooling import ToolOk
+
+from kimi_cli.utils.logging import logger
+from kimi_cli.utils.path import paths_overlap
+
+CACHEABLE_TOOLS = frozenset({"ReadFile", "Glob", "Grep"})
+"""Tools whose result only depends on their arguments and the files under their path."""
+CACHE_HIT_MESSAGE = (
+    "This result is reused from an identical earlier call in this run, "
+    "and the files have not been modified since."
+)
+
+type Fingerprint = tuple[int, int] | None
+"""The modification time (in nanoseconds) and size of a path, or `None` if it does not exist."""
+
+
+@dataclass(frozen=True, slots=True)
+class _Entry:
+    path: str | None
+    fingerprint: Fingerprint
+    result: ToolOk
+
+
+class ToolResultCache:
+    """
+    Memoise the results of idempotent tool calls within a run, keyed on the tool name and the
+    normalized arguments.
+
+    An entry is invalidated when the modification time or size of the path the tool call is
+    scoped to changes, or when a tool call that may modify the path is made. For a directory,
+    only changes of its direct entries change its modification time, so changes to nested
+    files by other means than tool calls are not detected.
+    """
+
+    def __init__(self):
+        self._entries: dict[tuple[str, str], _Entry] = {}
+
+    def get(self, tool_call: ToolCall, path: str | None) -> ToolOk | None:
+        """Get the cached result of a tool call, marked as a cache hit, if still valid."""
+        if (key := _cache_key(tool_call)) is None or (entry := self._entries.get(key)) is None:
+            return None
+        if entry.path != path or fingerprint(path) != entry.fingerprint:
+            del self._entries[key]
+            return None
+        logger.debug("Reusing cached result of {name} call", name=tool_call.function.name)
+        message = f"{entry.result.message}\n{CACHE_HIT_MESSAGE}".lstrip()
+        return replace(entry.result, message=message)
+
+    def put(
+        self, tool_call: ToolCall, path: str | None, fingerprint: Fingerprint, result: ToolOk
+    ) -> None:
+        """
+        Cache the result of a tool call, given the fingerprint of its path taken before the
+        call, so that changes made during the call invalidate the entry.
+        """
+        if (key := _cache_key(tool_call)) is not None:
+            self._entries[key] = _Entry(path=path, fingerprint=fingerprint, result=result)
+
+    def invalidate(self, path: str | None) -> None:
+        """Invalidate the entries that may be affected by modifying a path, or all if `None`."""
+        if path is None:
+            self._entries.clear()
+            return
+        self._entries = {
+            key: entry
+            for key, entry in self._entries.items()
+            if entry.path is not None and not paths_overlap(entry.path, path)
+        }
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+
+def is_cacheable(tool_call: ToolCall) -> bool:
+    return tool_call.function.name in CACHEABLE_TOOLS
+
+
+def fingerprint(path: str | None) -> Fingerprint:
+    """Take the fingerprint of a path. A `None` path (the working directory) has none."""
+    if path is None:
+        return None
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def _cache_key(tool_call: ToolCall) -> tuple[str, str] | None:
+    if not is_cacheable(tool_call):
+        return None
+    try:
+        arguments = json.loads(tool_call.function.arguments or "{}")
+    except json.JSONDecodeError:
+        return None
+    return tool_call.function.name, json.dumps(arguments, sort_keys=True, ensure_ascii=False)
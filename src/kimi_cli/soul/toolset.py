@@ -1,12 +1,22 @@
 from __future__ import annotations
 
+import asyncio
+import json
+import os
+from collections.abc import Sequence
 from contextvars import ContextVar
-from typing import override
+from dataclasses import dataclass
+from typing import Literal, override
 
-from kosong.message import ToolCall
-from kosong.tooling import HandleResult
+from kosong.chat_provider import StreamedMessagePart
+from kosong.message import ToolCall, ToolCallPart
+from kosong.tooling import HandleResult, ToolOk, ToolResult
 from kosong.tooling.simple import SimpleToolset
 
+from kimi_cli.soul.toolcache import ToolResultCache, fingerprint, is_cacheable
+from kimi_cli.utils.logging import logger
+from kimi_cli.utils.path import paths_overlap
+
 current_tool_call = ContextVar[ToolCall | None]("current_tool_call", default=None)
 
 
@@ -18,11 +28,273 @@ def get_current_tool_call_or_none() -> ToolCall | None:
     return current_tool_call.get()
 
 
+type ToolEffect = Literal["read_only", "path_write", "subagent", "global"]
+"""
+How a tool call may interfere with other tool calls:
+
+- `read_only`: reads the files under its path argument, or nothing on the local machine
+- `path_write`: modifies the file at its path argument
+- `subagent`: runs a subagent, which may modify any file; subagents run in parallel with each
+  other and with reads, as asked for by the description of the `Task` tool
+- `global`: may have any side effect, e.g. running a shell command
+"""
+
+READ_ONLY_TOOLS: dict[str, str | None] = {
+    "ReadFile": "path",
+    "Glob": "directory",
+    "Grep": "path",
+    "FetchURL": None,
+    "SearchWeb": None,
+    "Think": None,
+    "SetTodoList": None,
+}
+"""Read-only tools, and the argument that scopes the files they read."""
+PATH_WRITING_TOOLS: dict[str, str] = {
+    "WriteFile": "path",
+    "StrReplaceFile": "path",
+    "PatchFile": "path",
+}
+"""Tools that modify a single file, and the argument that names it."""
+SUBAGENT_TOOLS = frozenset({"Task"})
+"""Tools that run subagents."""
+
+SIDE_EFFECT_FREE_TOOLS = frozenset({"ReadFile", "Glob", "Grep", "FetchURL", "SearchWeb"})
+"""Tools that can be run speculatively, because running them has no effect but their result."""
+
+DEFAULT_MAX_CONCURRENCY = 8
+"""The default maximum number of tool calls running at the same time."""
+
+
+def classify_tool_call(tool_call: ToolCall) -> tuple[ToolEffect, str | None]:
+    """
+    Classify a tool call by its effect, together with the normalized path it is scoped to.
+    A `None` path means the whole filesystem. Tools not known to be safe have global effect.
+    """
+    name = tool_call.function.name
+    if name in READ_ONLY_TOOLS:
+        argument = READ_ONLY_TOOLS[name]
+        if argument is None:
+            return "read_only", None
+        return "read_only", _extract_path(tool_call, argument)
+    if name in PATH_WRITING_TOOLS:
+        path = _extract_path(tool_call, PATH_WRITING_TOOLS[name])
+        # a writer without a known path may write anywhere
+        return ("path_write", path) if path is not None else ("global", None)
+    if name in SUBAGENT_TOOLS:
+        return "subagent", None
+    return "global", None
+
+
+def _extract_path(tool_call: ToolCall, argument: str) -> str | None:
+    try:
+        arguments = json.loads(tool_call.function.arguments or "{}")
+    except json.JSONDecodeError:
+        return None
+    if not isinstance(arguments, dict):
+        return None
+    path = arguments.get(argument)  # pyright: ignore[reportUnknownMemberType, reportUnknownVariableType]
+    if not isinstance(path, str) or not os.path.isabs(path):
+        # relative paths depend on the working directory, assume the worst
+        return None
+    return os.path.normpath(path)
+
+
+def _paths_overlap(a: str | None, b: str | None) -> bool:
+    return a is None or b is None or paths_overlap(a, b)
+
+
+def _conflicts(
+    effect_a: ToolEffect, path_a: str | None, effect_b: ToolEffect, path_b: str | None
+) -> bool:
+    if effect_a == "global" or effect_b == "global":
+        return True
+    if effect_a != "path_write" and effect_b != "path_write":
+        # reads and subagents
+        return False
+    return _paths_overlap(path_a, path_b)
+
+
+@dataclass(slots=True)
+class _ScheduledCall:
+    effect: ToolEffect
+    path: str | None
+    task: asyncio.Task[ToolResult]
+
+    def conflicts_with(self, effect: ToolEffect, path: str | None) -> bool:
+        return _conflicts(self.effect, self.path, effect, path)
+
+
 class CustomToolset(SimpleToolset):
+    """
+    A toolset that schedules the tool calls of a step by their effects.
+
+    Tool calls that cannot conflict run in parallel, up to `max_concurrency` at a time. A tool
+    call that conflicts with earlier ones (a write to a path read or written by them, a write
+    and a subagent, or any call with global effect) waits for them to finish, so that
+    conflicting calls run in the order they were made.
+
+    With `cache_results`, the results of idempotent tool calls are memoised until
+    `clear_cache` is called, see `ToolResultCache`.
+    """
+
+    def __init__(
+        self, *, max_concurrency: int = DEFAULT_MAX_CONCURRENCY, cache_results: bool = False
+    ):
+        super().__init__()
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._cache = ToolResultCache() if cache_results else None
+        self._scheduled: list[_ScheduledCall] = []
+        self._speculative: dict[str, tuple[str | None, asyncio.Task[ToolResult]]] = {}
+        """Tool call ID -> (arguments, task) of speculatively started tool calls."""
+
     @override
     def handle(self, tool_call: ToolCall) -> HandleResult:
-        token = current_tool_call.set(tool_call)
+        if (speculative := self._speculative.pop(tool_call.id, None)) is not None:
+            arguments, task = speculative
+            if arguments == tool_call.function.arguments:
+                logger.debug("Using speculative result of tool call {id}", id=tool_call.id)
+                return task
+            task.cancel()
+        return self._schedule(tool_call)
+
+    def speculate(self, tool_call: ToolCall, earlier: Sequence[ToolCall] = ()) -> bool:
+        """
+        Start a side-effect free tool call before it is handled, e.g. while the rest of the
+        message is still streaming. The task is consumed by `handle` for the same tool call,
+        or should be cancelled by `cancel_speculative` when the step ends.
+
+        Args:
+            tool_call (ToolCall): The tool call to start.
+            earlier (Sequence[ToolCall]): The tool calls before it in the same message. They may
+                not have been handled yet, so the tool call is not started if it conflicts with
+                any of them.
+
+        Returns:
+            bool: Whether the tool call has been started.
+        """
+        if (
+            tool_call.function.name not in SIDE_EFFECT_FREE_TOOLS
+            or tool_call.function.name not in self._tool_dict
+            or tool_call.id in self._speculative
+        ):
+            return False
+        effect, path = classify_tool_call(tool_call)
+        for call in earlier:
+            earlier_effect, earlier_path = classify_tool_call(call)
+            if _conflicts(earlier_effect, earlier_path, effect, path):
+                logger.debug(
+                    "Not speculating tool call {id} ({name}), it conflicts with {earlier_id}",
+                    id=tool_call.id,
+                    name=tool_call.function.name,
+                    earlier_id=call.id,
+                )
+                return False
+        logger.debug(
+            "Speculatively starting tool call {id} ({name})",
+            id=tool_call.id,
+            name=tool_call.function.name,
+        )
+        self._speculative[tool_call.id] = (tool_call.function.arguments, self._schedule(tool_call))
+        return True
+
+    def cancel_speculative(self) -> None:
+        """Cancel the speculative tool calls that have not been handled."""
+        for _, task in self._speculative.values():
+            task.cancel()
+        self._speculative.clear()
+
+    def clear_cache(self) -> None:
+        """Clear the memoised tool results, e.g. at the start of a run."""
+        if self._cache is not None:
+            self._cache.clear()
+
+    def _schedule(self, tool_call: ToolCall) -> asyncio.Task[ToolResult]:
+        self._scheduled = [call for call in self._scheduled if not call.task.done()]
+        effect, path = classify_tool_call(tool_call)
+        dependencies = [call.task for call in self._scheduled if call.conflicts_with(effect, path)]
+        if dependencies:
+            logger.debug(
+                "Tool call {id} ({name}) waits for {n} conflicting tool calls",
+                id=tool_call.id,
+                name=tool_call.function.name,
+                n=len(dependencies),
+            )
+        task = asyncio.create_task(self._run(tool_call, effect, path, dependencies))
+        self._scheduled.append(_ScheduledCall(effect=effect, path=path, task=task))
+        return task
+
+    async def _run(
+        self,
+        tool_call: ToolCall,
+        effect: ToolEffect,
+        path: str | None,
+        dependencies: list[asyncio.Task[ToolResult]],
+    ) -> ToolResult:
+        if dependencies:
+            await asyncio.wait(dependencies)
+
+        cacheable = self._cache is not None and is_cacheable(tool_call)
+        path_fingerprint = None
+        if self._cache is not None:
+            if effect != "read_only":
+                # conflicting reads have finished, and later ones wait for this call
+                self._cache.invalidate(path if effect == "path_write" else None)
+            elif cacheable:
+                if (cached := self._cache.get(tool_call, path)) is not None:
+                    return ToolResult(tool_call.id, cached)
+                path_fingerprint = fingerprint(path)
+
+        async with self._semaphore:
+            token = current_tool_call.set(tool_call)
+            try:
+                result = super().handle(tool_call)
+            finally:
+                current_tool_call.reset(token)
+            if not isinstance(result, ToolResult):
+                result = await result
+
+        if self._cache is not None and cacheable and isinstance(result.result, ToolOk):
+            self._cache.put(tool_call, path, path_fingerprint, result.result)
+        return result
+
+
+class ToolCallSpeculator:
+    """
+    Follow the streamed parts of an assistant message, and start each side-effect free tool
+    call with `CustomToolset.speculate` as soon as its arguments are a complete JSON object.
+    """
+
+    def __init__(self, toolset: CustomToolset):
+        self._toolset = toolset
+        self._streaming: ToolCall | None = None
+        self._seen: list[ToolCall] = []
+        """The tool calls streamed so far, which may not have been handled yet."""
+        self._speculated: set[str] = set()
+
+    def feed(self, part: StreamedMessagePart) -> None:
+        match part:
+            case ToolCall():
+                tool_call = self._streaming = part.model_copy(deep=True)
+                self._seen.append(tool_call)
+            case ToolCallPart():
+                tool_call = self._streaming
+                if tool_call is None or not tool_call.merge_in_place(part):
+                    return
+            case _:
+                self._streaming = None
+                return
+        if not tool_call.function.arguments or tool_call.id in self._speculated:
+            return
         try:
-            return super().handle(tool_call)
-        finally:
-            current_tool_call.reset(token)
+            arguments = json.loads(tool_call.function.arguments)
+        except json.JSONDecodeError:
+            return  # not complete yet
+        if isinstance(arguments, dict):
+            self._speculated.add(tool_call.id)
+            # the earlier tool calls are handled by the step only after this part, so a read
+            # must not be started ahead of a write before it
+            self._toolset.speculate(tool_call.model_copy(deep=True), self._seen[:-1])
+
+    def cancel(self) -> None:
+        """Cancel the speculative tool calls that have not been handled."""
+        self._toolset.cancel_speculative()
@@ -1,15 +1,21 @@
 """Glob tool implementation."""
 
 import asyncio
+import fnmatch
+import os
+import re
+from collections.abc import Callable, Iterator
+from itertools import islice
 from pathlib import Path
 from typing import Any, override
 
-import aiofiles.os
 from kosong.tooling import CallableTool2, ToolError, ToolOk, ToolReturnType
 from pydantic import BaseModel, Field
 
 from kimi_cli.soul.runtime import BuiltinSystemPromptArgs
 from kimi_cli.tools.utils import load_desc
+from kimi_cli.utils.path import expand_braces
+from kimi_cli.workspace import WorkspaceIndex
 
 MAX_MATCHES = 1000
 
@@ -38,25 +44,22 @@ class Glob(CallableTool2[Params]):
     )
     params: type[Params] = Params
 
-    def __init__(self, builtin_args: BuiltinSystemPromptArgs, **kwargs: Any) -> None:
+    def __init__(
+        self, builtin_args: BuiltinSystemPromptArgs, workspace: WorkspaceIndex, **kwargs: Any
+    ) -> None:
         super().__init__(**kwargs)
         self._work_dir = builtin_args.KIMI_WORK_DIR
+        self._workspace = workspace
 
-    async def _validate_pattern(self, pattern: str) -> ToolError | None:
-        """Validate that the pattern is safe to use."""
-        if pattern.startswith("**"):
-            # TODO: give a `ls -la` result as the output
-            ls_result = await aiofiles.os.listdir(self._work_dir)
+    def _validate_pattern(self, pattern: str) -> ToolError | None:
+        """Validate that the pattern is relative."""
+        if pattern.startswith("/") or Path(pattern).is_absolute():
             return ToolError(
-                output="\n".join(ls_result),
                 message=(
-                    f"Pattern `{pattern}` starts with '**' which is not allowed. "
-                    "This would recursively search all directories and may include large "
-                    "directories like `node_modules`. Use more specific patterns instead. "
-                    "For your convenience, a list of all files and directories in the "
-                    "top level of the working directory is provided below."
+                    f"Pattern `{pattern}` is an absolute path. "
+                    "Use a pattern relative to the directory to search instead."
                 ),
-                brief="Unsafe pattern",
+                brief="Invalid pattern",
             )
         return None
 
@@ -79,8 +82,8 @@ class Glob(CallableTool2[Params]):
     @override
     async def __call__(self, params: Params) -> ToolReturnType:
         try:
-            # Validate pattern safety
-            pattern_error = await self._validate_pattern(params.pattern)
+            # Validate pattern
+            pattern_error = self._validate_pattern(params.pattern)
             if pattern_error:
                 return pattern_error
 
@@ -111,34 +114,43 @@ class Glob(CallableTool2[Params]):
                     brief="Invalid directory",
                 )
 
-            def _glob(pattern: str) -> list[Path]:
-                return list(dir_path.glob(pattern))
+            await self._workspace.sync()
+            indexed = self._workspace.glob(
+                params.pattern, dir_path, include_dirs=params.include_dirs
+            )
 
-            # Perform the glob search - users can use ** directly in pattern
-            matches = await asyncio.to_thread(_glob, params.pattern)
+            def _glob() -> list[str]:
+                matches = indexed
+                if matches is None:
+                    matches = _iter_glob(
+                        dir_path,
+                        params.pattern,
+                        include_dirs=params.include_dirs,
+                        prune=lambda entry: self._workspace.prunes(entry.path),
+                    )
+                # one more than the limit, to tell whether there are more
+                return list(islice(matches, MAX_MATCHES + 1))
 
-            # Filter out directories if not requested
-            if not params.include_dirs:
-                matches = [p for p in matches if p.is_file()]
+            matches = await asyncio.to_thread(_glob)
 
             # Sort for consistent output
             matches.sort()
 
             # Limit matches
-            message = (
-                f"Found {len(matches)} matches for pattern `{params.pattern}`."
-                if len(matches) > 0
-                else f"No matches found for pattern `{params.pattern}`."
-            )
             if len(matches) > MAX_MATCHES:
                 matches = matches[:MAX_MATCHES]
-                message += (
-                    f" Only the first {MAX_MATCHES} matches are returned. "
+                message = (
+                    f"Found more than {MAX_MATCHES} matches for pattern `{params.pattern}`. "
+                    f"Only the first {MAX_MATCHES} matches are returned. "
                     "You may want to use a more specific pattern."
                 )
+            elif matches:
+                message = f"Found {len(matches)} matches for pattern `{params.pattern}`."
+            else:
+                message = f"No matches found for pattern `{params.pattern}`."
 
             return ToolOk(
-                output="\n".join(str(p.relative_to(dir_path)) for p in matches),
+                output="\n".join(matches),
                 message=message,
             )
 
@@ -147,3 +159,105 @@ class Glob(CallableTool2[Params]):
                 message=f"Failed to search for pattern {params.pattern}. Error: {e}",
                 brief="Glob failed",
             )
+
+
+def _iter_glob(
+    root: Path,
+    pattern: str,
+    *,
+    include_dirs: bool,
+    prune: Callable[[os.DirEntry[str]], bool],
+) -> Iterator[str]:
+    """
+    Yield the paths relative to `root` that match a glob pattern, as they are found. Like
+    `Path.glob`, `**` matches any number of directories, and a trailing `/` only matches
+    directories. Brace alternatives like `*.{js,ts}` are expanded.
+
+    Wildcards do not descend into directories to `prune`, e.g. those ignored by `.gitignore`
+    files, but such directories can still be named explicitly, e.g. `node_modules/react/*`.
+    Entries are typed by `os.scandir`, so that the files are not stat-ed one by one.
+    """
+    seen: set[str] = set()
+    for expanded in expand_braces(pattern):
+        for rel_path in _iter_glob_expanded(root, expanded, include_dirs, prune):
+            if rel_path not in seen:
+                seen.add(rel_path)
+                yield rel_path
+
+
+def _iter_glob_expanded(
+    root: Path, pattern: str, include_dirs: bool, prune: Callable[[os.DirEntry[str]], bool]
+) -> Iterator[str]:
+    dirs_only = pattern.endswith("/")
+    segments = [segment for segment in pattern.split("/") if segment and segment != "."]
+    if not segments:
+        return
+    flags = re.IGNORECASE if os.name == "nt" else 0
+    matchers = [
+        re.compile(fnmatch.translate(segment), flags) if _is_wildcard(segment) else None
+        for segment in segments
+    ]
+
+    root_prefix = len(os.path.join(root, ""))
+    # a stack of directories, each having matched the segments before the index
+    stack: list[tuple[str, int]] = [(str(root), 0)]
+    visited: set[tuple[str, int]] = set()
+    while stack:
+        directory, i = stack.pop()
+        if (directory, i) in visited:
+            continue
+        visited.add((directory, i))
+
+        if i == len(segments):
+            # a directory matching the whole pattern, e.g. with a trailing `**`
+            if include_dirs and len(directory) >= root_prefix:
+                yield directory[root_prefix:]
+            continue
+
+        segment = segments[i]
+        matcher = matchers[i]
+        last = i == len(segments) - 1
+        if matcher is None and segment != "**":
+            # a literal name, which is never ignored
+            path = os.path.join(directory, segment)
+            is_dir = os.path.isdir(path)
+            if last:
+                if (is_dir and include_dirs) or (not dirs_only and os.path.isfile(path)):
+                    yield path[root_prefix:]
+            elif is_dir:
+                stack.append((path, i + 1))
+            continue
+
+        try:
+            with os.scandir(directory) as it:
+                entries = sorted(it, key=lambda entry: entry.name, reverse=True)
+        except OSError:
+            continue
+
+        children: list[tuple[str, int]] = []
+        for entry in entries:
+            try:
+                if segment == "**":
+                    # do not follow symlinks when recursing, like `Path.glob`
+                    if entry.is_dir(follow_symlinks=False) and not prune(entry):
+                        children.append((entry.path, i))
+                    continue
+                assert matcher is not None
+                if not matcher.fullmatch(entry.name):
+                    continue
+                is_dir = entry.is_dir()
+                if last:
+                    if (is_dir and include_dirs) or (not is_dir and not dirs_only):
+                        yield entry.path[root_prefix:]
+                elif is_dir and not prune(entry):
+                    children.append((entry.path, i + 1))
+            except OSError:
+                continue
+        if segment == "**":
+            # `**` also matches no directory at all
+            children.append((directory, i + 1))
+        stack.extend(children)
+
+
+def _is_wildcard(segment: str) -> bool:
+    return any(char in segment for char in "*?[")
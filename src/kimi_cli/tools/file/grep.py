@@ -1,23 +1,38 @@
 import asyncio
+import base64
+import json
+import math
+import os
 import platform
+import re
 import shutil
 import stat
 import tarfile
 import tempfile
+import time
 import zipfile
-from pathlib import Path
-from typing import override
+from bisect import bisect_right
+from collections.abc import AsyncGenerator, AsyncIterator
+from contextlib import aclosing, asynccontextmanager
+from dataclasses import dataclass
+from fnmatch import fnmatchcase
+from pathlib import Path, PurePath
+from typing import Any, Literal, override
 
 import aiohttp
-import ripgrepy  # pyright: ignore[reportMissingTypeStubs]
 from kosong.tooling import CallableTool2, ToolError, ToolOk, ToolReturnType
 from pydantic import BaseModel, Field
 
 import kimi_cli
+from kimi_cli.config import Config
 from kimi_cli.share import get_share_dir
-from kimi_cli.tools.utils import load_desc
+from kimi_cli.soul.runtime import BuiltinSystemPromptArgs
+from kimi_cli.tools.file.trigram import BINARY_SNIFF_BYTES, get_trigram_index, required_trigrams
+from kimi_cli.tools.utils import DEFAULT_MAX_CHARS, ToolResultBuilder, load_desc
 from kimi_cli.utils.aiohttp import new_client_session
 from kimi_cli.utils.logging import logger
+from kimi_cli.utils.path import expand_braces, is_ignored, walk_files
+from kimi_cli.workspace import WorkspaceIndex
 
 
 class Params(BaseModel):
@@ -111,6 +126,31 @@ class Params(BaseModel):
 RG_VERSION = "15.0.0"
 RG_BASE_URL = "http://cdn.kimi.com/binaries/kimi-cli/rg"
 _RG_DOWNLOAD_LOCK = asyncio.Lock()
+RG_RETRY_INTERVAL = 300.0
+"""The delay before trying again to download ripgrep after a failure, in seconds."""
+_rg_retry_at = 0.0
+"""
+The `time.monotonic` time before which ripgrep is not tried again, after it failed to be
+downloaded, or `math.inf` if there is no build of it for the platform.
+"""
+
+MAX_OUTPUT_BYTES = DEFAULT_MAX_CHARS
+"""The output budget of a search, beyond which ripgrep is stopped."""
+
+MAX_MATCHES_PER_FILE = 50
+"""The most matching lines to show per file in content mode."""
+
+MAX_JSON_LINE_BYTES = 4 << 20
+"""The longest JSON event of ripgrep to read, in bytes. Longer events are skipped."""
+
+MAX_NARROWED_FILES = 1000
+"""The most files narrowed down by the trigram index to pass to ripgrep, instead of the path."""
+
+MAX_NARROWED_ARGS_CHARS = 16_384
+"""
+The most characters of the files narrowed down by the trigram index to pass to ripgrep, well
+within the 32,767 characters of a command line on Windows.
+"""
 
 
 def _rg_binary_name() -> str:
@@ -236,67 +276,694 @@ async def _ensure_rg_path() -> str:
 
 class Grep(CallableTool2[Params]):
     name: str = "Grep"
-    description: str = load_desc(Path(__file__).parent / "grep.md")
+    description: str = load_desc(
+        Path(__file__).parent / "grep.md", {"MAX_MATCHES_PER_FILE": str(MAX_MATCHES_PER_FILE)}
+    )
     params: type[Params] = Params
 
+    def __init__(
+        self,
+        config: Config,
+        builtin_args: BuiltinSystemPromptArgs,
+        workspace: WorkspaceIndex,
+        **kwargs: Any,
+    ):
+        super().__init__(**kwargs)
+        self._workspace = workspace
+        self._index = (
+            get_trigram_index(builtin_args.KIMI_WORK_DIR)
+            if config.workspace.trigram_index
+            else None
+        )
+
     @override
     async def __call__(self, params: Params) -> ToolReturnType:
+        global _rg_retry_at
         try:
-            # Initialize ripgrep with pattern and path
-            rg_path = await _ensure_rg_path()
+            if time.monotonic() < _rg_retry_at:
+                return await self._search_python(params)
+            try:
+                rg_path = await _ensure_rg_path()
+            except Exception as e:
+                logger.warning("Ripgrep is not available, searching without it: {error}", error=e)
+                _rg_retry_at = (
+                    math.inf if _detect_target() is None else time.monotonic() + RG_RETRY_INTERVAL
+                )
+                return await self._search_python(params)
             logger.debug("Using ripgrep binary: {rg_bin}", rg_bin=rg_path)
-            rg = ripgrepy.Ripgrepy(params.pattern, params.path, rg_path=rg_path)
-
-            # Apply search options
-            if params.ignore_case:
-                rg = rg.ignore_case()
-            if params.multiline:
-                rg = rg.multiline().multiline_dotall()
 
-            # Content display options (only for content mode)
-            if params.output_mode == "content":
-                if params.before_context is not None:
-                    rg = rg.before_context(params.before_context)
-                if params.after_context is not None:
-                    rg = rg.after_context(params.after_context)
-                if params.context is not None:
-                    rg = rg.context(params.context)
-                if params.line_number:
-                    rg = rg.line_number()
-
-            # File filtering options
-            if params.glob:
-                rg = rg.glob(params.glob)
-            if params.type:
-                rg = rg.type_(params.type)
-
-            # Set output mode
-            if params.output_mode == "files_with_matches":
-                rg = rg.files_with_matches()
-            elif params.output_mode == "count_matches":
-                rg = rg.count_matches()
-
-            # Execute search
-            result = rg.run()
-
-            # Get results
-            output = result.as_string
-
-            # Apply head limit if specified
-            if params.head_limit is not None:
-                lines = output.split("\n")
-                if len(lines) > params.head_limit:
-                    lines = lines[: params.head_limit]
-                    output = "\n".join(lines)
-                    if params.output_mode in ["content", "files_with_matches", "count_matches"]:
-                        output += f"\n... (results truncated to {params.head_limit} lines)"
-
-            if not output:
+            trigrams = required_trigrams(params.pattern, ignore_case=params.ignore_case)
+            paths = None
+            if trigrams and not params.type:  # ripgrep does not filter files given explicitly
+                paths = await self._indexed_files(params, trigrams, _globs(params.glob, None))
+            if paths is not None and not _fits_command_line(paths):
+                paths = None
+            if paths == []:
                 return ToolOk(output="", message="No matches found")
-            return ToolOk(output=output)
 
+            if params.output_mode == "content":
+                return await _search_content(rg_path, params, paths)
+            result = await _stream_rg(
+                rg_path,
+                _build_rg_args(params, paths=paths),
+                head_limit=params.head_limit,
+                max_bytes=MAX_OUTPUT_BYTES,
+            )
         except Exception as e:
             return ToolError(
                 message=f"Failed to grep. Error: {str(e)}",
                 brief="Failed to grep",
             )
+
+        if not result.lines and result.returncode not in (0, 1):
+            # exit code 1 means no matches, and 2 means errors, possibly along with matches
+            return _rg_error(result.stderr)
+        return _lines_result(result, params)
+
+    async def _indexed_files(
+        self, params: Params, trigrams: set[bytes], globs: list[str]
+    ) -> list[Path] | None:
+        """
+        Get the files that may match according to the trigram index, or `None` if the index
+        is disabled or does not cover the search.
+        """
+        if self._index is None:
+            return None
+        path = Path(params.path).expanduser().resolve()
+        if not self._index.covers(path):
+            return None
+        await self._workspace.sync()
+        files = await self._index.candidates(
+            trigrams, path, files=self._workspace.files(self._index.root)
+        )
+        if path.is_dir():
+            # ripgrep searches the files given explicitly even if it would skip them
+            files = [
+                file
+                for file in files
+                if not _skipped_by_rg(self._workspace, file, path)
+                and (not globs or _matches_globs(file.relative_to(path), globs))
+            ]
+        return files
+
+    async def _search_python(self, params: Params) -> ToolReturnType:
+        """Search with the `re` module, for when ripgrep is not available."""
+        if params.type and params.type not in _TYPE_GLOBS:
+            return ToolError(
+                message=(
+                    f"Failed to grep. Error: unrecognized file type `{params.type}` without "
+                    f"ripgrep, supported types are {', '.join(_TYPE_GLOBS)}. Use `glob` instead."
+                ),
+                brief="Failed to grep",
+            )
+        globs = _globs(params.glob, params.type)
+        flags = re.MULTILINE
+        if params.ignore_case:
+            flags |= re.IGNORECASE
+        if params.multiline:
+            flags |= re.DOTALL
+        try:
+            regex = re.compile(params.pattern, flags)
+        except re.error as e:
+            return ToolError(
+                message=f"Failed to grep. Error: Invalid pattern: {e}",
+                brief="Failed to grep",
+            )
+
+        files = await self._indexed_files(
+            params, required_trigrams(params.pattern, ignore_case=params.ignore_case), globs
+        )
+        if files is None:
+            path = Path(params.path).expanduser()
+            if not path.exists():
+                return ToolError(
+                    message=f"Failed to grep. Error: {params.path}: No such file or directory",
+                    brief="Failed to grep",
+                )
+            files = await self._list_files(path, globs)
+
+        if params.output_mode == "content":
+            builder, formatter = _new_content_formatter(params)
+            stopped_by = await _format_content(
+                _python_events(files, regex, params), builder, formatter, params.head_limit
+            )
+            return _content_result(builder, formatter, stopped_by, params.head_limit)
+
+        result = await asyncio.to_thread(
+            _python_lines, files, regex, params, with_path=Path(params.path).expanduser().is_dir()
+        )
+        return _lines_result(result, params)
+
+    async def _list_files(self, path: Path, globs: list[str]) -> list[Path]:
+        """List the files to search, from the workspace index if it covers the path."""
+        await self._workspace.sync()
+        rel_paths = self._workspace.files(path) if path.is_dir() else None
+        if rel_paths is None:
+            return await asyncio.to_thread(_list_files, path, globs, self._workspace)
+        return [
+            path / rel_path
+            for rel_path in rel_paths
+            if not is_ignored(rel_path.rpartition("/")[2])
+            and not _skipped_by_rg(self._workspace, path / rel_path, path)
+            and (not globs or _matches_globs(PurePath(rel_path), globs))
+        ]
+
+
+def _lines_result(result: "_RgResult", params: Params) -> ToolReturnType:
+    output = "\n".join(result.lines)
+    if result.truncated_by == "head_limit":
+        output += f"\n... (results truncated to {params.head_limit} lines)"
+    elif result.truncated_by == "max_bytes":
+        output += f"\n... (results truncated to {MAX_OUTPUT_BYTES} bytes)"
+
+    if not output:
+        return ToolOk(output="", message="No matches found")
+    return ToolOk(output=output)
+
+
+def _rg_error(stderr: str) -> ToolError:
+    return ToolError(
+        message=f"Failed to grep. Error: {stderr.strip()}",
+        brief="Failed to grep",
+    )
+
+
+def _fits_command_line(paths: list[Path]) -> bool:
+    """Whether the narrowed down files can be passed to ripgrep as arguments."""
+    if len(paths) > MAX_NARROWED_FILES:
+        return False
+    # each argument may be quoted and is separated by a space
+    return sum(len(str(path)) + 3 for path in paths) <= MAX_NARROWED_ARGS_CHARS
+
+
+def _build_rg_args(
+    params: Params, *, json: bool = False, paths: list[Path] | None = None
+) -> list[str]:
+    """
+    Build the ripgrep arguments for the given parameters.
+
+    Args:
+        json (bool): Whether to output JSON events, for content mode.
+        paths (list[Path] | None): The files to search instead of `params.path`, if narrowed
+            down by the trigram index. They must fit in a command line, see
+            `_fits_command_line`.
+    """
+    args: list[str] = ["--json"] if json else []
+    if params.ignore_case:
+        args.append("--ignore-case")
+    if params.multiline:
+        args.extend(["--multiline", "--multiline-dotall"])
+
+    # Content display options (only for content mode)
+    if params.output_mode == "content":
+        if params.before_context is not None:
+            args.extend(["--before-context", str(params.before_context)])
+        if params.after_context is not None:
+            args.extend(["--after-context", str(params.after_context)])
+        if params.context is not None:
+            args.extend(["--context", str(params.context)])
+        if params.line_number and not json:
+            args.append("--line-number")
+
+    # File filtering options
+    if params.glob:
+        args.extend(["--glob", params.glob])
+    if params.type:
+        args.extend(["--type", params.type])
+
+    # Set output mode
+    if params.output_mode == "files_with_matches":
+        args.append("--files-with-matches")
+    elif params.output_mode == "count_matches":
+        args.append("--count-matches")
+
+    if paths is None:
+        args.extend(["--", params.pattern, os.path.expanduser(params.path)])
+    else:
+        args.extend(["--with-filename", "--", params.pattern, *map(str, paths)])
+    return args
+
+
+class _RgProcess:
+    """A running ripgrep process, whose output is read line by line."""
+
+    def __init__(self, process: asyncio.subprocess.Process):
+        assert process.stdout is not None and process.stderr is not None
+        self._process = process
+        self._stdout = process.stdout
+        # drain stderr concurrently so that ripgrep never blocks on writing it
+        self._stderr_task = asyncio.create_task(process.stderr.read())
+
+    async def readline(self) -> bytes:
+        """
+        Read a line of the output, or `b""` at the end.
+
+        Raises:
+            ValueError: If the line is longer than the limit of the stream.
+        """
+        return await self._stdout.readline()
+
+    async def wait(self) -> tuple[int, str]:
+        """Wait for ripgrep to exit, and return its exit code and error output."""
+        returncode = await self._process.wait()
+        stderr = await self._stderr_task
+        return returncode, stderr.decode(encoding="utf-8", errors="replace")
+
+    async def close(self) -> None:
+        """Kill ripgrep if it is still running."""
+        if self._process.returncode is None:
+            self._process.kill()
+            # the process is only reported as exited once its pipes are drained to the end
+            await self._stdout.read()
+            await self._process.wait()
+        self._stderr_task.cancel()
+
+
+@asynccontextmanager
+async def _run_rg(rg_path: str, args: list[str], *, limit: int) -> AsyncGenerator[_RgProcess]:
+    """
+    Run ripgrep, and kill it on exit if it is still running, including when cancelled.
+
+    Args:
+        limit (int): The longest output line that can be read, in bytes.
+    """
+    process = await asyncio.create_subprocess_exec(
+        rg_path,
+        *args,
+        stdin=asyncio.subprocess.DEVNULL,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+        limit=limit,
+    )
+    rg = _RgProcess(process)
+    try:
+        yield rg
+    finally:
+        await rg.close()
+
+
+@dataclass(frozen=True, slots=True)
+class _RgResult:
+    lines: list[str]
+    """The output lines read before ripgrep finished or was stopped."""
+    truncated_by: Literal["head_limit", "max_bytes"] | None
+    """The limit that stopped reading the output, if any."""
+    returncode: int | None
+    """The exit code of ripgrep, `None` if it was stopped."""
+    stderr: str
+
+
+async def _stream_rg(
+    rg_path: str,
+    args: list[str],
+    *,
+    head_limit: int | None,
+    max_bytes: int,
+) -> _RgResult:
+    """
+    Run ripgrep and read its output line by line, killing it as soon as `head_limit` lines or
+    `max_bytes` bytes of output have been read. Ripgrep is also killed if this is cancelled.
+    """
+    lines: list[str] = []
+    n_bytes = 0
+    async with _run_rg(rg_path, args, limit=max_bytes) as rg:
+        while True:
+            try:
+                line = await rg.readline()
+            except ValueError:  # a single line longer than the budget
+                truncated_by = "max_bytes"
+                break
+            if not line:
+                returncode, stderr = await rg.wait()
+                return _RgResult(
+                    lines=lines, truncated_by=None, returncode=returncode, stderr=stderr
+                )
+            if head_limit is not None and len(lines) >= head_limit:
+                truncated_by = "head_limit"
+                break
+            n_bytes += len(line)
+            if n_bytes > max_bytes:
+                truncated_by = "max_bytes"
+                break
+            lines.append(line.decode(encoding="utf-8", errors="replace").rstrip("\r\n"))
+
+    logger.debug("Stopped ripgrep early, output limited by {limit}", limit=truncated_by)
+    return _RgResult(lines=lines, truncated_by=truncated_by, returncode=None, stderr="")
+
+
+async def _search_content(rg_path: str, params: Params, paths: list[Path] | None) -> ToolReturnType:
+    """
+    Search in content mode, from the JSON output of ripgrep. The lines are grouped under the
+    path of each file, without repeating lines of overlapping context windows, and at most
+    `MAX_MATCHES_PER_FILE` matching lines are shown per file.
+    """
+    builder, formatter = _new_content_formatter(params)
+    args = _build_rg_args(params, json=True, paths=paths)
+    async with (
+        _run_rg(rg_path, args, limit=MAX_JSON_LINE_BYTES) as rg,
+        aclosing(_rg_events(rg)) as events,
+    ):
+        stopped_by = await _format_content(events, builder, formatter, params.head_limit)
+        if stopped_by is None:
+            returncode, stderr = await rg.wait()
+            if not builder.n_chars and returncode not in (0, 1):
+                return _rg_error(stderr)
+        else:
+            logger.debug("Stopped ripgrep early, output limited by {limit}", limit=stopped_by)
+    return _content_result(builder, formatter, stopped_by, params.head_limit)
+
+
+async def _rg_events(rg: _RgProcess) -> AsyncGenerator[dict[str, Any]]:
+    while True:
+        try:
+            line = await rg.readline()
+        except ValueError:
+            logger.warning("Skipping ripgrep output longer than {n} bytes", n=MAX_JSON_LINE_BYTES)
+            continue
+        if not line:
+            return
+        try:
+            yield json.loads(line)
+        except json.JSONDecodeError:
+            continue
+
+
+def _new_content_formatter(params: Params) -> tuple[ToolResultBuilder, "_ContentFormatter"]:
+    builder = ToolResultBuilder(max_chars=MAX_OUTPUT_BYTES)
+    formatter = _ContentFormatter(
+        builder,
+        line_number=params.line_number,
+        separate_context=any(
+            n is not None for n in (params.before_context, params.after_context, params.context)
+        ),
+    )
+    return builder, formatter
+
+
+async def _format_content(
+    events: AsyncIterator[dict[str, Any]],
+    builder: ToolResultBuilder,
+    formatter: "_ContentFormatter",
+    head_limit: int | None,
+) -> Literal["head_limit", "max_bytes"] | None:
+    """
+    Feed the events to the formatter until the output is full or has `head_limit` lines.
+
+    Returns:
+        The limit that stopped the output, if any.
+    """
+    stopped_by: Literal["head_limit", "max_bytes"] | None = None
+    async for event in events:
+        if stopped_by is not None:
+            # keep reading the current file only, for its number of matching lines
+            if event.get("type") == "end":
+                formatter.end_file(event["data"])
+                break
+            continue
+
+        formatter.feed(event)
+        if head_limit is not None and builder.n_lines >= head_limit:
+            stopped_by = "head_limit"
+        elif builder.is_full:
+            stopped_by = "max_bytes"
+        if stopped_by is not None and not formatter.in_file:
+            break
+    return stopped_by
+
+
+def _content_result(
+    builder: ToolResultBuilder,
+    formatter: "_ContentFormatter",
+    stopped_by: Literal["head_limit", "max_bytes"] | None,
+    head_limit: int | None,
+) -> ToolReturnType:
+    if stopped_by == "head_limit":
+        builder.write(f"\n... (results truncated to {head_limit} lines)")
+    if not builder.n_chars:
+        return ToolOk(output="", message="No matches found")
+
+    message = ""
+    if formatter.truncated_files:
+        message = "Not all matching lines are shown: " + ", ".join(
+            f"{n_more} more in {path}" for path, n_more in formatter.truncated_files.items()
+        )
+    if stopped_by is not None:
+        message += (". " if message else "") + "Other files may have matches as well"
+    return builder.ok(message)
+
+
+class _ContentFormatter:
+    """Format the JSON events of ripgrep into lines grouped by file."""
+
+    def __init__(self, builder: ToolResultBuilder, *, line_number: bool, separate_context: bool):
+        self._builder = builder
+        self._line_number = line_number
+        self._separate_context = separate_context
+        self._path: str | None = None
+        self._last_line = 0
+        self._n_matches = 0
+        self.truncated_files: dict[str, int] = {}
+        """The number of matching lines not shown, by file path."""
+
+    @property
+    def in_file(self) -> bool:
+        """Whether the events of a file are being fed."""
+        return self._path is not None
+
+    def feed(self, event: dict[str, Any]) -> None:
+        data = event.get("data", {})
+        match event.get("type"):
+            case "begin":
+                self._path = _rg_text(data.get("path", {}))
+                self._last_line = 0
+                self._n_matches = 0
+                if self._builder.n_chars:
+                    self._builder.write("\n")
+                self._builder.write(f"{self._path}\n")
+            case "match" | "context" as kind if self._path is not None:
+                if kind == "match":
+                    self._n_matches += 1
+                    if self._n_matches > MAX_MATCHES_PER_FILE:
+                        return
+                elif self._n_matches >= MAX_MATCHES_PER_FILE:
+                    return
+                self._write_lines(kind, data)
+            case "end":
+                self.end_file(data)
+            case _:
+                pass
+
+    def end_file(self, data: dict[str, Any]) -> None:
+        """Finish the current file, noting the matching lines that are not shown."""
+        if self._path is None:
+            return
+        shown = min(self._n_matches, MAX_MATCHES_PER_FILE)
+        matched_lines = data.get("stats", {}).get("matched_lines", self._n_matches)
+        if matched_lines > shown:
+            self.truncated_files[self._path] = matched_lines - shown
+            if self._n_matches > MAX_MATCHES_PER_FILE:
+                self._builder.write(f"... ({matched_lines - shown} more matching lines)\n")
+        self._path = None
+
+    def _write_lines(self, kind: str, data: dict[str, Any]) -> None:
+        first_line: int | None = data.get("line_number")
+        texts = _rg_text(data.get("lines", {})).splitlines() or [""]
+        if first_line is None:
+            for text in texts:
+                self._builder.write(f"{text}\n")
+            return
+
+        separator = ":" if kind == "match" else "-"
+        for line_no, text in enumerate(texts, start=first_line):
+            if line_no <= self._last_line:
+                continue  # already shown in an overlapping context window
+            if self._separate_context and self._last_line and line_no > self._last_line + 1:
+                self._builder.write("--\n")
+            self._last_line = line_no
+            prefix = f"{line_no}{separator}" if self._line_number else ""
+            self._builder.write(f"{prefix}{text}\n")
+
+
+def _rg_text(data: dict[str, Any]) -> str:
+    """Decode an arbitrary data object of ripgrep, which is either text or base64 bytes."""
+    if (text := data.get("text")) is not None:
+        return text
+    return base64.b64decode(data.get("bytes", "")).decode(encoding="utf-8", errors="replace")
+
+
+_TYPE_GLOBS: dict[str, str] = {
+    "c": "*.{c,h}",
+    "cpp": "*.{cc,cpp,cxx,h,hh,hpp,hxx}",
+    "css": "*.{css,scss}",
+    "go": "*.go",
+    "html": "*.{htm,html}",
+    "java": "*.java",
+    "js": "*.{cjs,js,jsx,mjs}",
+    "json": "*.json",
+    "kotlin": "*.{kt,kts}",
+    "md": "*.{markdown,md}",
+    "py": "*.{py,pyi}",
+    "ruby": "*.rb",
+    "rust": "*.rs",
+    "sh": "*.{bash,sh,zsh}",
+    "swift": "*.swift",
+    "toml": "*.toml",
+    "ts": "*.{cts,mts,ts,tsx}",
+    "yaml": "*.{yaml,yml}",
+}
+"""Globs of the common file types of ripgrep, for searching without it."""
+
+
+def _globs(glob: str | None, type: str | None) -> list[str]:
+    globs = [glob] if glob else []
+    if type:
+        globs.append(_TYPE_GLOBS[type])
+    return globs
+
+
+def _matches_globs(rel_path: PurePath, globs: list[str]) -> bool:
+    """Match a path relative to the search root like the `--glob` option of ripgrep."""
+    for glob in globs:
+        negated = glob.startswith("!")
+        patterns = expand_braces(glob.removeprefix("!").removeprefix("/"))
+        matched = any(
+            rel_path.full_match(pattern) if "/" in pattern else fnmatchcase(rel_path.name, pattern)
+            for pattern in patterns
+        )
+        if matched == negated:
+            return False
+    return True
+
+
+def _list_files(path: Path, globs: list[str], workspace: WorkspaceIndex) -> list[Path]:
+    if not path.is_dir():
+        return [path]
+    files = [
+        Path(entry.path)
+        for entry in walk_files(
+            path, prune=lambda entry: entry.name.startswith(".") or workspace.prunes(entry.path)
+        )
+        if not entry.name.startswith(".") and not workspace.excludes(entry.path)
+    ]
+    if globs:
+        files = [file for file in files if _matches_globs(file.relative_to(path), globs)]
+    files.sort()
+    return files
+
+
+def _skipped_by_rg(workspace: WorkspaceIndex, file: Path, root: Path) -> bool:
+    """
+    Whether ripgrep skips a file when searching a directory, being hidden under it, or
+    excluded by the `.gitignore` files as the workspace index applies them.
+    """
+    if any(part.startswith(".") for part in file.relative_to(root).parts):
+        return True
+    return workspace.excludes(str(file))
+
+
+def _read_text(path: Path) -> str | None:
+    """Read a file to search, or `None` if it is unreadable or binary, like ripgrep skips."""
+    try:
+        data = path.read_bytes()
+    except OSError:
+        return None
+    if b"\0" in data[:BINARY_SNIFF_BYTES]:
+        return None
+    return data.decode(encoding="utf-8", errors="replace")
+
+
+def _find_matches(
+    text: str, regex: re.Pattern[str], multiline: bool
+) -> tuple[list[str], set[int], int]:
+    """
+    Find the matches of a pattern in a text.
+
+    Returns:
+        The lines of the text, the indexes of the matching lines, and the number of matches.
+    """
+    lines = text.split("\n")
+    if text.endswith("\n"):
+        lines.pop()
+    matched: set[int] = set()
+    n_matches = 0
+    if not multiline:
+        for i, line in enumerate(lines):
+            n = sum(1 for _ in regex.finditer(line))
+            if n:
+                matched.add(i)
+                n_matches += n
+        return lines, matched, n_matches
+
+    starts = [0]
+    for line in lines[:-1]:
+        starts.append(starts[-1] + len(line) + 1)
+    for match in regex.finditer(text):
+        first = bisect_right(starts, match.start()) - 1
+        last = bisect_right(starts, max(match.end() - 1, match.start())) - 1
+        matched.update(range(first, min(last, len(lines) - 1) + 1))
+        n_matches += 1
+    return lines, matched, n_matches
+
+
+def _python_lines(
+    files: list[Path], regex: re.Pattern[str], params: Params, *, with_path: bool
+) -> _RgResult:
+    """Search the files for the `files_with_matches` and `count_matches` output modes."""
+    lines: list[str] = []
+    n_bytes = 0
+    for file in files:
+        text = _read_text(file)
+        if text is None:
+            continue
+        if params.output_mode == "count_matches":
+            _, _, n_matches = _find_matches(text, regex, params.multiline)
+            if not n_matches:
+                continue
+            line = f"{file}:{n_matches}" if with_path else str(n_matches)
+        else:
+            if not _find_matches(text, regex, params.multiline)[1]:
+                continue
+            line = str(file)
+        if params.head_limit is not None and len(lines) >= params.head_limit:
+            return _RgResult(lines=lines, truncated_by="head_limit", returncode=None, stderr="")
+        n_bytes += len(line) + 1
+        if n_bytes > MAX_OUTPUT_BYTES:
+            return _RgResult(lines=lines, truncated_by="max_bytes", returncode=None, stderr="")
+        lines.append(line)
+    return _RgResult(lines=lines, truncated_by=None, returncode=0, stderr="")
+
+
+async def _python_events(
+    files: list[Path], regex: re.Pattern[str], params: Params
+) -> AsyncGenerator[dict[str, Any]]:
+    """Search the files for the `content` output mode, yielding events like ripgrep."""
+    for file in files:
+        for event in await asyncio.to_thread(_file_events, file, regex, params):
+            yield event
+
+
+def _file_events(file: Path, regex: re.Pattern[str], params: Params) -> list[dict[str, Any]]:
+    text = _read_text(file)
+    if text is None:
+        return []
+    lines, matched, _ = _find_matches(text, regex, params.multiline)
+    if not matched:
+        return []
+
+    # like ripgrep, `-A` and `-B` take precedence over `-C`
+    before = params.before_context if params.before_context is not None else params.context
+    after = params.after_context if params.after_context is not None else params.context
+    shown: set[int] = set()
+    for i in matched:
+        shown.update(range(max(i - (before or 0), 0), min(i + (after or 0), len(lines) - 1) + 1))
+
+    events: list[dict[str, Any]] = [{"type": "begin", "data": {"path": {"text": str(file)}}}]
+    events.extend(
+        {
+            "type": "match" if i in matched else "context",
+            "data": {"line_number": i + 1, "lines": {"text": lines[i] + "\n"}},
+        }
+        for i in sorted(shown)
+    )
+    events.append({"type": "end", "data": {"stats": {"matched_lines": len(matched)}}})
+    return events
@@ -0,0 +1,359 @@
+"""
+A persistent trigram index of the files in a work directory, to narrow down the files that may
+match a regular expression before searching them.
+
+Each file is summarized by a Bloom filter of the trigrams of its content, so that a lookup may
+report files that do not match, but never misses a file that does. The filters are kept in a
+SQLite database under the share directory, and only recomputed for files whose modification
+time or size changed.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import os
+import re
+import sqlite3
+from collections.abc import Callable, Sequence
+from contextlib import closing
+from dataclasses import dataclass
+from functools import partial
+from hashlib import md5
+from pathlib import Path
+
+from kimi_cli.share import get_share_dir
+from kimi_cli.utils.logging import logger
+from kimi_cli.utils.path import is_ignored, walk_files
+
+MAX_INDEXED_FILE_SIZE = 1 << 20
+"""Files larger than this are not indexed, and always reported as candidates."""
+
+BITS_PER_TRIGRAM = 4
+"""The size of the filter of a file per distinct trigram, bounding its false positive rate."""
+
+MIN_FILTER_BITS = 1 << 8
+MAX_FILTER_BITS = 1 << 16
+
+BINARY_SNIFF_BYTES = 8192
+"""Files with a NUL byte in this many leading bytes are binary, and never candidates."""
+
+_SCHEMA_VERSION = 2
+
+_BINARY = -1
+"""The filter size recorded for binary files."""
+
+
+def get_trigram_index_file(root: Path) -> Path:
+    """Get the trigram index file of a work directory."""
+    root_id = md5(str(root).encode(encoding="utf-8")).hexdigest()
+    return get_share_dir() / "grep_index" / f"{root_id}.db"
+
+
+_indexes: dict[Path, TrigramIndex] = {}
+
+
+def get_trigram_index(root: Path) -> TrigramIndex:
+    """Get the trigram index of a work directory, shared within the process."""
+    root = root.resolve()
+    if root not in _indexes:
+        _indexes[root] = TrigramIndex(root, get_trigram_index_file(root))
+    return _indexes[root]
+
+
+@dataclass(slots=True)
+class _Entry:
+    mtime_ns: int
+    size: int
+    n_bits: int
+    """The size of the filter, 0 if the file is not indexed, or `_BINARY`."""
+    filter: int
+
+
+class TrigramIndex:
+    """
+    A trigram index of the files under `root`, skipping the names that are `is_ignored` like
+    the `@` file mention completion does.
+    """
+
+    def __init__(self, root: Path, file: Path):
+        self._root = root
+        self._file = file
+        self._entries: dict[str, _Entry] | None = None
+        self._lock = asyncio.Lock()
+
+    @property
+    def root(self) -> Path:
+        return self._root
+
+    def covers(self, path: Path) -> bool:
+        """Whether a path is under the root and not skipped by the index."""
+        if not path.is_relative_to(self._root):
+            return False
+        return not any(is_ignored(part) for part in path.relative_to(self._root).parts)
+
+    async def refresh(self, files: Sequence[str] | None = None) -> None:
+        """
+        Bring the index up to date with the files under the root.
+
+        Args:
+            files (Sequence[str] | None): The files under the root relative to it, e.g. from
+                the workspace file index. If None, the root is walked.
+        """
+        async with self._lock:
+            await asyncio.to_thread(self._refresh, files)
+
+    async def candidates(
+        self, trigrams: set[bytes], under: Path, *, files: Sequence[str] | None = None
+    ) -> list[Path]:
+        """
+        Refresh the index, and get the files under a path that may contain all the trigrams,
+        sorted by path.
+
+        Args:
+            trigrams (set[bytes]): The trigrams, as returned by `required_trigrams`.
+            under (Path): A path covered by the index.
+            files (Sequence[str] | None): The files under the root to refresh the index with.
+        """
+        await self.refresh(files)
+        assert self._entries is not None
+        prefix = under.relative_to(self._root).as_posix()
+        prefix = "" if prefix == "." else prefix
+        masks: dict[int, int] = {}
+        paths: list[Path] = []
+        for rel_path, entry in self._entries.items():
+            if prefix and rel_path != prefix and not rel_path.startswith(prefix + "/"):
+                continue
+            if entry.n_bits == _BINARY:
+                continue
+            if entry.n_bits:
+                if entry.n_bits not in masks:
+                    masks[entry.n_bits] = _filter_of(trigrams, entry.n_bits)
+                mask = masks[entry.n_bits]
+                if entry.filter & mask != mask:
+                    continue
+            paths.append(self._root / rel_path)
+        paths.sort()
+        return paths
+
+    def _refresh(self, files: Sequence[str] | None) -> None:
+        if self._entries is None:
+            self._entries = self._load()
+        entries = self._entries
+
+        seen: set[str] = set()
+        updated: list[tuple[str, _Entry]] = []
+        for rel_path, path, stat in self._list_files(files):
+            seen.add(rel_path)
+            try:
+                st = stat()
+                entry = entries.get(rel_path)
+                if entry and entry.mtime_ns == st.st_mtime_ns and entry.size == st.st_size:
+                    continue
+                entry = _index_file(Path(path), st)
+            except OSError:
+                continue
+            entries[rel_path] = entry
+            updated.append((rel_path, entry))
+        removed = [rel_path for rel_path in entries if rel_path not in seen]
+        for rel_path in removed:
+            del entries[rel_path]
+
+        if updated or removed:
+            logger.debug(
+                "Trigram index of {root}: {n_updated} files updated, {n_removed} removed",
+                root=self._root,
+                n_updated=len(updated),
+                n_removed=len(removed),
+            )
+            self._save(updated, removed)
+
+    def _list_files(
+        self, files: Sequence[str] | None
+    ) -> list[tuple[str, str, Callable[[], os.stat_result]]]:
+        """List the relative path, the path and a stat function of each file to index."""
+        listed: list[tuple[str, str, Callable[[], os.stat_result]]] = []
+        if files is not None:
+            for rel_path in files:
+                if not is_ignored(rel_path.rpartition("/")[2]):
+                    path = os.path.join(self._root, rel_path)
+                    listed.append((rel_path, path, partial(os.stat, path)))
+            return listed
+        # slicing the paths is much faster than `Path.relative_to` for large trees
+        n_prefix = len(os.path.join(self._root, ""))
+        for dir_entry in walk_files(self._root):
+            rel_path = dir_entry.path[n_prefix:]
+            if os.sep != "/":
+                rel_path = rel_path.replace(os.sep, "/")
+            listed.append((rel_path, dir_entry.path, dir_entry.stat))
+        return listed
+
+    def _connect(self) -> sqlite3.Connection:
+        self._file.parent.mkdir(parents=True, exist_ok=True)
+        db = sqlite3.connect(self._file, timeout=30)
+        (version,) = db.execute("PRAGMA user_version").fetchone()
+        if version != _SCHEMA_VERSION:
+            with db:
+                db.execute("DROP TABLE IF EXISTS files")
+                db.execute(
+                    "CREATE TABLE files (path TEXT PRIMARY KEY, mtime_ns INTEGER, "
+                    "size INTEGER, n_bits INTEGER, filter BLOB)"
+                )
+                db.execute(f"PRAGMA user_version = {_SCHEMA_VERSION}")
+        return db
+
+    def _load(self) -> dict[str, _Entry]:
+        try:
+            with closing(self._connect()) as db:
+                return {
+                    rel_path: _Entry(mtime_ns, size, n_bits, int.from_bytes(filter, "little"))
+                    for rel_path, mtime_ns, size, n_bits, filter in db.execute(
+                        "SELECT path, mtime_ns, size, n_bits, filter FROM files"
+                    )
+                }
+        except (OSError, sqlite3.Error) as e:
+            logger.warning(
+                "Failed to load trigram index from {file}: {error}", file=self._file, error=e
+            )
+            return {}
+
+    def _save(self, updated: list[tuple[str, _Entry]], removed: list[str]) -> None:
+        try:
+            with closing(self._connect()) as db, db:
+                db.executemany("DELETE FROM files WHERE path = ?", [(p,) for p in removed])
+                db.executemany(
+                    "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?)",
+                    [
+                        (
+                            rel_path,
+                            entry.mtime_ns,
+                            entry.size,
+                            entry.n_bits,
+                            entry.filter.to_bytes(max(entry.n_bits, 0) // 8, "little"),
+                        )
+                        for rel_path, entry in updated
+                    ],
+                )
+        except (OSError, sqlite3.Error) as e:
+            logger.warning(
+                "Failed to save trigram index to {file}: {error}", file=self._file, error=e
+            )
+
+
+def _index_file(path: Path, st: os.stat_result) -> _Entry:
+    if st.st_size > MAX_INDEXED_FILE_SIZE:
+        return _Entry(st.st_mtime_ns, st.st_size, 0, 0)
+    data = path.read_bytes()
+    if b"\0" in data[:BINARY_SNIFF_BYTES]:
+        return _Entry(st.st_mtime_ns, st.st_size, _BINARY, 0)
+    data = data.lower()
+    trigrams = {data[i : i + 3] for i in range(len(data) - 2)}
+    n_bits = MIN_FILTER_BITS
+    while n_bits < len(trigrams) * BITS_PER_TRIGRAM and n_bits < MAX_FILTER_BITS:
+        n_bits <<= 1
+    return _Entry(st.st_mtime_ns, st.st_size, n_bits, _filter_of(trigrams, n_bits))
+
+
+def _filter_of(trigrams: set[bytes], n_bits: int) -> int:
+    bits = bytearray(n_bits // 8)
+    shift = 33 - n_bits.bit_length()
+    for trigram in trigrams:
+        # multiplicative hashing, taking the high bits of the 32-bit product
+        pos = ((int.from_bytes(trigram) * 0x9E3779B1) & 0xFFFFFFFF) >> shift
+        bits[pos >> 3] |= 1 << (pos & 7)
+    return int.from_bytes(bits, "little")
+
+
+_ESCAPE_ARG_LENGTHS = {"x": 2, "u": 4, "U": 8}
+
+
+def required_trigrams(pattern: str, *, ignore_case: bool) -> set[bytes]:
+    """
+    Get trigrams that any text matching a ripgrep regular expression must contain, in
+    lowercase. Only the literals outside groups and character classes are considered, and
+    none for patterns with alternations, so the result may be empty.
+    """
+    if re.search(r"\(\?[a-zA-Z]*x", pattern):  # whitespace is insignificant in verbose mode
+        return set()
+    ignore_case = ignore_case or bool(re.search(r"\(\?[a-zA-Z]*i", pattern))
+
+    literals: list[str] = []
+    current: list[str] = []
+
+    def flush() -> None:
+        if current:
+            literals.append("".join(current))
+            current.clear()
+
+    depth = 0
+    i = 0
+    while i < len(pattern):
+        char = pattern[i]
+        i += 1
+        if char == "\\":
+            escaped = pattern[i : i + 1]
+            i += 1
+            if escaped and not escaped.isalnum():
+                if depth == 0:
+                    current.append(escaped)
+                continue
+            flush()
+            # skip the arguments of escapes like `\x41`, `\u{41}` and `\p{Greek}`
+            if pattern[i : i + 1] == "{" and escaped in "xuUpP":
+                i = pattern.find("}", i) + 1 or len(pattern)
+            elif escaped in _ESCAPE_ARG_LENGTHS:
+                i += _ESCAPE_ARG_LENGTHS[escaped]
+            elif escaped in "pP":
+                i += 1
+            elif escaped.isdigit():
+                while pattern[i : i + 1].isdigit():
+                    i += 1
+        elif char == "|":
+            return set()
+        elif char == "[":
+            flush()
+            # skip the character class, with its nested and POSIX classes like `[a-z&&[^x]]`
+            # and `[[:digit:]]`, in each of which a leading `]` is literal
+            class_depth = 0
+            i -= 1
+            while i < len(pattern):
+                char = pattern[i]
+                i += 1
+                if char == "[":
+                    class_depth += 1
+                    if pattern[i : i + 1] == "^":
+                        i += 1
+                    if pattern[i : i + 1] == "]":
+                        i += 1
+                elif char == "]":
+                    class_depth -= 1
+                    if class_depth == 0:
+                        break
+                elif char == "\\":
+                    i += 1
+        elif char == "(":
+            flush()
+            depth += 1
+        elif char == ")":
+            flush()
+            depth -= 1
+        elif char in "*?{":
+            # the quantified character may not occur at all
+            if current:
+                current.pop()
+            flush()
+            if char == "{":
+                i = pattern.find("}", i) + 1 or len(pattern)
+        elif char in "+.^$":
+            flush()
+        elif depth == 0:
+            current.append(char)
+    flush()
+
+    trigrams: set[bytes] = set()
+    for literal in literals:
+        # case folding may map a non-ASCII character to an ASCII one, e.g. the Kelvin sign to k
+        parts = re.split(r"[^\x00-\x7f]+", literal) if ignore_case else [literal]
+        for part in parts:
+            data = part.encode(encoding="utf-8").lower()
+            trigrams.update(data[j : j + 3] for j in range(len(data) - 2))
+    return trigrams
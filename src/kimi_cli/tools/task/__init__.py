@@ -1,4 +1,5 @@
 import asyncio
+import dataclasses
 from pathlib import Path
 from typing import Any, override
 
@@ -8,9 +9,11 @@ from pydantic import BaseModel, Field
 from kimi_cli.agentspec import ResolvedAgentSpec, SubagentSpec
 from kimi_cli.soul import MaxStepsReached, get_wire_or_none, run_soul
 from kimi_cli.soul.agent import Agent, load_agent
+from kimi_cli.soul.blob import BlobStore
 from kimi_cli.soul.context import Context
 from kimi_cli.soul.kimisoul import KimiSoul
 from kimi_cli.soul.runtime import Runtime
+from kimi_cli.soul.tokens import create_token_estimator
 from kimi_cli.soul.toolset import get_current_tool_call_or_none
 from kimi_cli.tools.utils import load_desc
 from kimi_cli.utils.message import message_extract_text
@@ -67,6 +70,7 @@ class Task(CallableTool2[Params]):
         self._runtime = runtime
         self._session = runtime.session
         self._subagents: dict[str, Agent] = {}
+        self._subagent_runtimes: dict[str, Runtime] = {}
 
         try:
             loop = asyncio.get_running_loop()
@@ -79,8 +83,18 @@ class Task(CallableTool2[Params]):
     async def _load_subagents(self, subagent_specs: dict[str, SubagentSpec]) -> None:
         """Load all subagents specified in the agent spec."""
         for name, spec in subagent_specs.items():
-            agent = await load_agent(spec.path, self._runtime, mcp_configs=[])
+            runtime = dataclasses.replace(
+                self._runtime,
+                llm=self._runtime.get_llm(spec.model),
+                usage_ledger=(
+                    self._runtime.usage_ledger.for_subagent(name)
+                    if self._runtime.usage_ledger is not None
+                    else None
+                ),
+            )
+            agent = await load_agent(spec.path, runtime, mcp_configs=[])
             self._subagents[name] = agent
+            self._subagent_runtimes[name] = runtime
 
     async def _get_subagent_history_file(self) -> Path:
         """Generate a unique history file path for subagent."""
@@ -105,8 +119,9 @@ class Task(CallableTool2[Params]):
                 brief="Subagent not found",
             )
         agent = self._subagents[params.subagent_name]
+        runtime = self._subagent_runtimes[params.subagent_name]
         try:
-            result = await self._run_subagent(agent, params.prompt)
+            result = await self._run_subagent(agent, runtime, params.prompt)
             return result
         except Exception as e:
             return ToolError(
@@ -114,7 +129,7 @@ class Task(CallableTool2[Params]):
                 brief="Failed to run subagent",
             )
 
-    async def _run_subagent(self, agent: Agent, prompt: str) -> ToolReturnType:
+    async def _run_subagent(self, agent: Agent, runtime: Runtime, prompt: str) -> ToolReturnType:
         """Run subagent with optional continuation for task summary."""
         super_wire = get_wire_or_none()
         assert super_wire is not None
@@ -139,37 +154,47 @@ class Task(CallableTool2[Params]):
                 _super_wire_send(msg)
 
         subagent_history_file = await self._get_subagent_history_file()
-        context = Context(file_backend=subagent_history_file)
-        soul = KimiSoul(agent, runtime=self._runtime, context=context)
-
-        try:
-            await run_soul(soul, prompt, _ui_loop_fn, asyncio.Event())
-        except MaxStepsReached as e:
-            return ToolError(
-                message=(
-                    f"Max steps {e.n_steps} reached when running subagent. "
-                    "Please try splitting the task into smaller subtasks."
-                ),
-                brief="Max steps reached",
-            )
-
-        _error_msg = (
-            "The subagent seemed not to run properly. Maybe you have to do the task yourself."
+        context = Context(
+            file_backend=subagent_history_file,
+            durability=self._runtime.config.context.durability,
+            format=self._runtime.config.context.format,
+            blob_store=BlobStore(
+                self._session.blob_dir, threshold=self._runtime.config.context.blob_threshold
+            ),
+            token_estimator=create_token_estimator(self._runtime.config.context.tokenizer_table),
         )
+        soul = KimiSoul(agent, runtime=runtime, context=context)
+        try:
+            try:
+                await run_soul(soul, prompt, _ui_loop_fn, asyncio.Event())
+            except MaxStepsReached as e:
+                return ToolError(
+                    message=(
+                        f"Max steps {e.n_steps} reached when running subagent. "
+                        "Please try splitting the task into smaller subtasks."
+                    ),
+                    brief="Max steps reached",
+                )
 
-        # Check if the subagent context is valid
-        if len(context.history) == 0 or context.history[-1].role != "assistant":
-            return ToolError(message=_error_msg, brief="Failed to run subagent")
-
-        final_response = message_extract_text(context.history[-1])
-
-        # Check if response is too brief, if so, run again with continuation prompt
-        n_attempts_remaining = MAX_CONTINUE_ATTEMPTS
-        if len(final_response) < 200 and n_attempts_remaining > 0:
-            await run_soul(soul, CONTINUE_PROMPT, _ui_loop_fn, asyncio.Event())
+            _error_msg = (
+                "The subagent seemed not to run properly. Maybe you have to do the task yourself."
+            )
 
+            # Check if the subagent context is valid
             if len(context.history) == 0 or context.history[-1].role != "assistant":
                 return ToolError(message=_error_msg, brief="Failed to run subagent")
+
             final_response = message_extract_text(context.history[-1])
 
-        return ToolOk(output=final_response)
+            # Check if response is too brief, if so, run again with continuation prompt
+            n_attempts_remaining = MAX_CONTINUE_ATTEMPTS
+            if len(final_response) < 200 and n_attempts_remaining > 0:
+                await run_soul(soul, CONTINUE_PROMPT, _ui_loop_fn, asyncio.Event())
+
+                if len(context.history) == 0 or context.history[-1].role != "assistant":
+                    return ToolError(message=_error_msg, brief="Failed to run subagent")
+                final_response = message_extract_text(context.history[-1])
+
+            return ToolOk(output=final_response)
+        finally:
+            await context.close()
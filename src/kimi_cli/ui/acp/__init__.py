@@ -28,6 +28,7 @@ from kimi_cli.wire.message import (
     StatusUpdate,
     StepBegin,
     StepInterrupted,
+    StepMetrics,
     SubagentEvent,
 )
 
@@ -202,6 +203,9 @@ class ACPAgent:
                     pass
                 case StatusUpdate():
                     pass
+                case StepMetrics():
+                    # ACP has no session update for metrics
+                    logger.debug("Step metrics: {metrics}", metrics=msg)
                 case ThinkPart(think=think):
                     await self._send_text(think)
                 case TextPart(text=text):
@@ -43,12 +43,13 @@ class ShellApp:
         _print_welcome_info(self.soul.name or "Kimi CLI", self._welcome_info)
 
         if isinstance(self.soul, KimiSoul):
-            await replay_recent_history(self.soul.context.history)
+            await replay_recent_history(self.soul.context.loaded_history)
 
         with CustomPromptSession(
             status_provider=lambda: self.soul.status,
             model_capabilities=self.soul.model_capabilities or set(),
             initial_thinking=isinstance(self.soul, KimiSoul) and self.soul.thinking,
+            workspace=self.soul.workspace if isinstance(self.soul, KimiSoul) else None,
         ) as prompt_session:
             while True:
                 try:
@@ -18,7 +18,9 @@ from rich.rule import Rule
 from rich.syntax import Syntax
 from rich.text import Text
 
+from kimi_cli.soul.blob import BlobRefPart
 from kimi_cli.soul.kimisoul import KimiSoul
+from kimi_cli.soul.tokens import TokenBreakdown
 from kimi_cli.ui.shell.console import console
 from kimi_cli.ui.shell.metacmd import meta_command
 
@@ -58,6 +60,9 @@ def _format_content_part(part: ContentPart) -> Text | Panel | Group:
             id_text = f" (id: {audio.id})" if audio.id else ""
             return Text(f"[Audio{id_text}] {url_display}", style="blue")
 
+        case BlobRefPart(digest=digest, size=size):
+            return Text(f"[Blob {digest[:12]}] {size:,} characters", style="blue")
+
         case _:
             return Text(f"[Unknown content type: {type(part).__name__}]", style="red")
 
@@ -86,7 +91,7 @@ def _format_tool_call(tool_call: ToolCall) -> Panel:
     )
 
 
-def _format_message(msg: Message, index: int) -> Panel:
+def _format_message(msg: Message, index: int, n_tokens: int) -> Panel:
     """Format a single message."""
     # Role styling
     role_colors = {
@@ -131,7 +136,7 @@ def _format_message(msg: Message, index: int) -> Panel:
     group = Group(*content_items)
 
     # Create panel
-    title = f"#{index + 1} {role_text}"
+    title = f"#{index + 1} {role_text} [dim]· {n_tokens:,} tokens[/dim]"
     if msg.partial:
         title += " [dim italic](partial)[/dim italic]"
 
@@ -143,13 +148,33 @@ def _format_message(msg: Message, index: int) -> Panel:
     )
 
 
+def _format_token_breakdown(breakdown: TokenBreakdown) -> Panel:
+    """Format the token breakdown of the context."""
+    lines = [Text(f"Total: {breakdown.total:,}", style="bold")]
+    for role, n_tokens in breakdown.by_role.items():
+        lines.append(Text(f"  {role}: {n_tokens:,}"))
+    if breakdown.by_tool:
+        lines.append(Text("Tool results:", style="bold"))
+        for tool_name, n_tokens in breakdown.by_tool.items():
+            lines.append(Text(f"  {tool_name}: {n_tokens:,}"))
+
+    return Panel(
+        Group(*lines),
+        title="[bold]Token Breakdown[/bold]",
+        border_style="cyan",
+        padding=(0, 1),
+    )
+
+
 @meta_command(kimi_soul_only=True)
-def debug(app: ShellApp, args: list[str]):
+async def debug(app: ShellApp, args: list[str]):
     """Debug the context"""
     assert isinstance(app.soul, KimiSoul)
 
     context = app.soul._context
-    history = context.history
+    # show the tool outputs stored in the blob store instead of the references to them
+    history = await context.resolved_history()
+    breakdown = context.token_breakdown()
 
     if not history:
         console.print(
@@ -167,6 +192,7 @@ def debug(app: ShellApp, args: list[str]):
             Group(
                 Text(f"Total messages: {len(history)}", style="bold"),
                 Text(f"Token count: {context.token_count:,}", style="bold"),
+                Text(f"Projected token count: {context.projected_token_count:,}", style="bold"),
                 Text(f"Checkpoints: {context.n_checkpoints}", style="bold"),
                 Text(f"Trajectory: {context._file_backend}", style="dim"),
             ),
@@ -174,12 +200,13 @@ def debug(app: ShellApp, args: list[str]):
             border_style="cyan",
             padding=(0, 1),
         ),
+        _format_token_breakdown(breakdown),
         Rule(style="dim"),
     ]
 
     # Add all messages
-    for idx, msg in enumerate(history):
-        output_items.append(_format_message(msg, idx))
+    for idx, (msg, n_tokens) in enumerate(zip(history, context.message_tokens, strict=True)):
+        output_items.append(_format_message(msg, idx, n_tokens))
 
     # Display using rich pager
     display_group = Group(*output_items)
@@ -212,7 +212,10 @@ async def init(app: ShellApp, args: list[str]):
         console.print("Analyzing the codebase...")
         tmp_context = Context(file_backend=Path(temp_dir) / "context.jsonl")
         app.soul = KimiSoul(soul_bak._agent, soul_bak._runtime, context=tmp_context)
-        ok = await app._run_soul_command(prompts.INIT, thinking=False)
+        try:
+            ok = await app._run_soul_command(prompts.INIT, thinking=False)
+        finally:
+            await tmp_context.close()
 
         if ok:
             console.print(
@@ -230,6 +233,7 @@ async def init(app: ShellApp, args: list[str]):
         f"Latest AGENTS.md file content:\n{agents_md}"
     )
     await app.soul._context.append_message(Message(role="user", content=[system_message]))
+    await app.soul._context.flush()
 
 
 @meta_command(aliases=["reset"], kimi_soul_only=True)
@@ -241,6 +245,8 @@ async def clear(app: ShellApp, args: list[str]):
         raise Reload()
 
     await app.soul._context.revert_to(0)
+    # the system prompt of the cleared context no longer needs to stay the same
+    app.soul._runtime.session.prompt_args_file.unlink(missing_ok=True)
     raise Reload()
 
 
@@ -272,4 +278,5 @@ from . import (  # noqa: E402
     debug,  # noqa: F401
     setup,  # noqa: F401
     update,  # noqa: F401
+    usage,  # noqa: F401
 )
@@ -45,9 +45,12 @@ from kimi_cli.share import get_share_dir
 from kimi_cli.soul import StatusSnapshot
 from kimi_cli.ui.shell.console import console
 from kimi_cli.ui.shell.metacmd import get_meta_commands
+from kimi_cli.ui.shell.visualize import format_status
 from kimi_cli.utils.clipboard import is_clipboard_available
 from kimi_cli.utils.logging import logger
+from kimi_cli.utils.path import is_ignored
 from kimi_cli.utils.string import random_string
+from kimi_cli.workspace import WorkspaceIndex
 
 PROMPT_SYMBOL = "✨"
 PROMPT_SYMBOL_SHELL = "$"
@@ -94,82 +97,13 @@ class MetaCommandCompleter(Completer):
 
 
 class FileMentionCompleter(Completer):
-    """Offer fuzzy `@` path completion by indexing workspace files."""
+    """
+    Offer fuzzy `@` path completion of workspace files, from the workspace file index once it
+    is ready, or by walking the work directory every `refresh_interval` seconds until then.
+    """
 
     _FRAGMENT_PATTERN = re.compile(r"[^\s@]+")
     _TRIGGER_GUARDS = frozenset((".", "-", "_", "`", "'", '"', ":", "@", "#", "~"))
-    _IGNORED_NAME_GROUPS: dict[str, tuple[str, ...]] = {
-        "vcs_metadata": (".DS_Store", ".bzr", ".git", ".hg", ".svn"),
-        "tooling_caches": (
-            ".build",
-            ".cache",
-            ".coverage",
-            ".fleet",
-            ".gradle",
-            ".idea",
-            ".ipynb_checkpoints",
-            ".pnpm-store",
-            ".pytest_cache",
-            ".pub-cache",
-            ".ruff_cache",
-            ".swiftpm",
-            ".tox",
-            ".venv",
-            ".vs",
-            ".vscode",
-            ".yarn",
-            ".yarn-cache",
-        ),
-        "js_frontend": (
-            ".next",
-            ".nuxt",
-            ".parcel-cache",
-            ".svelte-kit",
-            ".turbo",
-            ".vercel",
-            "node_modules",
-        ),
-        "python_packaging": (
-            "__pycache__",
-            "build",
-            "coverage",
-            "dist",
-            "htmlcov",
-            "pip-wheel-metadata",
-            "venv",
-        ),
-        "java_jvm": (".mvn", "out", "target"),
-        "dotnet_native": ("bin", "cmake-build-debug", "cmake-build-release", "obj"),
-        "bazel_buck": ("bazel-bin", "bazel-out", "bazel-testlogs", "buck-out"),
-        "misc_artifacts": (
-            ".dart_tool",
-            ".serverless",
-            ".stack-work",
-            ".terraform",
-            ".terragrunt-cache",
-            "DerivedData",
-            "Pods",
-            "deps",
-            "tmp",
-            "vendor",
-        ),
-    }
-    _IGNORED_NAMES = frozenset(name for group in _IGNORED_NAME_GROUPS.values() for name in group)
-    _IGNORED_PATTERN_PARTS: tuple[str, ...] = (
-        r".*_cache$",
-        r".*-cache$",
-        r".*\.egg-info$",
-        r".*\.dist-info$",
-        r".*\.py[co]$",
-        r".*\.class$",
-        r".*\.sw[po]$",
-        r".*~$",
-        r".*\.(?:tmp|bak)$",
-    )
-    _IGNORED_PATTERNS = re.compile(
-        "|".join(f"(?:{part})" for part in _IGNORED_PATTERN_PARTS),
-        re.IGNORECASE,
-    )
 
     def __init__(
         self,
@@ -177,8 +111,10 @@ class FileMentionCompleter(Completer):
         *,
         refresh_interval: float = 2.0,
         limit: int = 1000,
+        workspace: WorkspaceIndex | None = None,
     ) -> None:
         self._root = root
+        self._workspace = workspace
         self._refresh_interval = refresh_interval
         self._limit = limit
         self._cache_time: float = 0.0
@@ -199,20 +135,29 @@ class FileMentionCompleter(Completer):
             pattern=r"^[^\s@]*",
         )
 
-    @classmethod
-    def _is_ignored(cls, name: str) -> bool:
-        if not name:
-            return True
-        if name in cls._IGNORED_NAMES:
-            return True
-        return bool(cls._IGNORED_PATTERNS.fullmatch(name))
-
     def _get_paths(self) -> list[str]:
         fragment = self._fragment_hint or ""
-        if "/" not in fragment and len(fragment) < 3:
+        top_level = "/" not in fragment and len(fragment) < 3
+        if self._workspace is not None and self._workspace.covers(self._root):
+            return self._get_indexed_paths(self._workspace, fragment, top_level)
+        if top_level:
             return self._get_top_level_paths()
         return self._get_deep_paths()
 
+    def _get_indexed_paths(
+        self, workspace: WorkspaceIndex, fragment: str, top_level: bool
+    ) -> list[str]:
+        if top_level:
+            paths = workspace.list_dir(self._root)
+        else:
+            # candidates for the fragment, to be ranked by the fuzzy completer
+            paths = workspace.fuzzy(fragment, self._limit)
+            if self._root != workspace.root:
+                prefix = self._root.relative_to(workspace.root).as_posix() + "/"
+                paths = [path.removeprefix(prefix) for path in paths if path.startswith(prefix)]
+        paths = [path for path in paths if not is_ignored(path.rstrip("/").rpartition("/")[2])]
+        return paths[: self._limit]
+
     def _get_top_level_paths(self) -> list[str]:
         now = time.monotonic()
         if now - self._top_cache_time <= self._refresh_interval:
@@ -222,7 +167,7 @@ class FileMentionCompleter(Completer):
         try:
             for entry in sorted(self._root.iterdir(), key=lambda p: p.name):
                 name = entry.name
-                if self._is_ignored(name):
+                if is_ignored(name):
                     continue
                 entries.append(f"{name}/" if entry.is_dir() else name)
                 if len(entries) >= self._limit:
@@ -245,11 +190,9 @@ class FileMentionCompleter(Completer):
                 relative_root = Path(current_root).relative_to(self._root)
 
                 # Prevent descending into ignored directories.
-                dirs[:] = sorted(d for d in dirs if not self._is_ignored(d))
+                dirs[:] = sorted(d for d in dirs if not is_ignored(d))
 
-                if relative_root.parts and any(
-                    self._is_ignored(part) for part in relative_root.parts
-                ):
+                if relative_root.parts and any(is_ignored(part) for part in relative_root.parts):
                     dirs[:] = []
                     continue
 
@@ -259,7 +202,7 @@ class FileMentionCompleter(Completer):
                         break
 
                 for file_name in sorted(files):
-                    if self._is_ignored(file_name):
+                    if is_ignored(file_name):
                         continue
                     relative = (relative_root / file_name).as_posix()
                     if not relative:
@@ -470,6 +413,7 @@ class CustomPromptSession:
         status_provider: Callable[[], StatusSnapshot],
         model_capabilities: set[ModelCapability],
         initial_thinking: bool,
+        workspace: WorkspaceIndex | None = None,
     ) -> None:
         history_dir = get_share_dir() / "user-history"
         history_dir.mkdir(parents=True, exist_ok=True)
@@ -496,7 +440,7 @@ class CustomPromptSession:
         self._agent_mode_completer = merge_completers(
             [
                 MetaCommandCompleter(),
-                FileMentionCompleter(Path.cwd()),
+                FileMentionCompleter(Path.cwd(), workspace=workspace),
             ],
             deduplicate=True,
         )
@@ -760,7 +704,7 @@ class CustomPromptSession:
         columns -= len(mode) + 2
 
         status = self._status_provider()
-        status_text = self._format_status(status)
+        status_text = format_status(status)
 
         current_toast = _current_toast()
         if current_toast is not None:
@@ -786,8 +730,3 @@ class CustomPromptSession:
         fragments.append(("", status_text))
 
         return FormattedText(fragments)
-
-    @staticmethod
-    def _format_status(status: StatusSnapshot) -> str:
-        bounded = max(0.0, min(status.context_usage, 1.0))
-        return f"context: {bounded:.1%}"
@@ -10,14 +10,16 @@ from kosong.message import Message, TextPart
 from kosong.tooling import ToolError, ToolOk
 
 from kimi_cli.soul import StatusSnapshot
+from kimi_cli.soul.context import LAZY_RESTORE_TAIL_RUNS, is_checkpoint_message
+from kimi_cli.soul.message import without_current_time
 from kimi_cli.ui.shell.console import console
 from kimi_cli.ui.shell.prompt import PROMPT_SYMBOL
 from kimi_cli.ui.shell.visualize import visualize
-from kimi_cli.utils.message import message_extract_text, message_stringify
+from kimi_cli.utils.message import message_stringify
 from kimi_cli.wire import Wire
 from kimi_cli.wire.message import ContentPart, StepBegin, ToolCall, ToolResult
 
-MAX_REPLAY_RUNS = 5
+MAX_REPLAY_RUNS = LAZY_RESTORE_TAIL_RUNS
 
 type _ReplayEvent = StepBegin | ToolCall | ContentPart | ToolResult
 
@@ -43,7 +45,8 @@ async def replay_recent_history(history: Sequence[Message]) -> None:
 
     for run in runs:
         wire = Wire()
-        console.print(f"{getpass.getuser()}{PROMPT_SYMBOL} {message_stringify(run.user_message)}")
+        user_input = message_stringify(without_current_time(run.user_message))
+        console.print(f"{getpass.getuser()}{PROMPT_SYMBOL} {user_input}")
         ui_task = asyncio.create_task(
             visualize(wire.ui_side, initial_status=StatusSnapshot(context_usage=0.0))
         )
@@ -59,7 +62,7 @@ def _is_user_message(message: Message) -> bool:
     # FIXME: should consider non-text tool call results which are sent as user messages
     if message.role != "user":
         return False
-    return not message_extract_text(message).startswith("<system>CHECKPOINT")
+    return not is_checkpoint_message(message)
 
 
 def _find_replay_start(history: Sequence[Message]) -> int | None:
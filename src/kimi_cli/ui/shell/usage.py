@@ -0,0 +1,42 @@
+from __future__ import annotations
+
+import asyncio
+from typing import TYPE_CHECKING, get_args
+
+from rich.text import Text
+
+from kimi_cli.soul.kimisoul import KimiSoul
+from kimi_cli.ui.shell.console import console
+from kimi_cli.ui.shell.metacmd import meta_command
+from kimi_cli.usage import UsageGroup, aggregate_usage, format_usage, iter_usage_records
+
+if TYPE_CHECKING:
+    from kimi_cli.ui.shell import ShellApp
+
+
+@meta_command(kimi_soul_only=True)
+async def usage(app: ShellApp, args: list[str]):
+    """Show the token usage of this session and working directory, e.g. `/usage session`"""
+    assert isinstance(app.soul, KimiSoul)
+
+    groups: tuple[UsageGroup, ...] = get_args(UsageGroup)
+    by = args[0] if args else "model"
+    if by not in groups:
+        console.print(f"[red]Usage can be grouped by: {', '.join(groups)}[/red]")
+        return
+
+    session = app.soul._runtime.session
+    records = await asyncio.to_thread(
+        lambda: [r for r in iter_usage_records() if r.work_dir == str(session.work_dir)]
+    )
+    if not records:
+        console.print("[yellow]No usage recorded in this working directory yet.[/yellow]")
+        return
+
+    session_records = [r for r in records if r.session_id == session.id]
+    if session_records:
+        console.print("[bold]This session[/bold]")
+        console.print(Text(format_usage(aggregate_usage(session_records, by), by)))
+        console.print()
+    console.print("[bold]This working directory[/bold]")
+    console.print(Text(format_usage(aggregate_usage(records, by), by)))
@@ -31,6 +31,7 @@ from kimi_cli.wire.message import (
     StatusUpdate,
     StepBegin,
     StepInterrupted,
+    StepMetrics,
     SubagentEvent,
 )
 
@@ -270,7 +271,20 @@ class _StatusBlock:
         return self.text
 
     def update(self, status: StatusSnapshot) -> None:
-        self.text.plain = f"context: {status.context_usage:.1%}"
+        self.text.plain = format_status(status)
+
+
+def format_status(status: StatusSnapshot) -> str:
+    """Format the status snapshot into a short line, with LLM latency metrics if available."""
+    bounded = max(0.0, min(status.context_usage, 1.0))
+    parts = [f"context: {bounded:.1%}"]
+    if status.avg_time_to_first_token is not None:
+        parts.append(f"ttft: {status.avg_time_to_first_token:.1f}s")
+    if status.avg_tokens_per_second is not None:
+        parts.append(f"{status.avg_tokens_per_second:.0f} tok/s")
+    if status.cache_hit_rate is not None:
+        parts.append(f"cache: {status.cache_hit_rate:.0%}")
+    return "  ".join(parts)
 
 
 @asynccontextmanager
@@ -382,6 +396,8 @@ class _LiveView:
                 self.refresh_soon()
             case StatusUpdate(status=status):
                 self._status_block.update(status)
+            case StepMetrics():
+                pass  # aggregated into the status
             case ContentPart():
                 self.append_content(msg)
             case ToolCall():
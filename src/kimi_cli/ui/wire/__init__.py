@@ -31,6 +31,9 @@ from .jsonrpc import (
 
 _ResultKind = Literal["ok", "error"]
 
+SEND_QUEUE_SIZE = 256
+"""The maximum number of JSON-RPC messages waiting to be written to the client."""
+
 
 class _SoulRunner:
     def __init__(
@@ -116,7 +119,8 @@ class WireServer:
         self._reader: asyncio.StreamReader | None = None
         self._writer: asyncio.StreamWriter | None = None
         self._write_task: asyncio.Task[None] | None = None
-        self._send_queue: asyncio.Queue[dict[str, Any]] = asyncio.Queue()
+        # bounded, so that a slow client holds back the soul wire, where streamed parts coalesce
+        self._send_queue: asyncio.Queue[dict[str, Any]] = asyncio.Queue(SEND_QUEUE_SIZE)
         self._pending_requests: dict[str, ApprovalRequest] = {}
         self._runner = _SoulRunner(
             soul,
@@ -0,0 +1,232 @@
+from __future__ import annotations
+
+import asyncio
+import re
+import time
+from collections.abc import Callable, Iterable, Iterator
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import TYPE_CHECKING, Literal
+
+from pydantic import BaseModel, ValidationError
+
+from kimi_cli.share import get_share_dir
+from kimi_cli.utils.logging import logger
+from kimi_cli.utils.path import next_available_rotation
+
+if TYPE_CHECKING:
+    from kosong.chat_provider import TokenUsage
+
+MAX_LEDGER_FILE_SIZE = 4 << 20
+"""The size of the ledger file beyond which it is rotated, in bytes."""
+
+type UsageKind = Literal["step", "compaction"]
+
+UsageGroup = Literal["model", "session", "work_dir", "subagent", "kind", "day"]
+
+
+def get_usage_ledger_file() -> Path:
+    """Get the usage ledger file path."""
+    return get_share_dir() / "usage.jsonl"
+
+
+class UsageRecord(BaseModel):
+    """The token usage of one LLM call."""
+
+    time: float
+    """The UNIX timestamp of the end of the call."""
+    kind: UsageKind
+    """What the call was made for."""
+    model: str
+    """The model that served the call."""
+    session_id: str
+    """The session the call was made in."""
+    work_dir: str
+    """The work directory of the session."""
+    subagent: str | None = None
+    """The name of the subagent that made the call, `None` for the main agent."""
+    tool_call_id: str | None = None
+    """The tool call the call was made in, i.e. the `Task` tool call running the subagent."""
+    input_tokens: int
+    """The input tokens, including `cached_tokens`."""
+    cached_tokens: int = 0
+    """The input tokens read from the prompt cache."""
+    output_tokens: int
+    """The output tokens."""
+    wall_time: float
+    """The wall time of the call, in seconds."""
+
+
+class UsageLedger:
+    """
+    An append-only ledger of the token usage of LLM calls, shared by all sessions.
+    The ledger file is rotated once it grows beyond `MAX_LEDGER_FILE_SIZE`.
+    """
+
+    def __init__(
+        self,
+        file: Path,
+        *,
+        session_id: str,
+        work_dir: Path,
+        subagent: str | None = None,
+    ):
+        self._file = file
+        self._session_id = session_id
+        self._work_dir = str(work_dir)
+        self._subagent = subagent
+        self._lock = asyncio.Lock()
+
+    def for_subagent(self, name: str) -> UsageLedger:
+        """Get a ledger writing to the same file, tagging records with the subagent name."""
+        ledger = UsageLedger(
+            self._file, session_id=self._session_id, work_dir=Path(self._work_dir), subagent=name
+        )
+        ledger._lock = self._lock
+        return ledger
+
+    async def record(
+        self,
+        kind: UsageKind,
+        model: str,
+        usage: TokenUsage,
+        wall_time: float,
+        *,
+        tool_call_id: str | None = None,
+    ) -> None:
+        """Append the usage of an LLM call to the ledger. Failures are logged, not raised."""
+        record = UsageRecord(
+            time=time.time(),
+            kind=kind,
+            model=model,
+            session_id=self._session_id,
+            work_dir=self._work_dir,
+            subagent=self._subagent,
+            tool_call_id=tool_call_id,
+            input_tokens=usage.input,
+            cached_tokens=usage.input_cache_read,
+            output_tokens=usage.output,
+            wall_time=wall_time,
+        )
+        line = record.model_dump_json(exclude_none=True) + "\n"
+        try:
+            async with self._lock:
+                await asyncio.to_thread(self._append, line)
+                if self._file.stat().st_size > MAX_LEDGER_FILE_SIZE:
+                    await self._rotate()
+        except OSError as e:
+            logger.warning("Failed to record usage to {file}: {error}", file=self._file, error=e)
+
+    def _append(self, line: str) -> None:
+        with open(self._file, "a", encoding="utf-8") as f:
+            f.write(line)
+
+    async def _rotate(self) -> None:
+        rotated = await next_available_rotation(self._file)
+        if rotated is None:
+            return
+        logger.info("Rotating usage ledger to {file}", file=rotated)
+        self._file.replace(rotated)
+
+
+def iter_usage_records(file: Path | None = None) -> Iterator[UsageRecord]:
+    """
+    Iterate over the usage records in a ledger file and its rotated files, oldest first.
+    Invalid lines are skipped.
+
+    Args:
+        file (Path | None): The ledger file. If None, use the default path.
+    """
+    file = file or get_usage_ledger_file()
+    pattern = re.compile(rf"^{re.escape(file.stem)}_(\d+){re.escape(file.suffix)}$")
+    rotated: list[tuple[int, Path]] = []
+    if file.parent.is_dir():
+        for path in file.parent.iterdir():
+            if match := pattern.match(path.name):
+                rotated.append((int(match.group(1)), path))
+    for path in [*(path for _, path in sorted(rotated)), file]:
+        if not path.is_file():
+            continue
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    yield UsageRecord.model_validate_json(line)
+                except ValidationError:
+                    logger.warning("Skipping invalid usage record in {file}", file=path)
+
+
+@dataclass(slots=True)
+class UsageTotals:
+    """The total usage of a group of LLM calls."""
+
+    n_calls: int = 0
+    input_tokens: int = 0
+    cached_tokens: int = 0
+    output_tokens: int = 0
+    wall_time: float = 0.0
+
+    def add(self, record: UsageRecord) -> None:
+        self.n_calls += 1
+        self.input_tokens += record.input_tokens
+        self.cached_tokens += record.cached_tokens
+        self.output_tokens += record.output_tokens
+        self.wall_time += record.wall_time
+
+    def merge(self, other: UsageTotals) -> None:
+        self.n_calls += other.n_calls
+        self.input_tokens += other.input_tokens
+        self.cached_tokens += other.cached_tokens
+        self.output_tokens += other.output_tokens
+        self.wall_time += other.wall_time
+
+
+_GROUP_KEYS: dict[UsageGroup, Callable[[UsageRecord], str]] = {
+    "model": lambda record: record.model,
+    "session": lambda record: record.session_id,
+    "work_dir": lambda record: record.work_dir,
+    "subagent": lambda record: record.subagent or "(main)",
+    "kind": lambda record: record.kind,
+    "day": lambda record: datetime.fromtimestamp(record.time).date().isoformat(),
+}
+
+
+def aggregate_usage(records: Iterable[UsageRecord], by: UsageGroup) -> dict[str, UsageTotals]:
+    """Sum up the usage records by the given group, in order of first appearance."""
+    key = _GROUP_KEYS[by]
+    totals: dict[str, UsageTotals] = {}
+    for record in records:
+        totals.setdefault(key(record), UsageTotals()).add(record)
+    return totals
+
+
+def format_usage(totals: dict[str, UsageTotals], by: UsageGroup) -> str:
+    """Format aggregated usage as a plain text table, with a total row if there are several."""
+    if len(totals) > 1:
+        total = UsageTotals()
+        for group in totals.values():
+            total.merge(group)
+        totals = {**totals, "total": total}
+
+    rows = [(by, "calls", "input", "cached", "output", "time")]
+    rows.extend(
+        (
+            name,
+            f"{group.n_calls:,}",
+            f"{group.input_tokens:,}",
+            f"{group.cached_tokens:,}",
+            f"{group.output_tokens:,}",
+            f"{group.wall_time:,.1f}s",
+        )
+        for name, group in totals.items()
+    )
+    widths = [max(len(row[i]) for row in rows) for i in range(len(rows[0]))]
+    return "\n".join(
+        "  ".join(
+            cell.ljust(width) if i == 0 else cell.rjust(width)
+            for i, (cell, width) in enumerate(zip(row, widths, strict=True))
+        )
+        for row in rows
+    )
@@ -0,0 +1,126 @@
+from __future__ import annotations
+
+import os
+import re
+from collections.abc import Sequence
+from dataclasses import dataclass
+from pathlib import Path
+
+
+@dataclass(frozen=True, slots=True)
+class _Rule:
+    regex: re.Pattern[str]
+    negated: bool
+    dir_only: bool
+
+
+class GitIgnore:
+    """
+    Match paths against the `.gitignore` files of the directories from a top directory down to
+    them. Each `.gitignore` file is read once, when first needed.
+
+    Extra patterns apply as if they came first in the `.gitignore` file of the top directory.
+    """
+
+    def __init__(self, top: Path, patterns: Sequence[str] = ()):
+        self._top = str(top)
+        self._patterns = [rule for pattern in patterns if (rule := _parse_rule(pattern))]
+        self._rules: dict[str, list[_Rule]] = {}
+
+    def is_ignored(self, path: str, *, is_dir: bool) -> bool:
+        """
+        Whether a path under the top directory is ignored. Its ancestors are not checked, as
+        walks prune ignored directories anyway.
+
+        Args:
+            path (str): An absolute path under the top directory.
+            is_dir (bool): Whether the path is a directory.
+        """
+        parts = os.path.relpath(path, self._top).split(os.sep)
+        if parts[0] == "..":
+            return False
+        ignored = False
+        directory = self._top
+        for depth in range(len(parts)):
+            if rules := self._load(directory):
+                rel_path = "/".join(parts[depth:])
+                for rule in rules:
+                    if rule.dir_only and not is_dir:
+                        continue
+                    if rule.regex.fullmatch(rel_path):
+                        ignored = not rule.negated
+            directory = os.path.join(directory, parts[depth])
+        return ignored
+
+    def forget(self, directory: str) -> None:
+        """Forget the rules read from the `.gitignore` file of a directory, after it changed."""
+        self._rules.pop(directory, None)
+
+    def _load(self, directory: str) -> list[_Rule]:
+        rules = self._rules.get(directory)
+        if rules is None:
+            rules = list(self._patterns) if directory == self._top else []
+            try:
+                with open(os.path.join(directory, ".gitignore"), encoding="utf-8") as f:
+                    rules.extend(rule for line in f if (rule := _parse_rule(line)))
+            except (OSError, UnicodeDecodeError):
+                pass
+            self._rules[directory] = rules
+        return rules
+
+
+def _parse_rule(line: str) -> _Rule | None:
+    line = line.rstrip("\r\n")
+    if not line.strip() or line.startswith("#"):
+        return None
+    if not line.endswith("\\ "):
+        line = line.rstrip(" ")
+    negated = line.startswith("!")
+    if negated or line.startswith("\\"):
+        line = line[1:]
+    dir_only = line.endswith("/")
+    line = line.rstrip("/")
+    if not line:
+        return None
+    # a pattern with a slash is relative to the directory of the `.gitignore` file
+    anchored = "/" in line
+    regex = translate(line.lstrip("/"))
+    if not anchored:
+        regex = "(?:.*/)?" + regex
+    try:
+        return _Rule(re.compile(regex), negated, dir_only)
+    except re.error:
+        return None
+
+
+def translate(pattern: str) -> str:
+    """Translate a `.gitignore` pattern to a regular expression."""
+    parts: list[str] = []
+    i = 0
+    n = len(pattern)
+    while i < n:
+        if pattern.startswith("**/", i):
+            parts.append("(?:.*/)?")
+            i += 3
+        elif pattern.startswith("**", i):
+            parts.append(".*")
+            i += 2
+        elif pattern[i] == "*":
+            parts.append("[^/]*")
+            i += 1
+        elif pattern[i] == "?":
+            parts.append("[^/]")
+            i += 1
+        elif pattern[i] == "[" and (end := pattern.find("]", i + 2)) != -1:
+            content = pattern[i + 1 : end]
+            if content[0] in "!^":
+                content = "^" + content[1:]
+            parts.append(f"[{content.replace('\\', '\\\\')}]")
+            i = end + 1
+        elif pattern[i] == "\\" and i + 1 < n:
+            parts.append(re.escape(pattern[i + 1]))
+            i += 2
+        else:
+            parts.append(re.escape(pattern[i]))
+            i += 1
+    return "".join(parts)
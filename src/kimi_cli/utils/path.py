@@ -3,6 +3,7 @@ from __future__ import annotations
 import asyncio
 import os
 import re
+from collections.abc import Callable, Iterator
 from pathlib import Path
 
 import aiofiles.os
@@ -50,3 +51,136 @@ async def next_available_rotation(path: Path) -> Path | None:
         if await _reserve_rotation_path(next_path):
             return next_path
         next_num += 1
+
+
+def paths_overlap(a: str, b: str) -> bool:
+    """Whether two normalized absolute paths are the same, or one is an ancestor of the other."""
+    return (
+        a == b or a.startswith(b.rstrip(os.sep) + os.sep) or b.startswith(a.rstrip(os.sep) + os.sep)
+    )
+
+
+def expand_braces(pattern: str) -> list[str]:
+    """Expand the brace alternatives of a glob pattern, e.g. `*.{js,ts}` to `*.js` and `*.ts`."""
+    match = re.search(r"\{([^{}]*)\}", pattern)
+    if not match:
+        return [pattern]
+    return [
+        expanded
+        for option in match.group(1).split(",")
+        for expanded in expand_braces(pattern[: match.start()] + option + pattern[match.end() :])
+    ]
+
+
+_IGNORED_NAME_GROUPS: dict[str, tuple[str, ...]] = {
+    "vcs_metadata": (".DS_Store", ".bzr", ".git", ".hg", ".svn"),
+    "tooling_caches": (
+        ".build",
+        ".cache",
+        ".coverage",
+        ".fleet",
+        ".gradle",
+        ".idea",
+        ".ipynb_checkpoints",
+        ".pnpm-store",
+        ".pytest_cache",
+        ".pub-cache",
+        ".ruff_cache",
+        ".swiftpm",
+        ".tox",
+        ".venv",
+        ".vs",
+        ".vscode",
+        ".yarn",
+        ".yarn-cache",
+    ),
+    "js_frontend": (
+        ".next",
+        ".nuxt",
+        ".parcel-cache",
+        ".svelte-kit",
+        ".turbo",
+        ".vercel",
+        "node_modules",
+    ),
+    "python_packaging": (
+        "__pycache__",
+        "build",
+        "coverage",
+        "dist",
+        "htmlcov",
+        "pip-wheel-metadata",
+        "venv",
+    ),
+    "java_jvm": (".mvn", "out", "target"),
+    "dotnet_native": ("bin", "cmake-build-debug", "cmake-build-release", "obj"),
+    "bazel_buck": ("bazel-bin", "bazel-out", "bazel-testlogs", "buck-out"),
+    "misc_artifacts": (
+        ".dart_tool",
+        ".serverless",
+        ".stack-work",
+        ".terraform",
+        ".terragrunt-cache",
+        "DerivedData",
+        "Pods",
+        "deps",
+        "tmp",
+        "vendor",
+    ),
+}
+_IGNORED_NAMES = frozenset(name for group in _IGNORED_NAME_GROUPS.values() for name in group)
+_IGNORED_PATTERN_PARTS: tuple[str, ...] = (
+    r".*_cache$",
+    r".*-cache$",
+    r".*\.egg-info$",
+    r".*\.dist-info$",
+    r".*\.py[co]$",
+    r".*\.class$",
+    r".*\.sw[po]$",
+    r".*~$",
+    r".*\.(?:tmp|bak)$",
+)
+_IGNORED_PATTERNS = re.compile(
+    "|".join(f"(?:{part})" for part in _IGNORED_PATTERN_PARTS),
+    re.IGNORECASE,
+)
+
+
+def is_ignored(name: str) -> bool:
+    """Whether a file or directory name is VCS metadata, a cache or a build artifact."""
+    if not name:
+        return True
+    if name in _IGNORED_NAMES:
+        return True
+    return bool(_IGNORED_PATTERNS.fullmatch(name))
+
+
+def walk_files(
+    root: Path, prune: Callable[[os.DirEntry[str]], bool] | None = None
+) -> Iterator[os.DirEntry[str]]:
+    """
+    Walk the files under a directory, skipping the names that are `is_ignored`, without
+    following symlinks to directories. Unreadable directories are skipped.
+
+    Args:
+        root (Path): The directory to walk.
+        prune (Callable[[os.DirEntry[str]], bool] | None): Whether not to descend into a
+            directory, besides the `is_ignored` ones.
+    """
+    stack = [root]
+    while stack:
+        try:
+            with os.scandir(stack.pop()) as entries:
+                for entry in entries:
+                    if is_ignored(entry.name):
+                        continue
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            if prune is None or not prune(entry):
+                                stack.append(Path(entry.path))
+                        elif entry.is_file():
+                            yield entry
+                    except OSError:
+                        continue
+        except OSError:
+            continue
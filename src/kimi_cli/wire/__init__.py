@@ -1,9 +1,11 @@
 from __future__ import annotations
 
 import asyncio
+import copy
+from collections import deque
 from typing import TYPE_CHECKING
 
-from kosong.message import ContentPart, ToolCallPart
+from kosong.message import ContentPart, MergeableMixin, ToolCallPart
 
 from kimi_cli.utils.logging import logger
 
@@ -14,14 +16,17 @@ if TYPE_CHECKING:
 type WireMessage = Event | ApprovalRequest
 """Any message sent over the `Wire`."""
 
+DEFAULT_COALESCE_THRESHOLD = 64
+"""The number of pending messages above which streamed parts are merged into pending ones."""
+
 
 class Wire:
     """
     A channel for communication between the soul and the UI during a soul run.
     """
 
-    def __init__(self):
-        self._queue = asyncio.Queue[WireMessage]()
+    def __init__(self, *, coalesce_threshold: int = DEFAULT_COALESCE_THRESHOLD):
+        self._queue = _CoalescingQueue(coalesce_threshold)
         self._soul_side = WireSoulSide(self._queue)
         self._ui_side = WireUISide(self._queue)
 
@@ -80,3 +85,47 @@ class WireUISide:
         if not isinstance(msg, ContentPart | ToolCallPart):
             logger.debug("Receiving wire message: {msg}", msg=msg)
         return msg
+
+
+class _CoalescingQueue(asyncio.Queue["WireMessage"]):
+    """
+    A queue that keeps its size bounded when the consumer falls behind, by merging streamed
+    message parts (text and think deltas, tool call argument deltas) into the last pending
+    message with `MergeableMixin.merge_in_place`. Other messages, like control flow events
+    and approval requests, are never merged or dropped.
+    """
+
+    def __init__(self, coalesce_threshold: int):
+        super().__init__()
+        self._coalesce_threshold = coalesce_threshold
+
+    # the storage hooks of `asyncio.Queue`, as overridden by `asyncio.LifoQueue` etc.
+
+    def _init(self, maxsize: int) -> None:
+        self._items = deque["WireMessage"]()
+        self._owns_last = False
+        """Whether the last item is a copy made for merging, which can be merged in place."""
+
+    def _put(self, item: WireMessage) -> None:
+        if (
+            len(self._items) >= self._coalesce_threshold
+            and isinstance(item, MergeableMixin)
+            and isinstance(last := self._items[-1], MergeableMixin)
+        ):
+            # the sender may still hold the pending message, so merge into a copy
+            merged = last if self._owns_last else copy.deepcopy(last)
+            if merged.merge_in_place(item):
+                self._items[-1] = merged
+                self._owns_last = True
+                return
+        self._items.append(item)
+        self._owns_last = False
+
+    def _get(self) -> WireMessage:
+        return self._items.popleft()
+
+    def qsize(self) -> int:
+        return len(self._items)
+
+    def empty(self) -> bool:
+        return not self._items
@@ -3,6 +3,7 @@ from __future__ import annotations
 import asyncio
 import uuid
 from collections.abc import Sequence
+from dataclasses import asdict
 from enum import Enum
 from typing import Any
 
@@ -54,6 +55,32 @@ class StatusUpdate(BaseModel):
     """The snapshot of the current soul status."""
 
 
+class StepMetrics(BaseModel):
+    """
+    The timings and token usage of an agent step, sent after the step has grown the context.
+    All times are in seconds.
+    """
+
+    llm_time: float
+    """The time from sending the LLM request to the end of the response."""
+    time_to_first_token: float | None = None
+    """The time from sending the LLM request to the first streamed message part."""
+    input_tokens: int | None = None
+    """The input tokens of the request, if reported by the provider."""
+    cached_tokens: int | None = None
+    """The input tokens read from the prompt cache, if reported by the provider."""
+    output_tokens: int | None = None
+    """The output tokens of the response, if reported by the provider."""
+    tokens_per_second: float | None = None
+    """The output tokens per second after the first message part."""
+    tool_times: dict[str, float] = Field(default_factory=dict[str, float])
+    """The time of each tool call by ID, from its arguments being complete to its result."""
+    context_time: float = 0.0
+    """The time spent on reading and growing the context."""
+    compaction_time: float | None = None
+    """The time spent on compacting the context before the step, if compacted."""
+
+
 class SubagentEvent(BaseModel):
     task_tool_call_id: str
     """The ID of the task tool call associated with this subagent."""
@@ -63,7 +90,15 @@ class SubagentEvent(BaseModel):
 
 type ControlFlowEvent = StepBegin | StepInterrupted | CompactionBegin | CompactionEnd | StatusUpdate
 """Any control flow event."""
-type Event = ControlFlowEvent | ContentPart | ToolCall | ToolCallPart | ToolResult | SubagentEvent
+type Event = (
+    ControlFlowEvent
+    | StepMetrics
+    | ContentPart
+    | ToolCall
+    | ToolCallPart
+    | ToolResult
+    | SubagentEvent
+)
 """Any event, including control flow and content/tooling events."""
 
 
@@ -122,7 +157,14 @@ def serialize_event(event: Event) -> dict[str, Any]:
         case StatusUpdate():
             return {
                 "type": "status_update",
-                "payload": {"context_usage": event.status.context_usage},
+                "payload": {
+                    key: value for key, value in asdict(event.status).items() if value is not None
+                },
+            }
+        case StepMetrics():
+            return {
+                "type": "step_metrics",
+                "payload": event.model_dump(mode="json", exclude_none=True),
             }
         case ContentPart():
             return {
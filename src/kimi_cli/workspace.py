@@ -0,0 +1,804 @@
+"""
+An in-memory index of the paths in a work directory, shared by `Glob`, `Grep`, the `@` file
+mention completion and the system prompt, instead of each of them walking the directory.
+
+The index is built in the background, and kept up to date by watching the directories with
+inotify on Linux, or by polling their modification times elsewhere. Directories that are
+`is_ignored`, ignored by `.gitignore` files or by the `workspace.ignore` config are listed but
+not descended into, like `Glob` does when walking the disk.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import ctypes
+import ctypes.util
+import errno
+import heapq
+import os
+import re
+import struct
+import sys
+from bisect import bisect_left
+from collections import Counter
+from collections.abc import Callable, Iterator, Sequence, Set
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Literal
+
+from kimi_cli.utils.gitignore import GitIgnore, translate
+from kimi_cli.utils.logging import logger
+from kimi_cli.utils.path import expand_braces, is_ignored
+
+MAX_INDEXED_PATHS = 200_000
+"""The number of paths beyond which the index gives up, and its consumers walk the disk."""
+
+POLL_INTERVAL = 2.0
+"""The interval between checks of the directories for changes without inotify, in seconds."""
+
+DEBOUNCE_INTERVAL = 0.05
+"""The delay before applying file system events, to batch the events of bulk operations."""
+
+_FILE = 0
+_DIR = 1
+_PRUNED = 2
+"""A directory that is ignored, thus not descended into."""
+_LINK = 3
+"""A symlink to a directory, not descended into to avoid cycles."""
+
+type _State = Literal["new", "building", "ready", "incomplete", "closed"]
+
+
+@dataclass(slots=True)
+class _Dir:
+    mtime_ns: int
+    gitignore_mtime_ns: int
+    """The modification time of the `.gitignore` file in the directory, 0 if there is none."""
+    entries: dict[str, int]
+    """The kinds of the entries, by name."""
+
+
+class _TooManyPaths(Exception):
+    pass
+
+
+class WorkspaceIndex:
+    """
+    An index of the paths under a root directory. Queries are answered from memory once the
+    index is `ready`; until then, or if the tree turns out to have more than `max_paths` paths,
+    callers are expected to walk the disk themselves.
+    """
+
+    def __init__(
+        self,
+        root: Path,
+        *,
+        ignore: Sequence[str] = (),
+        max_paths: int = MAX_INDEXED_PATHS,
+        poll_interval: float = POLL_INTERVAL,
+        watch: bool = True,
+    ):
+        """
+        Args:
+            root (Path): The absolute path of the directory to index.
+            ignore (Sequence[str]): Extra patterns in the `.gitignore` format of the
+                directories not to descend into.
+            max_paths (int): The number of paths beyond which to give up.
+            poll_interval (float): The interval between checks for changes without inotify.
+            watch (bool): Whether to use inotify when available, instead of polling.
+        """
+        self._root = Path(os.path.normpath(root))
+        self._root_str = str(self._root)
+        self._ignore = list(ignore)
+        self._gitignore = GitIgnore(self._root, self._ignore)
+        self._max_paths = max_paths
+        self._poll_interval = poll_interval
+        self._watch_enabled = watch
+
+        self._state: _State = "new"
+        self._dirs: dict[str, _Dir] = {}
+        self._n_paths = 0
+        self._pruned_names: Counter[str] = Counter()
+        """The names of the directories not descended into, to tell when to walk the disk."""
+        self._n_links = 0
+        self._version = 0
+        self._paths: list[str] = []
+        self._paths_version = -1
+
+        self._lock = asyncio.Lock()
+        self._built = asyncio.Event()
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task[None] | None = None
+        self._inotify: _Inotify | None = None
+        self._wd_dirs: dict[int, str] = {}
+        self._dir_wds: dict[str, int] = {}
+        self._watch_failed = False
+        self._dirty: set[str] = set()
+        self._deep_dirty: set[str] = set()
+        """Directories to rescan with their subdirectories, e.g. after `.gitignore` changed."""
+        self._rescan_all = False
+
+    @property
+    def root(self) -> Path:
+        return self._root
+
+    @property
+    def ready(self) -> bool:
+        """Whether the index is built and complete, so that queries can be answered from it."""
+        return self._state == "ready"
+
+    async def start(self, *, build: bool = True) -> None:
+        """
+        Scan the top level of the root, then build the rest of the index and keep it up to
+        date in the background.
+
+        Args:
+            build (bool): Whether to build the rest of the index. If False, only the top level
+                is scanned, once, for `list_dir`.
+        """
+        if self._state != "new":
+            return
+        self._state = "building"
+        if build and self._watch_enabled:
+            self._inotify = _Inotify.create()
+        try:
+            scan = await asyncio.to_thread(self._scan, [""], known=None, budget=self._max_paths)
+        except _TooManyPaths:
+            self._give_up_too_many_paths()
+            self._built.set()
+            return
+        self._apply(scan, [""])
+        if not build:
+            self._give_up()
+            self._built.set()
+            return
+        self._task = asyncio.create_task(self._run())
+
+    async def wait_ready(self) -> bool:
+        """Wait until the index is built or given up on, and return whether it is `ready`."""
+        await self._built.wait()
+        return self.ready
+
+    async def sync(self) -> None:
+        """
+        Apply the pending changes to the index now, e.g. before answering a tool call right
+        after files were written.
+        """
+        if not self.ready:
+            return
+        async with self._lock:
+            if self.ready:
+                await self._refresh()
+
+    async def aclose(self) -> None:
+        """Stop keeping the index up to date."""
+        self._state = "closed"
+        if self._task is not None:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+        self._close_inotify()
+        self._built.set()
+
+    def covers(self, path: Path) -> bool:
+        """Whether the index is ready, and a directory is in it and descended into."""
+        return self.ready and self._rel(path) in self._dirs
+
+    def prunes(self, path: str) -> bool:
+        """
+        Whether a directory is not to be descended into, being `is_ignored`, or ignored by the
+        `.gitignore` files or the `workspace.ignore` config. Symlinks are not checked.
+
+        Args:
+            path (str): An absolute path of a directory.
+        """
+        return is_ignored(os.path.basename(path)) or self._gitignore.is_ignored(path, is_dir=True)
+
+    def excludes(self, path: str) -> bool:
+        """
+        Whether a file under the root is left out of searches, being in a directory that
+        `prunes`, or ignored by the `.gitignore` files or the `workspace.ignore` config.
+
+        Args:
+            path (str): An absolute path of a file.
+        """
+        parts = os.path.relpath(path, self._root_str).split(os.sep)
+        if parts[0] == "..":
+            return False
+        directory = self._root_str
+        for part in parts[:-1]:
+            directory = os.path.join(directory, part)
+            if self.prunes(directory):
+                return True
+        return self._gitignore.is_ignored(path, is_dir=False)
+
+    def list_dir(self, path: Path) -> list[str]:
+        """
+        List a directory in the index, sorted by name, with a trailing `/` for directories.
+        Only the root is listed before the index is ready.
+        """
+        rel = self._rel(path)
+        if rel is None or (rel and not self.ready) or (directory := self._dirs.get(rel)) is None:
+            return []
+        return sorted(
+            f"{name}/" if kind != _FILE else name for name, kind in directory.entries.items()
+        )
+
+    def paths(self) -> list[str]:
+        """
+        Get all the paths in the index, relative to the root and sorted, with a trailing `/`
+        for directories. The list is shared, and must not be modified.
+        """
+        if self._paths_version != self._version:
+            paths: list[str] = []
+            for rel, directory in self._dirs.items():
+                prefix = f"{rel}/" if rel else ""
+                paths.extend(
+                    f"{prefix}{name}/" if kind != _FILE else prefix + name
+                    for name, kind in directory.entries.items()
+                )
+            paths.sort()
+            self._paths = paths
+            self._paths_version = self._version
+        return self._paths
+
+    def files(self, under: Path) -> list[str] | None:
+        """
+        Get the files under a directory, relative to it and sorted, or `None` if the index
+        does not cover the directory.
+        """
+        rel = self._rel(under)
+        if not self.ready or rel is None or rel not in self._dirs:
+            return None
+        paths = self.paths()
+        lo, hi = _prefix_range(paths, f"{rel}/" if rel else "")
+        n_prefix = len(rel) + 1 if rel else 0
+        return [path[n_prefix:] for path in paths[lo:hi] if not path.endswith("/")]
+
+    def prefix(self, prefix: str, limit: int) -> list[str]:
+        """Get at most `limit` paths starting with a prefix, sorted."""
+        paths = self.paths()
+        lo, hi = _prefix_range(paths, prefix)
+        return paths[lo : min(hi, lo + limit)]
+
+    def fuzzy(self, query: str, limit: int) -> list[str]:
+        """
+        Get at most `limit` paths containing the characters of a query in order, ignoring case.
+        Paths matching in the last component come first, then those matching in a shorter span,
+        then the shorter paths.
+        """
+        if not query:
+            return self.prefix("", limit)
+        regex = re.compile(".*?".join(map(re.escape, query)), re.IGNORECASE)
+        scored: list[tuple[bool, int, int, str]] = []
+        for path in self.paths():
+            match = regex.search(path)
+            if match is None:
+                continue
+            name_start = path.rfind("/", 0, len(path) - 1) + 1
+            scored.append(
+                (match.start() < name_start, match.end() - match.start(), len(path), path)
+            )
+        return [path for *_, path in heapq.nsmallest(limit, scored)]
+
+    def glob(self, pattern: str, under: Path, *, include_dirs: bool = True) -> Iterator[str] | None:
+        """
+        Match a glob pattern against the paths under a directory, like `Glob` does on the
+        disk, yielding the paths relative to the directory.
+
+        Returns `None` if the index cannot answer for the pattern, e.g. when the directory is
+        not covered, or the pattern names a directory the index does not descend into.
+        """
+        rel = self._rel(under)
+        if not self.ready or rel is None or rel not in self._dirs:
+            return None
+        matchers: list[_GlobMatcher] = []
+        for expanded in expand_braces(pattern):
+            matcher = self._glob_matcher(expanded, rel)
+            if matcher is None:
+                return None
+            if matcher is not _NO_MATCH:
+                matchers.append(matcher)
+        # a trailing `**` only matches the directories descended into
+        dirs = (
+            frozenset(self._dirs) if any(m.descended_only for m in matchers) else frozenset[str]()
+        )
+        return self._iter_glob(self.paths(), matchers, rel, include_dirs, dirs)
+
+    def _glob_matcher(self, pattern: str, under: str) -> _GlobMatcher | None:
+        dirs_only = pattern.endswith("/")
+        segments: list[str] = []
+        for segment in pattern.split("/"):
+            if segment and segment != "." and not (segment == "**" and segments[-1:] == ["**"]):
+                segments.append(segment)
+        if not segments:
+            return _NO_MATCH
+        if ".." in segments:
+            return None
+
+        # the leading literal directories narrow down the paths to match
+        base = under
+        i = 0
+        while i < len(segments) - 1 and not _is_wildcard(segments[i]):
+            parent = self._dirs[base]
+            base = f"{base}/{segments[i]}" if base else segments[i]
+            i += 1
+            if base not in self._dirs:
+                # there is nothing to match if the directory does not exist
+                kind = parent.entries.get(segments[i - 1], _FILE)
+                return _NO_MATCH if kind == _FILE and os.name != "nt" else None
+        for j in range(i, len(segments) - 1):
+            segment = segments[j]
+            # walks on the disk descend into directories named explicitly, and follow symlinks
+            # for wildcards other than `**`
+            if not _is_wildcard(segment) and self._pruned_names[segment]:
+                return None
+            if segment != "**" and _is_wildcard(segment) and self._n_links:
+                return None
+
+        regex = ""
+        for j, segment in enumerate(segments):
+            last = j == len(segments) - 1
+            if segment == "**" and last:
+                # the directory matched so far, and all the directories under it
+                regex = f"{regex[:-1]}(?:/[^/]+)*" if regex else "[^/]+(?:/[^/]+)*"
+            elif segment == "**":
+                regex += "(?:[^/]+/)*"
+            else:
+                regex += translate(segment.replace("**", "*")) + ("" if last else "/")
+        flags = re.IGNORECASE if os.name == "nt" else 0
+        return _GlobMatcher(
+            re.compile(regex, flags),
+            base=base,
+            dirs_only=dirs_only,
+            descended_only=segments[-1] == "**",
+        )
+
+    @staticmethod
+    def _iter_glob(
+        paths: list[str],
+        matchers: list[_GlobMatcher],
+        under: str,
+        include_dirs: bool,
+        dirs: Set[str],
+    ) -> Iterator[str]:
+        n_under = len(under) + 1 if under else 0
+        seen: set[str] = set()
+        for matcher in matchers:
+            lo, hi = _prefix_range(paths, f"{matcher.base}/" if matcher.base else "")
+            for path in paths[lo:hi]:
+                is_dir = path.endswith("/")
+                if (is_dir and not include_dirs) or (
+                    not is_dir and (matcher.dirs_only or matcher.descended_only)
+                ):
+                    continue
+                rel_path = path[n_under : -1 if is_dir else None]
+                if not rel_path or rel_path in seen or not matcher.regex.fullmatch(rel_path):
+                    continue
+                if matcher.descended_only and path[:-1] not in dirs:
+                    continue
+                seen.add(rel_path)
+                yield rel_path if os.sep == "/" else rel_path.replace("/", os.sep)
+
+    def _rel(self, path: Path) -> str | None:
+        path_str = os.path.normpath(path)
+        if path_str == self._root_str:
+            return ""
+        if not path_str.startswith(os.path.join(self._root_str, "")):
+            return None
+        rel = path_str[len(os.path.join(self._root_str, "")) :]
+        return rel if os.sep == "/" else rel.replace(os.sep, "/")
+
+    def _abspath(self, rel: str) -> str:
+        return os.path.join(self._root_str, *rel.split("/")) if rel else self._root_str
+
+    async def _run(self) -> None:
+        try:
+            async with self._lock:
+                top = self._dirs.get("")
+                subdirs = [
+                    name for name, kind in (top.entries.items() if top else ()) if kind == _DIR
+                ]
+                scan = await asyncio.to_thread(
+                    self._scan, subdirs, known=set(), budget=self._max_paths - self._n_paths
+                )
+                self._apply(scan, subdirs)
+                self._check_watches()
+            self._state = "ready"
+            self._built.set()
+            logger.info(
+                "Indexed {n_paths} paths in {root}, {mode} for changes",
+                n_paths=self._n_paths,
+                root=self._root,
+                mode="watching" if self._inotify else "polling",
+            )
+            if self._inotify is not None:
+                asyncio.get_running_loop().add_reader(self._inotify.fd, self._on_events)
+
+            while True:
+                if self._inotify is not None:
+                    await self._wakeup.wait()
+                    await asyncio.sleep(DEBOUNCE_INTERVAL)
+                else:
+                    await asyncio.sleep(self._poll_interval)
+                async with self._lock:
+                    await self._refresh()
+                if not self.ready:
+                    break
+        except _TooManyPaths:
+            self._give_up_too_many_paths()
+        except Exception as e:
+            logger.warning("Failed to index {root}: {error}", root=self._root, error=e)
+            self._give_up()
+        finally:
+            self._built.set()
+
+    def _give_up_too_many_paths(self) -> None:
+        logger.info(
+            "More than {max_paths} paths in {root}, not indexing them",
+            max_paths=self._max_paths,
+            root=self._root,
+        )
+        self._give_up()
+
+    def _give_up(self) -> None:
+        self._state = "incomplete"
+        self._wakeup.set()
+        self._close_inotify()
+        # keep the top level for `list_dir`
+        top = self._dirs.get("")
+        self._dirs = {"": top} if top else {}
+        self._version += 1
+        self._paths = []
+
+    def _close_inotify(self) -> None:
+        if self._inotify is None:
+            return
+        with contextlib.suppress(RuntimeError):  # the loop is closed
+            asyncio.get_running_loop().remove_reader(self._inotify.fd)
+        self._inotify.close()
+        self._inotify = None
+        self._wd_dirs.clear()
+        self._dir_wds.clear()
+
+    def _check_watches(self) -> None:
+        if self._watch_failed and self._inotify is not None:
+            logger.info(
+                "Failed to watch all the directories in {root}, polling for changes instead",
+                root=self._root,
+            )
+            self._close_inotify()
+
+    def _on_events(self) -> None:
+        if self._inotify is not None:
+            self._handle_events(self._inotify.read())
+
+    def _handle_events(self, events: list[tuple[int, int, str]]) -> None:
+        for wd, mask, name in events:
+            if mask & _IN_Q_OVERFLOW:
+                self._rescan_all = True
+                continue
+            if mask & _IN_IGNORED:
+                rel = self._wd_dirs.pop(wd, None)
+                if rel is not None and self._dir_wds.get(rel) == wd:
+                    del self._dir_wds[rel]
+                continue
+            rel = self._wd_dirs.get(wd)
+            if rel is None:
+                continue
+            if mask & (_IN_DELETE_SELF | _IN_MOVE_SELF):
+                self._dirty.add(rel.rpartition("/")[0])
+            elif name == ".gitignore":
+                self._deep_dirty.add(rel)
+            elif mask & _IN_CLOSE_WRITE:
+                continue
+            else:
+                self._dirty.add(rel)
+                if mask & _IN_ISDIR and mask & (_IN_CREATE | _IN_MOVED_TO):
+                    # the directory may replace one of the same name that is still indexed
+                    self._deep_dirty.add(f"{rel}/{name}" if rel else name)
+        if self._dirty or self._deep_dirty or self._rescan_all:
+            self._wakeup.set()
+
+    async def _refresh(self) -> None:
+        try:
+            await self._update()
+        except _TooManyPaths:
+            self._give_up_too_many_paths()
+
+    async def _update(self) -> None:
+        self._wakeup.clear()
+        if self._inotify is not None:
+            self._handle_events(self._inotify.read())
+        else:
+            snapshot = [
+                (rel, directory.mtime_ns, directory.gitignore_mtime_ns)
+                for rel, directory in self._dirs.items()
+            ]
+            changed, gitignore_changed = await asyncio.to_thread(self._poll, snapshot)
+            self._dirty.update(changed)
+            self._deep_dirty.update(gitignore_changed)
+
+        while self._dirty or self._deep_dirty or self._rescan_all:
+            if self._rescan_all:
+                roots = [""]
+                known: set[str] = set()
+                self._gitignore = GitIgnore(self._root, self._ignore)
+            else:
+                deep = self._deep_dirty
+                for rel in deep:
+                    self._gitignore.forget(self._abspath(rel))
+                known = {rel for rel in self._dirs if not any(_is_under(rel, d) for d in deep)}
+                roots = sorted(self._dirty | deep)
+            self._dirty, self._deep_dirty, self._rescan_all = set(), set(), False
+            # the size of the index is checked once the rescanned directories are replaced
+            scan = await asyncio.to_thread(self._scan, roots, known=known, budget=self._max_paths)
+            self._apply(scan, roots, rescanned=set(roots) - known)
+            self._check_watches()
+
+    def _poll(self, snapshot: list[tuple[str, int, int]]) -> tuple[list[str], list[str]]:
+        changed: list[str] = []
+        gitignore_changed: list[str] = []
+        for rel, mtime_ns, gitignore_mtime_ns in snapshot:
+            path = self._abspath(rel)
+            try:
+                if os.stat(path).st_mtime_ns != mtime_ns:
+                    changed.append(rel)
+                    continue
+            except OSError:
+                changed.append(rel)
+                continue
+            if gitignore_mtime_ns and _mtime_ns(os.path.join(path, ".gitignore")) != (
+                gitignore_mtime_ns
+            ):
+                gitignore_changed.append(rel)
+        return changed, gitignore_changed
+
+    def _scan(
+        self, roots: Sequence[str], *, known: Set[str] | None, budget: int
+    ) -> dict[str, _Dir | None]:
+        """
+        Scan directories, and their subdirectories not in `known`, or none if `known` is
+        `None`. Runs in a worker thread, so it does not change the index, but the watches.
+        """
+        result: dict[str, _Dir | None] = {}
+        root_set = set(roots)
+        stack = list(reversed(roots))
+        n_paths = 0
+        while stack:
+            rel = stack.pop()
+            if rel in result:
+                continue
+            path = self._abspath(rel)
+            if rel and rel in root_set and (os.path.islink(path) or self.prunes(path)):
+                result[rel] = None
+                continue
+            self._watch(rel, path)
+            try:
+                mtime_ns = os.stat(path).st_mtime_ns
+                with os.scandir(path) as it:
+                    entries = {entry.name: self._kind(entry) for entry in it}
+            except OSError:
+                result[rel] = None
+                continue
+            n_paths += len(entries)
+            if n_paths > budget:
+                raise _TooManyPaths
+            gitignore_mtime_ns = (
+                _mtime_ns(os.path.join(path, ".gitignore")) if ".gitignore" in entries else 0
+            )
+            result[rel] = _Dir(mtime_ns, gitignore_mtime_ns, entries)
+            if known is None:
+                continue
+            for name, kind in entries.items():
+                child = f"{rel}/{name}" if rel else name
+                if kind == _DIR and child not in known:
+                    stack.append(child)
+        return result
+
+    def _kind(self, entry: os.DirEntry[str]) -> int:
+        try:
+            if entry.is_dir(follow_symlinks=False):
+                return _PRUNED if self.prunes(entry.path) else _DIR
+            if entry.is_dir():
+                return _LINK
+        except OSError:
+            pass
+        return _FILE
+
+    def _watch(self, rel: str, path: str) -> None:
+        inotify = self._inotify
+        if inotify is None:
+            return
+        try:
+            wd = inotify.add_watch(path)
+        except OSError as e:
+            if e.errno not in (errno.ENOENT, errno.ENOTDIR, errno.EACCES):
+                self._watch_failed = True
+            return
+        self._wd_dirs[wd] = rel
+        self._dir_wds[rel] = wd
+
+    def _apply(
+        self, scan: dict[str, _Dir | None], roots: Sequence[str], rescanned: Set[str] = frozenset()
+    ) -> None:
+        """Apply the result of `_scan` to the index."""
+        for rel, directory in scan.items():
+            old = self._dirs.get(rel)
+            if directory is None:
+                self._drop(rel)
+                continue
+            if old is not None:
+                for name, kind in old.entries.items():
+                    if kind == _DIR and directory.entries.get(name) != _DIR:
+                        self._drop(f"{rel}/{name}" if rel else name)
+                if old.gitignore_mtime_ns != directory.gitignore_mtime_ns and rel not in rescanned:
+                    self._deep_dirty.add(rel)
+            self._set(rel, directory)
+        for rel in roots:
+            # a directory rescanned on its own may have become ignored, or its parent removed
+            parent, _, name = rel.rpartition("/")
+            parent_dir = self._dirs.get(parent)
+            if rel and (parent_dir is None or parent_dir.entries.get(name) != _DIR):
+                self._drop(rel)
+        if self._n_paths > self._max_paths:
+            raise _TooManyPaths
+        self._version += 1
+
+    def _set(self, rel: str, directory: _Dir) -> None:
+        if (old := self._dirs.get(rel)) is not None:
+            self._count(old, -1)
+        self._dirs[rel] = directory
+        self._count(directory, 1)
+
+    def _drop(self, rel: str) -> None:
+        directory = self._dirs.pop(rel, None)
+        if directory is None:
+            return
+        self._count(directory, -1)
+        wd = self._dir_wds.pop(rel, None)
+        # the watch may have moved to a directory renamed from this one
+        if wd is not None and self._wd_dirs.get(wd) == rel:
+            del self._wd_dirs[wd]
+            if self._inotify is not None:
+                self._inotify.rm_watch(wd)
+        for name, kind in directory.entries.items():
+            if kind == _DIR:
+                self._drop(f"{rel}/{name}" if rel else name)
+
+    def _count(self, directory: _Dir, sign: Literal[1, -1]) -> None:
+        self._n_paths += sign * len(directory.entries)
+        for name, kind in directory.entries.items():
+            if kind == _PRUNED:
+                self._pruned_names[name] += sign
+            elif kind == _LINK:
+                self._n_links += sign
+
+
+@dataclass(frozen=True, slots=True)
+class _GlobMatcher:
+    regex: re.Pattern[str]
+    base: str
+    """The directory relative to the root under which the paths may match."""
+    dirs_only: bool
+    descended_only: bool
+    """Whether only the directories descended into match, as with a trailing `**`."""
+
+
+_NO_MATCH = _GlobMatcher(re.compile("(?!)"), base="", dirs_only=False, descended_only=False)
+
+
+def _is_wildcard(segment: str) -> bool:
+    return segment == "**" or any(char in segment for char in "*?[")
+
+
+def _is_under(rel: str, directory: str) -> bool:
+    return not directory or rel == directory or rel.startswith(f"{directory}/")
+
+
+def _prefix_range(paths: list[str], prefix: str) -> tuple[int, int]:
+    """Get the range of the sorted paths starting with a prefix."""
+    if not prefix:
+        return 0, len(paths)
+    return bisect_left(paths, prefix), bisect_left(paths, prefix[:-1] + chr(ord(prefix[-1]) + 1))
+
+
+def _mtime_ns(path: str) -> int:
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return 0
+
+
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_FROM = 0x00000040
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_DELETE = 0x00000200
+_IN_DELETE_SELF = 0x00000400
+_IN_MOVE_SELF = 0x00000800
+_IN_Q_OVERFLOW = 0x00004000
+_IN_IGNORED = 0x00008000
+_IN_ISDIR = 0x40000000
+_WATCH_MASK = (
+    _IN_CLOSE_WRITE
+    | _IN_MOVED_FROM
+    | _IN_MOVED_TO
+    | _IN_CREATE
+    | _IN_DELETE
+    | _IN_DELETE_SELF
+    | _IN_MOVE_SELF
+)
+_EVENT_HEADER = struct.Struct("iIII")
+
+
+class _Inotify:
+    """A minimal binding of the inotify API of Linux through `ctypes`."""
+
+    def __init__(self, fd: int, add_watch: Callable[..., int], rm_watch: Callable[..., int]):
+        self.fd = fd
+        self._add_watch = add_watch
+        self._rm_watch = rm_watch
+        self._closed = False
+
+    @staticmethod
+    def create() -> _Inotify | None:
+        """Create an inotify instance, or `None` if inotify is not available."""
+        if not sys.platform.startswith("linux"):
+            return None
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+            init, add_watch, rm_watch = (
+                libc.inotify_init1,
+                libc.inotify_add_watch,
+                libc.inotify_rm_watch,
+            )
+        except (OSError, AttributeError) as e:
+            logger.debug("inotify is not available: {error}", error=e)
+            return None
+        add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+        fd = init(os.O_NONBLOCK | os.O_CLOEXEC)
+        if fd < 0:
+            logger.debug(
+                "Failed to initialize inotify: {error}", error=os.strerror(ctypes.get_errno())
+            )
+            return None
+        return _Inotify(fd, add_watch, rm_watch)
+
+    def add_watch(self, path: str) -> int:
+        if self._closed:
+            raise OSError(errno.EBADF, os.strerror(errno.EBADF), path)
+        wd = self._add_watch(self.fd, os.fsencode(path), _WATCH_MASK)
+        if wd < 0:
+            code = ctypes.get_errno()
+            raise OSError(code, os.strerror(code), path)
+        return wd
+
+    def rm_watch(self, wd: int) -> None:
+        if not self._closed:
+            self._rm_watch(self.fd, wd)
+
+    def read(self) -> list[tuple[int, int, str]]:
+        """Read the pending events, as tuples of the watch, the mask and the name."""
+        events: list[tuple[int, int, str]] = []
+        while not self._closed:
+            try:
+                data = os.read(self.fd, 1 << 16)
+            except OSError:
+                break
+            offset = 0
+            while offset + _EVENT_HEADER.size <= len(data):
+                wd, mask, _, length = _EVENT_HEADER.unpack_from(data, offset)
+                offset += _EVENT_HEADER.size
+                name = data[offset : offset + length].rstrip(b"\0")
+                offset += length
+                events.append((wd, mask, os.fsdecode(name)))
+        return events
+
+    def close(self) -> None:
+        if not self._closed:
+            self._closed = True
+            os.close(self.fd)
@@ -32,6 +32,7 @@ from kimi_cli.tools.think import Think
 from kimi_cli.tools.todo import SetTodoList
 from kimi_cli.tools.web.fetch import FetchURL
 from kimi_cli.tools.web.search import SearchWeb
+from kimi_cli.workspace import WorkspaceIndex
 
 
 @pytest.fixture
@@ -102,6 +103,12 @@ def approval() -> Approval:
     return Approval(yolo=True)
 
 
+@pytest.fixture
+def workspace(temp_work_dir: Path) -> WorkspaceIndex:
+    """Create a WorkspaceIndex instance, not started, so that the tools walk the disk."""
+    return WorkspaceIndex(temp_work_dir)
+
+
 @pytest.fixture
 def runtime(
     config: Config,
@@ -110,6 +117,7 @@ def runtime(
     denwa_renji: DenwaRenji,
     session: Session,
     approval: Approval,
+    workspace: WorkspaceIndex,
 ) -> Runtime:
     """Create a Runtime instance."""
     return Runtime(
@@ -119,6 +127,7 @@ def runtime(
         denwa_renji=denwa_renji,
         session=session,
         approval=approval,
+        workspace=workspace,
     )
 
 
@@ -182,15 +191,17 @@ def read_file_tool(builtin_args: BuiltinSystemPromptArgs) -> ReadFile:
 
 
 @pytest.fixture
-def glob_tool(builtin_args: BuiltinSystemPromptArgs) -> Glob:
+def glob_tool(builtin_args: BuiltinSystemPromptArgs, workspace: WorkspaceIndex) -> Glob:
     """Create a Glob tool instance."""
-    return Glob(builtin_args)
+    return Glob(builtin_args, workspace)
 
 
 @pytest.fixture
-def grep_tool() -> Grep:
+def grep_tool(
+    config: Config, builtin_args: BuiltinSystemPromptArgs, workspace: WorkspaceIndex
+) -> Grep:
     """Create a Grep tool instance."""
-    return Grep()
+    return Grep(config, builtin_args, workspace)
 
 
 @pytest.fixture
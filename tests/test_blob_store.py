@@ -0,0 +1,76 @@
+"""Tests for the content-addressed blob store."""
+
+from __future__ import annotations
+
+import json
+from pathlib import Path
+
+import pytest
+from kosong.message import Message, TextPart
+
+from kimi_cli.soul.blob import BlobRefPart, BlobStore
+from kimi_cli.soul.context import Context
+
+
+def _tool_message(text: str, tool_call_id: str = "call_1") -> Message:
+    return Message(role="tool", content=[TextPart(text=text)], tool_call_id=tool_call_id)
+
+
+def test_put_deduplicates(temp_share_dir: Path):
+    store = BlobStore(temp_share_dir / "blobs")
+    ref1 = store.put("x" * 1000)
+    ref2 = store.put("x" * 1000)
+
+    assert ref1 == ref2
+    assert ref1.size == 1000
+    assert len([p for p in store.root.rglob("*") if p.is_file()]) == 1
+    assert BlobStore(store.root).get(ref1) == "x" * 1000
+
+
+def test_externalize_only_large_tool_outputs(temp_share_dir: Path):
+    store = BlobStore(temp_share_dir / "blobs", threshold=50)
+
+    small = _tool_message("short")
+    assert store.externalize(small) is small
+    user = Message(role="user", content=[TextPart(text="y" * 100)])
+    assert store.externalize(user) is user
+
+    large = Message(
+        role="tool",
+        content=[TextPart(text="<system>ok</system>"), TextPart(text="z" * 100)],
+        tool_call_id="call_1",
+    )
+    externalized = store.externalize(large)
+    assert isinstance(externalized.content, list)
+    assert isinstance(externalized.content[1], BlobRefPart)
+    assert externalized.content[0] == large.content[0]
+    assert store.resolve([externalized]) == [large]
+
+
+def test_disabled_threshold_keeps_messages(temp_share_dir: Path):
+    store = BlobStore(temp_share_dir / "blobs")
+    message = _tool_message("z" * 100_000)
+    assert store.externalize(message) is message
+
+
+@pytest.mark.asyncio
+async def test_context_stores_references(temp_share_dir: Path):
+    file_backend = temp_share_dir / "history.jsonl"
+    output = "file content\n" * 1000
+    context = Context(file_backend, blob_store=BlobStore(temp_share_dir / "blobs", threshold=100))
+    await context.append_message([_tool_message(output, "call_1"), _tool_message(output, "call_2")])
+    await context.flush()
+
+    # the history file and the in-memory history hold references only
+    assert output not in file_backend.read_text()
+    records = [json.loads(line) for line in file_backend.read_text().splitlines()]
+    assert records[0]["content"][0]["type"] == "blob_ref"
+    assert all(isinstance(m.content[0], BlobRefPart) for m in context.history)
+
+    expected = [_tool_message(output, "call_1"), _tool_message(output, "call_2")]
+    assert await context.resolved_history() == expected
+
+    # references are resolved after restoring as well, with a fresh store
+    restored = Context(file_backend, blob_store=BlobStore(temp_share_dir / "blobs"))
+    assert await restored.restore()
+    assert await restored.resolved_history() == expected
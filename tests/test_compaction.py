@@ -0,0 +1,280 @@
+"""Tests for context compaction."""
+
+from __future__ import annotations
+
+import asyncio
+from collections.abc import Sequence
+
+import pytest
+from kosong.chat_provider.mock import MockChatProvider
+from kosong.message import Message, ToolCall
+from kosong.tooling.simple import SimpleToolset
+
+from kimi_cli.llm import LLM
+from kimi_cli.soul.agent import Agent
+from kimi_cli.soul.compaction import (
+    IncrementalCompaction,
+    is_compaction_summary,
+    is_pruned_output,
+    prune_stale_tool_outputs,
+)
+from kimi_cli.soul.context import Context
+from kimi_cli.soul.kimisoul import KimiSoul
+from kimi_cli.soul.runtime import Runtime
+from kimi_cli.soul.tokens import HeuristicTokenEstimator
+from kimi_cli.utils.message import message_extract_text
+
+
+class _FakeCompaction:
+    def __init__(self):
+        self.calls: list[list[Message]] = []
+        self.release = asyncio.Event()
+
+    async def compact(self, messages: Sequence[Message], llm: LLM) -> Sequence[Message]:
+        self.calls.append(list(messages))
+        await self.release.wait()
+        return [Message(role="assistant", content=f"summary of {len(messages)} messages")]
+
+
+def _user(text: str) -> Message:
+    return Message(role="user", content=text)
+
+
+async def _make_soul(runtime: Runtime) -> tuple[KimiSoul, _FakeCompaction]:
+    runtime.config.loop_control.reserved_tokens = 50_000
+    runtime.config.loop_control.compaction_watermark = 0.7
+    context = Context(runtime.session.history_file)
+    soul = KimiSoul(
+        Agent(name="test", system_prompt="", toolset=SimpleToolset()),
+        runtime,
+        context=context,
+    )
+    compaction = _FakeCompaction()
+    soul._compaction = compaction  # type: ignore[assignment]
+    await context.checkpoint(add_user_message=False)
+    await context.append_message([_user("first"), _user("second")])
+    return soul, compaction
+
+
+@pytest.mark.asyncio
+async def test_background_compaction_swaps_in_summary(runtime: Runtime):
+    soul, compaction = await _make_soul(runtime)
+    context = soul.context
+
+    # below the watermark, nothing happens
+    await soul._maybe_compact_in_background()
+    assert soul._background_compaction is None
+
+    await context.update_token_count(40_000)
+    await soul._maybe_compact_in_background()
+    assert soul._background_compaction is not None
+    await asyncio.sleep(0)
+    assert len(compaction.calls) == 1
+
+    # the agent keeps working while compacting
+    await context.checkpoint(add_user_message=True)
+    await context.append_message(_user("third"))
+
+    compaction.release.set()
+    await soul.compact_context()
+
+    assert len(compaction.calls) == 1
+    assert context.history == [
+        Message(role="assistant", content="summary of 2 messages"),
+        _user("third"),
+    ]
+    assert soul._background_compaction is None
+
+
+@pytest.mark.asyncio
+async def test_background_compaction_of_reverted_history_is_discarded(runtime: Runtime):
+    soul, compaction = await _make_soul(runtime)
+    context = soul.context
+    await context.checkpoint(add_user_message=False)
+    await context.append_message(_user("third"))
+    await context.update_token_count(40_000)
+    await soul._maybe_compact_in_background()
+    assert soul._background_compaction is not None
+
+    await context.revert_to(1)
+    await context.append_message([_user("other"), _user("branch")])
+    compaction.release.set()
+    await soul.compact_context()
+
+    assert len(compaction.calls) == 2
+    assert context.history == [Message(role="assistant", content="summary of 4 messages")]
+
+
+class _RecordingIncrementalCompaction(IncrementalCompaction):
+    def __init__(self, *, stable_prefix: bool = False):
+        super().__init__(stable_prefix=stable_prefix)
+        self.inputs: list[str] = []
+
+    async def _summarize_text(self, text: str, llm: LLM) -> str:
+        self.inputs.append(text)
+        return f"summary {len(self.inputs)}"
+
+
+def _llm(max_context_size: int = 100_000) -> LLM:
+    return LLM(
+        chat_provider=MockChatProvider([]),
+        max_context_size=max_context_size,
+        capabilities=set(),
+    )
+
+
+def _assistant(text: str) -> Message:
+    return Message(role="assistant", content=text)
+
+
+def _summary_texts(messages: Sequence[Message]) -> list[str]:
+    return [message_extract_text(m).split("\n", 1)[1] for m in messages if is_compaction_summary(m)]
+
+
+@pytest.mark.asyncio
+async def test_incremental_compaction_reuses_summaries():
+    compaction = _RecordingIncrementalCompaction()
+    history = [_user("u1"), _assistant("a1"), _user("u2"), _assistant("a2")]
+
+    compacted = await compaction.compact(history, _llm())
+    assert _summary_texts(compacted) == ["summary 1"]
+    assert list(compacted[1:]) == [_user("u2"), _assistant("a2")]
+    assert "u1" in compaction.inputs[0] and "u2" not in compaction.inputs[0]
+
+    # only the messages after the previous summary are summarized again
+    history = [*compacted, _user("u3"), _assistant("a3")]
+    compacted = await compaction.compact(history, _llm())
+    assert _summary_texts(compacted) == ["summary 1", "summary 2"]
+    assert list(compacted[2:]) == [_user("u3"), _assistant("a3")]
+    assert "u2" in compaction.inputs[1] and "summary 1" not in compaction.inputs[1]
+
+
+@pytest.mark.asyncio
+async def test_incremental_compaction_merges_old_summaries():
+    compaction = _RecordingIncrementalCompaction()
+    history: list[Message] = [_user("u0"), _assistant("a0")]
+    for i in range(1, IncrementalCompaction.MAX_SUMMARIES + 2):
+        history = list(await compaction.compact([*history, _user(f"u{i}")], _llm()))
+        assert len(_summary_texts(history)) <= IncrementalCompaction.MAX_SUMMARIES
+    assert len(_summary_texts(history)) == IncrementalCompaction.MAX_SUMMARIES
+    assert "Earlier Compaction Output" in compaction.inputs[-1]
+
+
+@pytest.mark.asyncio
+async def test_incremental_compaction_stable_prefix_merges_new_summaries():
+    compaction = _RecordingIncrementalCompaction(stable_prefix=True)
+    history: list[Message] = [_user("u0"), _assistant("a0")]
+    for i in range(1, IncrementalCompaction.MAX_SUMMARIES + 1):
+        history = list(await compaction.compact([*history, _user(f"u{i}")], _llm()))
+    head = history[: IncrementalCompaction.MAX_SUMMARIES - 1]
+
+    history = list(await compaction.compact([*history, _user("u")], _llm()))
+    # the summaries at the head are kept as they are, for the prompt cache
+    assert history[: len(head)] == head
+    assert len(_summary_texts(history)) == IncrementalCompaction.MAX_SUMMARIES
+    assert "summary 4" in compaction.inputs[-1] and "summary 5" in compaction.inputs[-1]
+
+
+@pytest.mark.asyncio
+async def test_incremental_compaction_map_reduce_large_span():
+    compaction = _RecordingIncrementalCompaction()
+    history = [
+        *(_user("x" * 4000) for _ in range(10)),
+        _user("u"),
+        _assistant("a"),
+    ]
+
+    # each message takes about 1000 tokens, and each chunk at most 2500 tokens
+    compacted = await compaction.compact(history, _llm(max_context_size=5_000))
+    n_chunks = 5
+    assert len(compaction.inputs) == n_chunks + 1
+    assert all("Earlier Compaction Output" in text for text in compaction.inputs[n_chunks:])
+    assert _summary_texts(compacted) == [f"summary {n_chunks + 1}"]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("char", ["x", "字"])
+async def test_incremental_compaction_splits_large_message(char: str):
+    compaction = _RecordingIncrementalCompaction()
+    estimator = HeuristicTokenEstimator()
+    lines = [f"line {i} " + char * 100 for i in range(300)]
+    history = [_user("\n".join(lines)), _user("u"), _assistant("a")]
+
+    await compaction.compact(history, _llm(max_context_size=5_000))
+    # the message is split into parts that fit into a chunk, and nothing is cut off
+    chunk_inputs = [text for text in compaction.inputs if "Earlier Compaction Output" not in text]
+    assert len(chunk_inputs) > 1
+    assert all(estimator.count_text(text) <= 2_500 for text in chunk_inputs)
+    assert "(part 1 of" in chunk_inputs[0]
+    summarized = "".join(text.split("\n", 1)[1] for text in chunk_inputs)
+    assert all(line in summarized for line in lines)
+
+
+def _call(call_id: str, name: str, arguments: str) -> Message:
+    return Message(
+        role="assistant",
+        content="",
+        tool_calls=[
+            ToolCall(id=call_id, function=ToolCall.FunctionBody(name=name, arguments=arguments))
+        ],
+    )
+
+
+def _result(call_id: str, text: str) -> Message:
+    return Message(role="tool", content=text, tool_call_id=call_id)
+
+
+def test_prune_stale_tool_outputs():
+    history = [
+        _user("refactor"),
+        _call("read_1", "ReadFile", '{"path": "/w/a.py"}'),
+        _result("read_1", "a" * 1000),
+        _call("read_2", "ReadFile", '{"path": "/w/b.py"}'),
+        _result("read_2", "b" * 1000),
+        _call("grep_1", "Grep", '{"pattern": "foo", "path": "/w"}'),
+        _result("grep_1", "g" * 1000),
+        _call("write_1", "WriteFile", '{"path": "/w/./a.py", "content": "new"}'),
+        _result("write_1", "ok"),
+        _call("write_2", "WriteFile", '{"path": "/w/b.py", "content": "new"}'),
+        _result("write_2", "<system>ERROR: Permission denied</system>"),
+        _call("grep_2", "Grep", '{"path": "/w", "pattern": "foo"}'),
+        _result("grep_2", "h" * 1000),
+        _call("read_3", "ReadFile", '{"path": "/w/c.py"}'),
+        _result("read_3", "c" * 100),
+        _call("read_4", "ReadFile", '{"path": "/w/c.py"}'),
+        _result("read_4", "c" * 100),
+    ]
+
+    pruned = prune_stale_tool_outputs(history)
+    assert [i for i, m in enumerate(pruned) if is_pruned_output(m)] == [2, 6]
+    assert "/w/a.py" in message_extract_text(pruned[2])
+    assert pruned[2].tool_call_id == "read_1"
+    # the failed write does not make the read stale, and small outputs are kept
+    assert all(pruned[i] is history[i] for i in range(len(history)) if i not in {2, 6})
+    # pruning is idempotent
+    assert all(a is b for a, b in zip(prune_stale_tool_outputs(pruned), pruned, strict=True))
+
+
+@pytest.mark.asyncio
+async def test_pruning_avoids_compaction(runtime: Runtime):
+    soul, compaction = await _make_soul(runtime)
+    context = soul.context
+    runtime.config.loop_control.reserved_tokens = 95_000
+    for i in range(5):
+        await context.checkpoint(add_user_message=False)
+        await context.append_message(
+            [
+                _call(f"read_{i}", "ReadFile", '{"path": "/w/a.py"}'),
+                _result(f"read_{i}", "a" * 4000),
+            ]
+        )
+    assert soul._is_context_too_long()
+    n_checkpoints = context.n_checkpoints
+
+    assert await soul.prune_context()
+    assert not soul._is_context_too_long()
+    assert context.n_checkpoints == n_checkpoints
+    assert not compaction.calls
+    assert sum(1 for m in context.history if is_pruned_output(m)) == 4
+    assert context.history[-1] == _result("read_4", "a" * 4000)
+    assert not await soul.prune_context()
@@ -1,12 +1,18 @@
 from __future__ import annotations
 
+import json
+from pathlib import Path
+
+import pytest
 from inline_snapshot import snapshot
 
 from kimi_cli.config import (
     Config,
     Services,
     get_default_config,
+    load_config,
 )
+from kimi_cli.exception import ConfigError
 
 
 def test_default_config():
@@ -31,9 +37,39 @@ def test_default_config_dump():
   "providers": {},
   "loop_control": {
     "max_steps_per_run": 100,
-    "max_retries_per_step": 3
+    "max_retries_per_step": 3,
+    "max_tool_concurrency": 8,
+    "speculative_tool_calls": false,
+    "cache_tool_results": true
+  },
+  "context": {
+    "durability": "step",
+    "format": "jsonl",
+    "lazy_restore": true,
+    "stable_prefix": false
+  },
+  "workspace": {
+    "trigram_index": false,
+    "file_index": true,
+    "ignore": []
   },
   "services": {}
 }\
 """
     )
+
+
+def test_reserved_tokens_must_fit_in_models(tmp_path: Path):
+    config_file = tmp_path / "config.json"
+    config_file.write_text(
+        json.dumps(
+            {
+                "default_model": "small",
+                "models": {"small": {"provider": "p", "model": "m", "max_context_size": 8_000}},
+                "providers": {"p": {"type": "kimi", "base_url": "http://x", "api_key": "k"}},
+                "loop_control": {"reserved_tokens": 8_000},
+            }
+        )
+    )
+    with pytest.raises(ConfigError, match="Reserved tokens 8000 exceed"):
+        load_config(config_file)
@@ -0,0 +1,425 @@
+"""Tests for the context storage."""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import threading
+from pathlib import Path
+
+import pytest
+from kosong.message import Message
+
+from kimi_cli.config import HistoryFormat
+from kimi_cli.soul.context import LAZY_RESTORE_TAIL_RUNS, Context, is_checkpoint_message
+from kimi_cli.soul.history import FRAMED_MAGIC, convert_session_history, detect_format
+
+
+def _user(text: str) -> Message:
+    return Message(role="user", content=text)
+
+
+async def _build_context(file_backend: Path) -> Context:
+    context = Context(file_backend)
+    await context.checkpoint(add_user_message=False)
+    await context.append_message(_user("first"))
+    await context.update_token_count(10)
+    await context.checkpoint(add_user_message=True)
+    await context.append_message([_user("second"), _user("third")])
+    await context.update_token_count(20)
+    await context.checkpoint(add_user_message=False)
+    await context.append_message(_user("fourth"))
+    await context.update_token_count(30)
+    await context.flush()
+    return context
+
+
+def _read_records(file_backend: Path) -> list[dict]:
+    return [json.loads(line) for line in file_backend.read_text().splitlines() if line.strip()]
+
+
+@pytest.mark.asyncio
+async def test_revert_to_truncates_history_and_file(temp_share_dir: Path):
+    file_backend = temp_share_dir / "history.jsonl"
+    context = await _build_context(file_backend)
+    records_before = _read_records(file_backend)
+
+    await context.revert_to(1)
+
+    assert [m.content for m in context.history] == ["first"]
+    assert context.token_count == 10
+    assert context.n_checkpoints == 1
+    assert _read_records(file_backend) == records_before[:3]
+    assert _read_records(temp_share_dir / "history_1.jsonl") == records_before
+
+    # new checkpoints continue from the reverted ID
+    await context.checkpoint(add_user_message=False)
+    await context.flush()
+    assert context.n_checkpoints == 2
+    assert _read_records(file_backend)[-1] == {"role": "_checkpoint", "id": 1}
+
+
+@pytest.mark.asyncio
+async def test_revert_to_zero_clears_everything(temp_share_dir: Path):
+    file_backend = temp_share_dir / "history.jsonl"
+    context = await _build_context(file_backend)
+
+    await context.revert_to(0)
+
+    assert context.history == []
+    assert context.token_count == 0
+    assert context.n_checkpoints == 0
+    assert file_backend.read_bytes() == b""
+
+
+@pytest.mark.asyncio
+async def test_revert_to_after_restore(temp_share_dir: Path):
+    file_backend = temp_share_dir / "history.jsonl"
+    await _build_context(file_backend)
+
+    context = Context(file_backend)
+    assert await context.restore()
+    assert context.n_checkpoints == 3
+    assert context.token_count == 30
+
+    await context.revert_to(2)
+
+    restored = Context(file_backend)
+    assert await restored.restore()
+    assert restored.history == context.history
+    assert restored.token_count == context.token_count == 20
+    assert restored.n_checkpoints == context.n_checkpoints == 2
+
+
+@pytest.mark.asyncio
+async def test_revert_to_nonexistent_checkpoint(temp_share_dir: Path):
+    context = await _build_context(temp_share_dir / "history.jsonl")
+
+    with pytest.raises(ValueError, match="Checkpoint 3 does not exist"):
+        await context.revert_to(3)
+
+
+@pytest.mark.asyncio
+async def test_step_durability_buffers_until_flush(temp_share_dir: Path):
+    file_backend = temp_share_dir / "history.jsonl"
+    context = Context(file_backend, durability="step")
+    await context.checkpoint(add_user_message=False)
+    await context.append_message([_user("first"), _user("second")])
+
+    assert not file_backend.exists() or file_backend.read_bytes() == b""
+
+    await context.flush()
+    assert _read_records(file_backend) == [
+        {"role": "_checkpoint", "id": 0},
+        {"role": "user", "content": "first"},
+        {"role": "user", "content": "second"},
+    ]
+    await context.close()
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("durability", ["record", "checkpoint"])
+async def test_write_through_durability(temp_share_dir: Path, durability):
+    file_backend = temp_share_dir / "history.jsonl"
+    context = Context(file_backend, durability=durability)
+    await context.checkpoint(add_user_message=False)
+    await context.append_message(_user("first"))
+
+    assert _read_records(file_backend) == [
+        {"role": "_checkpoint", "id": 0},
+        {"role": "user", "content": "first"},
+    ]
+    await context.close()
+
+
+@pytest.mark.asyncio
+async def test_revert_to_flushes_buffered_records(temp_share_dir: Path):
+    file_backend = temp_share_dir / "history.jsonl"
+    context = Context(file_backend, durability="step")
+    await context.checkpoint(add_user_message=False)
+    await context.append_message(_user("first"))
+    await context.checkpoint(add_user_message=False)
+    await context.append_message(_user("second"))
+
+    await context.revert_to(1)
+    await context.append_message(_user("third"))
+    await context.close()
+
+    assert [m.content for m in context.history] == ["first", "third"]
+    restored = Context(file_backend)
+    assert await restored.restore()
+    assert restored.history == context.history
+    assert len(_read_records(temp_share_dir / "history_1.jsonl")) == 4
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("format", ["jsonl", "framed"])
+async def test_replace_messages_keeps_checkpoints(temp_share_dir: Path, format: HistoryFormat):
+    file_backend = temp_share_dir / "history.jsonl"
+    context = Context(file_backend, format=format)
+    await context.checkpoint(add_user_message=False)
+    await context.append_message(_user("first"))
+    await context.update_token_count(10)
+    await context.checkpoint(add_user_message=True)
+    await context.append_message([_user("x" * 4000), _user("third")])
+    await context.update_token_count(1020)
+    await context.checkpoint(add_user_message=False)
+    await context.append_message(_user("fourth"))
+    await context.update_token_count(1030)
+    n_old_tokens = context.message_tokens[2]
+
+    await context.replace_messages({2: _user("second")})
+
+    assert [m.content for m in context.history if not is_checkpoint_message(m)] == [
+        "first",
+        "second",
+        "third",
+        "fourth",
+    ]
+    assert context.n_checkpoints == 3
+    n_saved_tokens = n_old_tokens - context.message_tokens[2]
+    assert n_saved_tokens > 0
+    assert context.token_count == 1030 - n_saved_tokens
+    assert detect_format(file_backend) == format
+
+    restored = Context(file_backend)
+    assert await restored.restore()
+    assert restored.history == context.history
+    assert restored.message_tokens == context.message_tokens
+    assert restored.token_count == context.token_count
+
+    await context.revert_to(2)
+    assert [m.content for m in context.history][-2:] == ["second", "third"]
+    assert context.token_count == 1020 - n_saved_tokens
+
+
+async def _build_long_context(
+    file_backend: Path, n_runs: int, format: HistoryFormat = "jsonl"
+) -> Context:
+    context = Context(file_backend, format=format)
+    for run in range(n_runs):
+        await context.checkpoint(add_user_message=False)
+        await context.append_message(_user(f"run {run}"))
+        for step in range(3):
+            await context.checkpoint(add_user_message=True)
+            await context.append_message(
+                Message(role="assistant", content=f"run {run} step {step}")
+            )
+            await context.update_token_count(run * 100 + step)
+    await context.flush()
+    return context
+
+
+@pytest.mark.asyncio
+async def test_lazy_restore_loads_tail_only(temp_share_dir: Path):
+    file_backend = temp_share_dir / "history.jsonl"
+    written = await _build_long_context(file_backend, n_runs=20)
+
+    context = Context(file_backend)
+    assert await context.restore(lazy=True)
+
+    loaded = context.loaded_history
+    assert len(loaded) < len(written.history)
+    n_runs = sum(1 for m in loaded if m.role == "user" and not is_checkpoint_message(m))
+    assert n_runs >= LAZY_RESTORE_TAIL_RUNS
+    assert list(loaded) == list(written.history[-len(loaded) :])
+    assert context.token_count == written.token_count
+    assert context.n_checkpoints == written.n_checkpoints
+
+    await context.materialize()
+    assert context.loaded_history == written.history
+
+
+@pytest.mark.asyncio
+async def test_lazy_restore_then_append_and_revert(temp_share_dir: Path):
+    file_backend = temp_share_dir / "history.jsonl"
+    written = await _build_long_context(file_backend, n_runs=20)
+
+    context = Context(file_backend)
+    assert await context.restore(lazy=True)
+    await context.checkpoint(add_user_message=False)
+    await context.append_message(_user("new run"))
+    await context.flush()
+
+    assert context.history == [*written.history, _user("new run")]
+
+    # revert to a checkpoint from the part that was not loaded initially
+    full = Context(file_backend)
+    assert await full.restore()
+    await full.revert_to(5)
+
+    lazy = Context(file_backend.with_name("history_1.jsonl"))
+    assert await lazy.restore(lazy=True)
+    await lazy.revert_to(5)
+    assert lazy.history == full.history
+    assert lazy.token_count == full.token_count
+    assert lazy.n_checkpoints == full.n_checkpoints == 5
+
+
+@pytest.mark.asyncio
+async def test_lazy_restore_short_history(temp_share_dir: Path):
+    file_backend = temp_share_dir / "history.jsonl"
+    written = await _build_long_context(file_backend, n_runs=2)
+
+    context = Context(file_backend)
+    assert await context.restore(lazy=True)
+    assert context.loaded_history == written.history
+    assert context.token_count == written.token_count
+    assert context.n_checkpoints == written.n_checkpoints
+
+
+@pytest.mark.asyncio
+async def test_lazy_restore_across_scan_chunks(temp_share_dir: Path, monkeypatch):
+    monkeypatch.setattr("kimi_cli.soul.history._SCAN_CHUNK_SIZE", 7)
+    file_backend = temp_share_dir / "history.jsonl"
+    written = await _build_long_context(file_backend, n_runs=10)
+
+    context = Context(file_backend)
+    assert await context.restore(lazy=True)
+    assert context.token_count == written.token_count
+    assert context.n_checkpoints == written.n_checkpoints
+    assert context.history == written.history
+
+
+@pytest.mark.asyncio
+async def test_framed_format_round_trip(temp_share_dir: Path):
+    jsonl_file = temp_share_dir / "history.jsonl"
+    framed_file = temp_share_dir / "framed.jsonl"
+    written = await _build_long_context(jsonl_file, n_runs=20)
+    await _build_long_context(framed_file, n_runs=20, format="framed")
+
+    assert framed_file.read_bytes().startswith(FRAMED_MAGIC)
+    assert detect_format(framed_file) == "framed"
+    assert framed_file.stat().st_size < jsonl_file.stat().st_size
+
+    context = Context(framed_file)
+    assert await context.restore()
+    assert context.history == written.history
+    assert context.token_count == written.token_count
+    assert context.n_checkpoints == written.n_checkpoints
+
+
+@pytest.mark.asyncio
+async def test_framed_format_lazy_restore_and_revert(temp_share_dir: Path):
+    jsonl_file = temp_share_dir / "history.jsonl"
+    framed_file = temp_share_dir / "framed.jsonl"
+    await _build_long_context(jsonl_file, n_runs=20)
+    written = await _build_long_context(framed_file, n_runs=20, format="framed")
+
+    expected = Context(jsonl_file)
+    assert await expected.restore()
+    await expected.revert_to(7)
+
+    context = Context(framed_file)
+    assert await context.restore(lazy=True)
+    assert len(context.loaded_history) < len(written.history)
+    await context.revert_to(7)
+    assert context.history == expected.history
+    assert context.token_count == expected.token_count
+    assert context.n_checkpoints == 7
+
+    # the reverted file stays framed and can be appended to
+    await context.checkpoint(add_user_message=False)
+    await context.append_message(_user("new run"))
+    await context.flush()
+    restored = Context(framed_file)
+    assert await restored.restore()
+    assert detect_format(framed_file) == "framed"
+    assert restored.history == [*expected.history, _user("new run")]
+    assert restored.n_checkpoints == 8
+
+
+@pytest.mark.asyncio
+async def test_existing_file_keeps_its_format(temp_share_dir: Path):
+    file_backend = temp_share_dir / "history.jsonl"
+    await _build_long_context(file_backend, n_runs=2)
+
+    context = Context(file_backend, format="framed")
+    assert await context.restore()
+    await context.append_message(_user("more"))
+    await context.flush()
+    assert detect_format(file_backend) == "jsonl"
+    assert _read_records(file_backend)[-1] == {"role": "user", "content": "more"}
+
+
+@pytest.mark.asyncio
+async def test_convert_session_history(temp_share_dir: Path):
+    file_backend = temp_share_dir / "history.jsonl"
+    written = await _build_long_context(file_backend, n_runs=10)
+    await written.revert_to(3)
+    original = file_backend.read_bytes()
+    rotated = temp_share_dir / "history_1.jsonl"
+    original_rotated = rotated.read_bytes()
+
+    assert convert_session_history(file_backend, "framed") == 2
+    assert detect_format(file_backend) == detect_format(rotated) == "framed"
+    assert convert_session_history(file_backend, "framed") == 0
+
+    context = Context(file_backend)
+    assert await context.restore(lazy=True)
+    await context.materialize()
+    assert context.history == written.history
+    assert context.token_count == written.token_count
+    assert context.n_checkpoints == written.n_checkpoints
+
+    assert convert_session_history(file_backend, "jsonl") == 2
+    assert file_backend.read_bytes() == original
+    assert _read_records(rotated) == [json.loads(line) for line in original_rotated.splitlines()]
+
+
+@pytest.mark.asyncio
+async def test_token_breakdown_while_materializing(temp_share_dir: Path, monkeypatch):
+    file_backend = temp_share_dir / "history.jsonl"
+    written = await _build_long_context(file_backend, n_runs=20)
+
+    context = Context(file_backend)
+    assert await context.restore(lazy=True)
+    n_loaded = len(context.loaded_history)
+    loading = threading.Event()
+    resume = threading.Event()
+    load_prefix = Context._load_prefix  # pyright: ignore[reportPrivateUsage]
+
+    def slow_load_prefix(self: Context) -> Context:
+        prefix = load_prefix(self)
+        loading.set()
+        resume.wait()
+        return prefix
+
+    monkeypatch.setattr(Context, "_load_prefix", slow_load_prefix)
+    task = asyncio.create_task(context.materialize())
+    await asyncio.to_thread(loading.wait)
+    # the loaded part is untouched until the prefix is swapped in on the event loop
+    assert len(context.loaded_history) == n_loaded
+    tail_total = context.token_breakdown().total
+    resume.set()
+    await task
+    assert context.loaded_history == written.history
+    assert context.token_breakdown().total > tail_total
+
+
+@pytest.mark.asyncio
+async def test_history_access_while_materializing(temp_share_dir: Path, monkeypatch):
+    file_backend = temp_share_dir / "history.jsonl"
+    written = await _build_long_context(file_backend, n_runs=20)
+
+    context = Context(file_backend)
+    assert await context.restore(lazy=True)
+    loading = threading.Event()
+    resume = threading.Event()
+    load_prefix = Context._load_prefix  # pyright: ignore[reportPrivateUsage]
+
+    def slow_load_prefix(self: Context) -> Context:
+        prefix = load_prefix(self)
+        if threading.current_thread() is not threading.main_thread():
+            loading.set()
+            resume.wait()
+        return prefix
+
+    monkeypatch.setattr(Context, "_load_prefix", slow_load_prefix)
+    task = asyncio.create_task(context.materialize())
+    await asyncio.to_thread(loading.wait)
+    # a synchronous access materializes the history itself, and the loaded prefix is dropped
+    assert context.history == written.history
+    resume.set()
+    await task
+    assert context.history == written.history
@@ -301,13 +301,14 @@ Find files and directories using glob patterns. This tool supports standard glob
 
 **Example patterns:**
 - `*.py` - All Python files in current directory
+- `**/*.py` - All Python files in current directory recursively
 - `src/**/*.js` - All JavaScript files in src directory recursively
 - `test_*.py` - Python test files starting with "test_"
 - `*.config.{js,ts}` - Config files with .js or .ts extension
 
-**Bad example patterns:**
-- `**`, `**/*.py` - Any pattern starting with '**' will be rejected. Because it would recursively search all directories and subdirectories, which is very likely to yield large result that exceeds your context size. Always use more specific patterns like `src/**/*.py` instead.
-- `node_modules/**/*.js` - Although this does not start with '**', it would still highly possible to yield large result because `node_modules` is well-known to contain too many directories and files. Avoid recursively searching in such directories, other examples include `venv`, `.venv`, `__pycache__`, `target`. If you really need to search in a dependency, use more specific patterns like `node_modules/react/src/*` instead.
+**Ignored directories:**
+- Wildcards do not descend into directories ignored by `.gitignore`, or well-known dependency, cache and build directories like `node_modules`, `.venv`, `__pycache__` and `target`. Name them explicitly if you really need to search in them, preferably with specific patterns like `node_modules/react/src/*`.
+- At most 1000 matches are returned, so prefer specific patterns like `src/**/*.py` over `**/*.py` in large directories.
 """,
                 parameters={
                     "properties": {
@@ -338,6 +339,7 @@ A powerful search tool based-on ripgrep.
 **Tips:**
 - ALWAYS use Grep tool instead of running `grep` or `rg` command with Bash tool.
 - Use the ripgrep pattern syntax, not grep syntax. E.g. you need to escape braces like `\\\\{` to search for `{`.
+- In `content` mode, the lines are grouped under the path of each file, and at most 50 matching lines are shown per file.
 """,
                 parameters={
                     "properties": {
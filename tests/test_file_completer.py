@@ -4,11 +4,13 @@ from __future__ import annotations
 
 from pathlib import Path
 
+import pytest
 from inline_snapshot import snapshot
 from prompt_toolkit.completion import CompleteEvent
 from prompt_toolkit.document import Document
 
 from kimi_cli.ui.shell.prompt import FileMentionCompleter
+from kimi_cli.workspace import WorkspaceIndex
 
 
 def _completion_texts(completer: FileMentionCompleter, text: str) -> list[str]:
@@ -117,3 +119,32 @@ def test_basename_prefix_is_ranked_first(tmp_path: Path):
             "src/kimi_cli/tools/file/patch.py",
         ]
     )
+
+
+@pytest.mark.asyncio
+async def test_completions_from_workspace_index(tmp_path: Path):
+    """Complete from the workspace file index once it is ready, skipping ignored paths."""
+    (tmp_path / "src" / "kimi_cli" / "tools" / "web").mkdir(parents=True)
+    (tmp_path / "src" / "kimi_cli" / "tools" / "web" / "fetch.py").write_text("# fetch\n")
+    (tmp_path / "src" / "kimi_cli" / "tools" / "web" / "fetch.pyc").write_text("")
+    (tmp_path / "node_modules" / "fetch").mkdir(parents=True)
+    (tmp_path / "node_modules" / "fetch" / "index.js").write_text("")
+    (tmp_path / "README.md").write_text("hello")
+
+    workspace = WorkspaceIndex(tmp_path)
+    await workspace.start()
+    try:
+        assert await workspace.wait_ready()
+        completer = FileMentionCompleter(tmp_path, workspace=workspace)
+        assert sorted(_completion_texts(completer, "@")) == ["README.md", "src/"]
+        assert _completion_texts(completer, "@fetch") == ["src/kimi_cli/tools/web/fetch.py"]
+
+        # a file created later is completed once the index catches up
+        (tmp_path / "src" / "fetcher.py").write_text("")
+        await workspace.sync()
+        assert _completion_texts(completer, "@fetch") == [
+            "src/fetcher.py",
+            "src/kimi_cli/tools/web/fetch.py",
+        ]
+    finally:
+        await workspace.aclose()
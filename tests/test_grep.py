@@ -2,13 +2,30 @@
 
 from __future__ import annotations
 
+import asyncio
+import base64
+import os
+import sys
 import tempfile
+import time
 from pathlib import Path
+from typing import Any
 
 import pytest
+from inline_snapshot import snapshot
 from kosong.tooling import ToolError, ToolOk
 
-from kimi_cli.tools.file.grep import Grep, Params
+from kimi_cli.tools.file import grep
+from kimi_cli.tools.file.grep import (
+    MAX_MATCHES_PER_FILE,
+    MAX_NARROWED_FILES,
+    Grep,
+    Params,
+    _ContentFormatter,
+    _fits_command_line,
+    _stream_rg,
+)
+from kimi_cli.tools.utils import ToolResultBuilder
 
 
 @pytest.fixture
@@ -367,3 +384,136 @@ async def test_grep_before_after_context(grep_tool: Grep, temp_test_files):
     assert "constructor()" in result.output
     assert "this.message" in result.output
     assert "}" not in result.output
+
+
+async def _stream_python(code: str, *, head_limit: int | None = None, max_bytes: int = 1000):
+    # a stand-in for ripgrep, to test reading its output
+    return await _stream_rg(
+        sys.executable, ["-c", code], head_limit=head_limit, max_bytes=max_bytes
+    )
+
+
+@pytest.mark.asyncio
+async def test_stream_rg_stops_early():
+    endless = "while True: print('match', flush=True)"
+    result = await asyncio.wait_for(_stream_python(endless, head_limit=3), timeout=10)
+    assert result.lines == ["match"] * 3
+    assert result.truncated_by == "head_limit"
+
+    result = await asyncio.wait_for(_stream_python(endless, max_bytes=15), timeout=10)
+    assert result.lines == ["match"] * 2
+    assert result.truncated_by == "max_bytes"
+
+    result = await _stream_python("print('a\\nb'); import sys; sys.exit(1)", head_limit=2)
+    assert result.lines == ["a", "b"]
+    assert (result.truncated_by, result.returncode) == (None, 1)
+
+
+@pytest.mark.asyncio
+async def test_stream_rg_kills_on_cancel(tmp_path: Path):
+    pid_file = tmp_path / "pid"
+    code = f"import os, time; open({str(pid_file)!r}, 'w').write(str(os.getpid())); time.sleep(60)"
+    task = asyncio.create_task(_stream_python(code))
+    while not pid_file.exists() or not pid_file.read_text():
+        await asyncio.sleep(0.01)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+    with pytest.raises(ProcessLookupError):
+        os.kill(int(pid_file.read_text()), 0)
+
+
+def _rg_event(type: str, line_number: int | None = None, text: str = "", **data: Any):
+    if type in ("match", "context"):
+        data = {"line_number": line_number, "lines": {"text": text}, **data}
+    return {"type": type, "data": data}
+
+
+def test_content_formatter():
+    builder = ToolResultBuilder()
+    formatter = _ContentFormatter(builder, line_number=True, separate_context=True)
+    events = [
+        _rg_event("begin", path={"text": "a.py"}),
+        _rg_event("context", 1, "import os\n"),
+        _rg_event("match", 2, "def foo():\n"),
+        _rg_event("context", 3, "    pass\n"),
+        # the context windows of the two matches overlap on line 3
+        _rg_event("context", 3, "    pass\n"),
+        _rg_event("match", 4, "def bar():\n"),
+        _rg_event("match", 8, "def baz():\n"),
+        _rg_event("end", stats={"matched_lines": 3}),
+        _rg_event("begin", path={"bytes": base64.b64encode(b"b\xff.py").decode()}),
+        _rg_event("match", 1, "def qux():\n"),
+        _rg_event("end", stats={"matched_lines": 1}),
+    ]
+    for event in events:
+        formatter.feed(event)
+    assert builder.ok().output == snapshot(
+        """\
+a.py
+1-import os
+2:def foo():
+3-    pass
+4:def bar():
+--
+8:def baz():
+
+b�.py
+1:def qux():
+"""
+    )
+    assert formatter.truncated_files == {}
+
+
+def test_fits_command_line():
+    assert _fits_command_line([Path("/w/a.py"), Path("/w/b.py")])
+    assert not _fits_command_line([Path(f"/w/{i}.py") for i in range(MAX_NARROWED_FILES + 1)])
+    # few files, but too long for a command line on Windows
+    long_dir = "/w/" + "d" * 200
+    assert not _fits_command_line([Path(f"{long_dir}/{i}.py") for i in range(200)])
+
+
+def test_content_formatter_max_matches_per_file():
+    builder = ToolResultBuilder()
+    formatter = _ContentFormatter(builder, line_number=False, separate_context=False)
+    formatter.feed(_rg_event("begin", path={"text": "big.txt"}))
+    for i in range(1, MAX_MATCHES_PER_FILE + 11):
+        formatter.feed(_rg_event("match", i, f"match {i}\n"))
+    formatter.feed(_rg_event("end", stats={"matched_lines": MAX_MATCHES_PER_FILE + 10}))
+
+    result = builder.ok()
+    assert isinstance(result.output, str)
+    lines = result.output.splitlines()
+    assert lines[0] == "big.txt"
+    assert lines[1:-1] == [f"match {i}" for i in range(1, MAX_MATCHES_PER_FILE + 1)]
+    assert lines[-1] == "... (10 more matching lines)"
+    assert formatter.truncated_files == {"big.txt": 10}
+
+
+@pytest.mark.asyncio
+async def test_grep_retries_ripgrep_after_failure(
+    grep_tool: Grep, temp_test_files, monkeypatch: pytest.MonkeyPatch
+):
+    """A failed download of ripgrep is tried again after a while, searching without it meanwhile."""
+    temp_dir, _ = temp_test_files
+    (Path(temp_dir) / ".hidden.py").write_text("hello\n")
+    attempts: list[float] = []
+
+    async def fail_to_download() -> str:
+        attempts.append(time.monotonic())
+        raise RuntimeError("Failed to download ripgrep binary")
+
+    monkeypatch.setattr(grep, "_ensure_rg_path", fail_to_download)
+    monkeypatch.setattr(grep, "_rg_retry_at", 0.0)
+    for _ in range(2):
+        result = await grep_tool(Params(pattern="hello", path=temp_dir))
+        assert isinstance(result, ToolOk)
+        assert isinstance(result.output, str)
+        assert "test1.py" in result.output
+        # hidden files are skipped, like ripgrep does
+        assert ".hidden.py" not in result.output
+    assert len(attempts) == 1
+
+    monkeypatch.setattr(grep, "_rg_retry_at", time.monotonic())
+    await grep_tool(Params(pattern="hello", path=temp_dir))
+    assert len(attempts) == 2
@@ -0,0 +1,152 @@
+"""Tests for hedged requests and fallback models."""
+
+from __future__ import annotations
+
+import asyncio
+from collections.abc import Sequence
+
+import pytest
+from kosong.chat_provider import APIStatusError, StreamedMessagePart
+from kosong.chat_provider.mock import MockChatProvider, MockStreamedMessage
+from kosong.message import Message, TextPart
+from kosong.tooling import Tool
+from kosong.tooling.simple import SimpleToolset
+
+from kimi_cli.llm import LLM
+from kimi_cli.soul import run_soul
+from kimi_cli.soul.agent import Agent
+from kimi_cli.soul.context import Context
+from kimi_cli.soul.hedge import OnMessagePart, hedge
+from kimi_cli.soul.kimisoul import KimiSoul
+from kimi_cli.soul.runtime import Runtime
+from kimi_cli.wire import WireUISide
+
+
+def _request(name: str, delay: float, log: list[str], *, fail: bool = False):
+    async def _run(on_message_part: OnMessagePart) -> str:
+        log.append(f"start {name}")
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            log.append(f"cancel {name}")
+            raise
+        if fail:
+            raise APIStatusError(503, f"{name} unavailable")
+        on_message_part(TextPart(text=name))
+        await asyncio.sleep(0)
+        on_message_part(TextPart(text=f"{name} again"))
+        return name
+
+    return _run
+
+
+@pytest.mark.asyncio
+async def test_hedge_primary_in_time():
+    log: list[str] = []
+    parts: list[StreamedMessagePart] = []
+    result = await hedge(
+        _request("primary", 0, log),
+        _request("backup", 0, log),
+        delay=0.05,
+        on_message_part=parts.append,
+    )
+    assert result == "primary"
+    assert log == ["start primary"]
+    assert parts == [TextPart(text="primary"), TextPart(text="primary again")]
+
+
+@pytest.mark.asyncio
+async def test_hedge_backup_wins():
+    log: list[str] = []
+    parts: list[StreamedMessagePart] = []
+    result = await hedge(
+        _request("primary", 1, log),
+        _request("backup", 0, log),
+        delay=0.01,
+        on_message_part=parts.append,
+    )
+    assert result == "backup"
+    assert log == ["start primary", "start backup", "cancel primary"]
+    assert parts == [TextPart(text="backup"), TextPart(text="backup again")]
+
+
+@pytest.mark.asyncio
+async def test_hedge_primary_fails_early():
+    log: list[str] = []
+    result = await hedge(
+        _request("primary", 0, log, fail=True),
+        _request("backup", 0, log),
+        delay=1,
+        on_message_part=lambda part: None,
+    )
+    assert result == "backup"
+
+    with pytest.raises(APIStatusError, match="primary unavailable"):
+        await hedge(
+            _request("primary", 0, log, fail=True),
+            _request("backup", 0, log, fail=True),
+            delay=1,
+            on_message_part=lambda part: None,
+        )
+
+
+class _UnavailableChatProvider(MockChatProvider):
+    def __init__(self):
+        super().__init__([])
+        self.requests: list[Sequence[Message]] = []  # shared by copies made by `with_thinking`
+
+    async def generate(
+        self, system_prompt: str, tools: Sequence[Tool], history: Sequence[Message]
+    ) -> MockStreamedMessage:
+        self.requests.append(history)
+        raise APIStatusError(429, "rate limited")
+
+
+@pytest.mark.asyncio
+async def test_fallback_model(runtime: Runtime, llm: LLM):
+    runtime.config.loop_control.max_retries_per_step = 1
+    primary = _UnavailableChatProvider()
+    llm.chat_provider = primary
+    llm.fallbacks = [
+        LLM(
+            chat_provider=MockChatProvider([TextPart(text="from fallback")]),
+            max_context_size=100_000,
+            capabilities=set(),
+        )
+    ]
+    context = Context(runtime.session.history_file)
+    soul = KimiSoul(
+        Agent(name="test", system_prompt="", toolset=SimpleToolset()), runtime, context=context
+    )
+
+    async def _ui_loop(wire: WireUISide) -> None:
+        while True:
+            await wire.receive()
+
+    await run_soul(soul, "hi", _ui_loop, asyncio.Event())
+    assert len(primary.requests) == 1
+    assert context.history[-1] == Message(
+        role="assistant", content=[TextPart(text="from fallback")]
+    )
+
+
+@pytest.mark.asyncio
+async def test_fallback_model_too_small_is_skipped(runtime: Runtime, llm: LLM):
+    runtime.config.loop_control.max_retries_per_step = 1
+    primary = _UnavailableChatProvider()
+    fallback = _UnavailableChatProvider()
+    llm.chat_provider = primary
+    llm.fallbacks = [LLM(chat_provider=fallback, max_context_size=1, capabilities=set())]
+    context = Context(runtime.session.history_file)
+    soul = KimiSoul(
+        Agent(name="test", system_prompt="", toolset=SimpleToolset()), runtime, context=context
+    )
+
+    async def _ui_loop(wire: WireUISide) -> None:
+        while True:
+            await wire.receive()
+
+    with pytest.raises(APIStatusError):
+        await run_soul(soul, "hi", _ui_loop, asyncio.Event())
+    assert len(primary.requests) == 1
+    assert fallback.requests == []
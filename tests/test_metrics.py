@@ -0,0 +1,87 @@
+"""Tests for the step latency metrics."""
+
+from __future__ import annotations
+
+import pytest
+from kosong.chat_provider import TokenUsage
+from kosong.message import TextPart, ToolCall, ToolCallPart
+from kosong.tooling import ToolOk, ToolResult
+
+from kimi_cli.soul.metrics import MetricsAggregate, StepTimer
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_step_timer(monkeypatch: pytest.MonkeyPatch):
+    clock = _Clock()
+    monkeypatch.setattr("kimi_cli.soul.metrics.time.monotonic", clock)
+    timer = StepTimer()
+
+    timer.begin_llm()
+    clock.now = 0.5
+    timer.on_message_part(TextPart(text="let me check"))
+    clock.now = 1.0
+    timer.on_message_part(
+        ToolCall(id="call_1", function=ToolCall.FunctionBody(name="Grep", arguments=None))
+    )
+    clock.now = 1.5
+    timer.on_message_part(ToolCallPart(arguments_part='{"pattern": "x"}'))
+    clock.now = 2.0
+    timer.on_message_part(
+        ToolCall(id="call_2", function=ToolCall.FunctionBody(name="Glob", arguments="{}"))
+    )
+    clock.now = 2.5
+    timer.end_llm()
+    clock.now = 3.0
+    timer.on_tool_result(ToolResult(tool_call_id="call_1", result=ToolOk(output="")))
+    clock.now = 4.0
+    timer.on_tool_result(ToolResult(tool_call_id="call_2", result=ToolOk(output="")))
+    timer.context_time = 0.25
+
+    metrics = timer.metrics(TokenUsage(input_other=200, output=100, input_cache_read=800))
+    assert metrics.llm_time == 2.5
+    assert (metrics.input_tokens, metrics.cached_tokens) == (1000, 800)
+    assert metrics.time_to_first_token == 0.5
+    assert metrics.tokens_per_second == 50.0
+    # a tool call starts when its arguments are complete
+    assert metrics.tool_times == {"call_1": 1.0, "call_2": 1.5}
+
+    aggregate = MetricsAggregate()
+    aggregate.add(metrics)
+    aggregate.add(metrics.model_copy(update={"time_to_first_token": 1.5, "output_tokens": 300}))
+    assert aggregate.n_steps == 2
+    assert aggregate.avg_time_to_first_token == 1.0
+    assert aggregate.avg_tokens_per_second == 400 / (2.0 + 6.0)
+    assert aggregate.tool_time == 5.0
+    assert aggregate.overhead_time == 0.5
+    assert aggregate.cache_hit_rate == 0.8
+
+
+def test_step_timer_resets_on_retry(monkeypatch: pytest.MonkeyPatch):
+    clock = _Clock()
+    monkeypatch.setattr("kimi_cli.soul.metrics.time.monotonic", clock)
+    timer = StepTimer()
+
+    timer.begin_llm()
+    clock.now = 1.0
+    timer.on_message_part(TextPart(text="partial"))
+    clock.now = 5.0
+    timer.begin_llm()
+    clock.now = 5.5
+    timer.end_llm()
+
+    metrics = timer.metrics(None)
+    assert metrics.llm_time == 0.5
+    assert metrics.time_to_first_token is None
+    assert metrics.tokens_per_second is None
+    assert metrics.cached_tokens is None
+
+    aggregate = MetricsAggregate()
+    aggregate.add(metrics)
+    assert aggregate.cache_hit_rate is None
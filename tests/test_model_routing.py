@@ -0,0 +1,91 @@
+"""Tests for binding models to specific purposes."""
+
+from __future__ import annotations
+
+from collections.abc import Sequence
+
+import pytest
+from kosong.chat_provider.mock import MockChatProvider
+from kosong.message import Message
+from kosong.tooling.simple import SimpleToolset
+from pydantic import SecretStr
+
+from kimi_cli.config import Config, LLMModel, LLMProvider
+from kimi_cli.llm import LLM
+from kimi_cli.soul.agent import Agent
+from kimi_cli.soul.context import Context
+from kimi_cli.soul.kimisoul import KimiSoul
+from kimi_cli.soul.runtime import Runtime
+
+
+def _add_models(config: Config) -> None:
+    config.providers["kimi"] = LLMProvider(
+        type="kimi", base_url="https://api.example.com/v1", api_key=SecretStr("sk-test")
+    )
+    config.models["small"] = LLMModel(
+        provider="kimi", model="kimi-small", max_context_size=32_000, fallback_models=["tiny"]
+    )
+    config.models["tiny"] = LLMModel(provider="kimi", model="kimi-tiny", max_context_size=8_000)
+
+
+def test_get_llm(runtime: Runtime):
+    _add_models(runtime.config)
+
+    assert runtime.get_llm(None) is runtime.llm
+    assert runtime.get_llm("unknown") is runtime.llm
+
+    small = runtime.get_llm("small")
+    assert small is not None and small is not runtime.llm
+    assert small.model_name == "kimi-small"
+    assert small.max_context_size == 32_000
+    assert [llm.model_name for llm in small.fallbacks] == ["kimi-tiny"]
+    assert runtime.get_llm("small") is small
+    assert runtime.llms == {"small": small, "tiny": small.fallbacks[0]}
+
+
+def test_link_fallbacks(runtime: Runtime, llm: LLM):
+    _add_models(runtime.config)
+    runtime.config.models["main"] = LLMModel(
+        provider="kimi", model="kimi-main", max_context_size=100_000, fallback_models=["small"]
+    )
+
+    runtime.link_fallbacks(llm, runtime.config.models["main"])
+    # the fallbacks of the main LLM have their own fallbacks, shared with `get_llm`
+    assert llm.fallbacks == [runtime.get_llm("small")]
+    assert [fallback.model_name for fallback in llm.fallbacks[0].fallbacks] == ["kimi-tiny"]
+
+
+def test_compaction_model_must_exist():
+    with pytest.raises(ValueError, match="Compaction model small not found in models"):
+        Config(compaction_model="small")
+
+
+class _RecordingCompaction:
+    def __init__(self):
+        self.llms: list[LLM] = []
+
+    async def compact(self, messages: Sequence[Message], llm: LLM) -> Sequence[Message]:
+        self.llms.append(llm)
+        return [Message(role="assistant", content="summary")]
+
+
+@pytest.mark.asyncio
+async def test_compaction_uses_compaction_model(runtime: Runtime):
+    compaction_llm = LLM(
+        chat_provider=MockChatProvider([]), max_context_size=32_000, capabilities=set()
+    )
+    runtime.llms["small"] = compaction_llm
+    soul = KimiSoul(
+        Agent(name="test", system_prompt="", toolset=SimpleToolset()),
+        runtime,
+        context=Context(runtime.session.history_file),
+    )
+    compaction = _RecordingCompaction()
+    soul._compaction = compaction  # type: ignore[assignment]
+    messages = [Message(role="user", content="hello")]
+
+    await soul._compact_with_retry(messages)
+    runtime.config.compaction_model = "small"
+    await soul._compact_with_retry(messages)
+
+    assert compaction.llms == [runtime.llm, compaction_llm]
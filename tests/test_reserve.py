@@ -0,0 +1,53 @@
+"""Tests for the adaptive reserved token budget."""
+
+from __future__ import annotations
+
+import math
+
+from kosong.tooling.simple import SimpleToolset
+
+from kimi_cli.soul.agent import Agent
+from kimi_cli.soul.context import Context
+from kimi_cli.soul.kimisoul import KimiSoul
+from kimi_cli.soul.reserve import (
+    DEFAULT_TOOL_RESULT_TOKENS,
+    MIN_OUTPUT_TOKENS,
+    ReservedTokenBudget,
+)
+from kimi_cli.soul.runtime import Runtime
+
+
+def test_initial_estimate_depends_on_thinking_effort():
+    budget = ReservedTokenBudget()
+    off = budget.estimate(256_000, "off")
+    high = budget.estimate(256_000, "high")
+    assert off == math.ceil((MIN_OUTPUT_TOKENS["off"] + DEFAULT_TOOL_RESULT_TOKENS) * 1.2)
+    assert high > off
+    # never more than half of the context window
+    assert budget.estimate(32_000, "high") == 16_000
+
+
+def test_estimate_follows_observed_steps():
+    budget = ReservedTokenBudget()
+    for _ in range(19):
+        budget.observe(1_000, 2_000)
+    budget.observe(None, 2_000)
+    # small outputs are floored by the thinking effort
+    assert budget.estimate(256_000, "off") == math.ceil((MIN_OUTPUT_TOKENS["off"] + 2_000) * 1.2)
+
+    # one outlier out of twenty is below the 95th percentile, two are not
+    budget.observe(30_000, 50_000)
+    assert budget.estimate(256_000, "off") == math.ceil((MIN_OUTPUT_TOKENS["off"] + 2_000) * 1.2)
+    budget.observe(30_000, 50_000)
+    assert budget.estimate(256_000, "off") == math.ceil((30_000 + 50_000) * 1.2)
+
+
+def test_configured_reserve_beyond_context_window_is_estimated(runtime: Runtime):
+    runtime.config.loop_control.reserved_tokens = 200_000
+    assert runtime.llm is not None and runtime.llm.max_context_size == 100_000
+    soul = KimiSoul(
+        Agent(name="test", system_prompt="", toolset=SimpleToolset()),
+        runtime,
+        context=Context(runtime.session.history_file),
+    )
+    assert soul._reserved_tokens == ReservedTokenBudget().estimate(100_000, "off")  # pyright: ignore[reportPrivateUsage]
@@ -4,6 +4,9 @@ from pathlib import Path
 
 import pytest
 
+from kimi_cli.session import Session
+from kimi_cli.soul.runtime import freeze_prompt_args
+
 
 @pytest.fixture
 def isolated_share_dir(monkeypatch, tmp_path: Path) -> Path:
@@ -19,3 +22,16 @@ def isolated_share_dir(monkeypatch, tmp_path: Path) -> Path:
     monkeypatch.setattr("kimi_cli.share.get_share_dir", _get_share_dir)
     monkeypatch.setattr("kimi_cli.metadata.get_share_dir", _get_share_dir)
     return share_dir
+
+
+def test_freeze_prompt_args(session: Session):
+    file = session.prompt_args_file
+    args = {"KIMI_NOW": "2025-01-01", "KIMI_WORK_DIR_LS": "a.py"}
+    assert freeze_prompt_args(file, args) == args
+    # the frozen values are kept when the session is continued
+    assert freeze_prompt_args(file, {"KIMI_NOW": "2025-01-02", "KIMI_WORK_DIR_LS": "b.py"}) == args
+
+    file.write_text("not json", encoding="utf-8")
+    new_args = {"KIMI_NOW": "2025-01-03", "KIMI_WORK_DIR_LS": "c.py"}
+    assert freeze_prompt_args(file, new_args) == new_args
+    assert freeze_prompt_args(file, args) == new_args
@@ -9,6 +9,8 @@ from kimi_cli.soul.message import (
     system,
     tool_ok_to_message_content,
     tool_result_to_message,
+    with_current_time,
+    without_current_time,
 )
 
 
@@ -21,6 +23,18 @@ def test_system_message_creation():
     assert result.text == f"<system>{message}</system>"
 
 
+def test_current_time_is_appended_and_removed():
+    """Test that the current time is appended at the tail of a message, and can be removed."""
+    message = Message(role="user", content="Hello")
+    timed = with_current_time(message)
+
+    assert isinstance(timed.content, list)
+    assert timed.content[0] == TextPart(text="Hello")
+    assert isinstance(timed.content[-1], TextPart)
+    assert timed.content[-1].text.startswith("<system>The current date and time")
+    assert without_current_time(timed) == Message(role="user", content=[TextPart(text="Hello")])
+
+
 def test_tool_ok_with_string_output():
     """Test ToolOk with string output."""
     tool_ok = ToolOk(output="Hello, world!")
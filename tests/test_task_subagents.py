@@ -4,9 +4,17 @@ from __future__ import annotations
 
 import platform
 from pathlib import Path
+from typing import Any
+
+import pytest
 from inline_snapshot import snapshot
+from kosong.message import Message, ToolCall
+from kosong.tooling import ToolError, ToolOk
 
-from kimi_cli.tools.task import Task
+import kimi_cli.tools.task as task_module
+from kimi_cli.soul.context import Context
+from kimi_cli.soul.kimisoul import KimiSoul
+from kimi_cli.tools.task import Params, Task
 
 
 def test_task_subagents(task_tool: Task, temp_work_dir: Path):
@@ -110,3 +118,32 @@ Test agents content
             )
         ]
     )
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("fails", [False, True])
+async def test_task_closes_subagent_context(
+    task_tool: Task, monkeypatch: pytest.MonkeyPatch, fails: bool
+):
+    contexts: list[Context] = []
+
+    async def fake_run_soul(soul: KimiSoul, user_input: Any, *args: Any) -> None:
+        contexts.append(soul.context)
+        await soul.context.append_message(Message(role="assistant", content="done " * 50))
+        if fails:
+            raise RuntimeError("subagent crashed")
+
+    monkeypatch.setattr(task_module, "run_soul", fake_run_soul)
+    monkeypatch.setattr(task_module, "get_wire_or_none", lambda: object())
+    monkeypatch.setattr(
+        task_module,
+        "get_current_tool_call_or_none",
+        lambda: ToolCall(id="1", function=ToolCall.FunctionBody(name="Task", arguments="{}")),
+    )
+
+    result = await task_tool(Params(description="test", subagent_name="coder", prompt="hi"))
+    assert isinstance(result, ToolError if fails else ToolOk)
+    [context] = contexts
+    # the history file handle is released, with the buffered records written
+    assert context._writer._file is None  # pyright: ignore[reportPrivateUsage]
+    assert "done" in context._file_backend.read_text()  # pyright: ignore[reportPrivateUsage]
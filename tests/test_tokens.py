@@ -0,0 +1,129 @@
+"""Tests for the local token estimation."""
+
+from __future__ import annotations
+
+import base64
+from pathlib import Path
+
+import pytest
+from kosong.message import Message, TextPart, ToolCall
+
+from kimi_cli.soul.context import Context
+from kimi_cli.soul.tokens import (
+    MESSAGE_OVERHEAD_TOKENS,
+    HeuristicTokenEstimator,
+    TableTokenEstimator,
+    create_token_estimator,
+    estimate_message_tokens,
+)
+
+
+def test_heuristic_estimator():
+    estimator = HeuristicTokenEstimator()
+    assert estimator.count_text("") == 0
+    assert estimator.count_text("abcdefgh") == 2
+    assert estimator.count_text("你好世界") == 4
+    assert estimator.count_text("abcd你好") == 3
+
+
+def test_table_estimator(tmp_path: Path):
+    table = tmp_path / "tokenizer.tiktoken"
+    vocab = [b"hello", b" world", b"wor", b"ld", b"!"] + [bytes([i]) for i in range(256)]
+    table.write_text(
+        "".join(f"{base64.b64encode(token).decode()} {rank}\n" for rank, token in enumerate(vocab))
+    )
+
+    estimator = TableTokenEstimator.load(table)
+    assert estimator.count_text("hello world!") == 3
+    assert estimator.count_text("helloworld") == 3  # hello + wor + ld
+    assert estimator.count_text("xyz") == 3
+
+    assert isinstance(create_token_estimator(str(table)), TableTokenEstimator)
+    assert isinstance(
+        create_token_estimator(str(tmp_path / "missing.tiktoken")), HeuristicTokenEstimator
+    )
+
+
+def test_estimate_message_tokens():
+    estimator = HeuristicTokenEstimator()
+    message = Message(
+        role="assistant",
+        content=[TextPart(text="a" * 40)],
+        tool_calls=[
+            ToolCall(
+                id="call_1",
+                function=ToolCall.FunctionBody(name="Grep", arguments='{"pattern": "x"}'),
+            )
+        ],
+    )
+    assert estimate_message_tokens(message, estimator) == (
+        MESSAGE_OVERHEAD_TOKENS + 10 + MESSAGE_OVERHEAD_TOKENS + 1 + 4
+    )
+
+
+@pytest.mark.asyncio
+async def test_context_projected_token_count(temp_share_dir: Path):
+    file_backend = temp_share_dir / "history.jsonl"
+    context = Context(file_backend)
+    tool_output = Message(role="tool", content="x" * 4000, tool_call_id="call_1")
+    n_estimated = estimate_message_tokens(tool_output, HeuristicTokenEstimator())
+
+    await context.checkpoint(add_user_message=False)
+    await context.append_message(Message(role="user", content="hi"))
+    await context.update_token_count(100)
+    assert context.projected_token_count == 100
+
+    await context.checkpoint(add_user_message=False)
+    await context.append_message(tool_output)
+    assert context.token_count == 100
+    assert context.projected_token_count == 100 + n_estimated
+    await context.flush()
+
+    # the estimate of messages after the last token count survives restore and revert
+    restored = Context(file_backend)
+    assert await restored.restore()
+    assert restored.projected_token_count == 100 + n_estimated
+    await restored.checkpoint(add_user_message=False)
+    await restored.update_token_count(2000)
+    assert restored.projected_token_count == 2000
+    await restored.revert_to(2)
+    assert restored.projected_token_count == 100 + n_estimated
+
+
+@pytest.mark.asyncio
+async def test_context_measures_message_tokens(temp_share_dir: Path):
+    file_backend = temp_share_dir / "history.jsonl"
+    context = Context(file_backend)
+    assistant = Message(
+        role="assistant",
+        content="let me look",
+        tool_calls=[
+            ToolCall(id="call_1", function=ToolCall.FunctionBody(name="ReadFile", arguments="{}")),
+            ToolCall(id="call_2", function=ToolCall.FunctionBody(name="Grep", arguments="{}")),
+        ],
+    )
+
+    await context.append_message(Message(role="user", content="hi"))
+    await context.update_token_count(1000)  # includes the system prompt, not measured
+    await context.append_message(assistant)
+    await context.update_token_count(1050)
+    await context.append_message(
+        [
+            Message(role="tool", content="a" * 3000, tool_call_id="call_1"),
+            Message(role="tool", content="b" * 1000, tool_call_id="call_2"),
+        ]
+    )
+    await context.update_token_count(2050)
+    await context.flush()
+
+    # the growth of 1000 tokens is split by the estimates of 754 and 254 tokens
+    assert context.message_tokens[1:] == [50, 748, 252]
+    breakdown = context.token_breakdown()
+    assert breakdown.by_role == {"user": context.message_tokens[0], "assistant": 50, "tool": 1000}
+    assert breakdown.by_tool == {"ReadFile": 748, "Grep": 252}
+
+    # measured tokens are persisted
+    restored = Context(file_backend)
+    assert await restored.restore()
+    assert restored.message_tokens == context.message_tokens
+    assert restored.token_breakdown() == breakdown
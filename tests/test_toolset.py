@@ -0,0 +1,254 @@
+"""Tests for the tool call scheduling, speculation and caching of `CustomToolset`."""
+
+import asyncio
+import json
+from pathlib import Path
+from typing import override
+
+import kosong
+import pytest
+from kosong.chat_provider import StreamedMessagePart
+from kosong.chat_provider.mock import MockChatProvider
+from kosong.message import TextPart, ToolCall, ToolCallPart
+from kosong.tooling import CallableTool2, ToolOk, ToolResult, ToolReturnType
+from pydantic import BaseModel
+
+from kimi_cli.soul.toolcache import CACHE_HIT_MESSAGE
+from kimi_cli.soul.toolset import CustomToolset, ToolCallSpeculator, classify_tool_call
+
+
+class _Params(BaseModel):
+    path: str = "."
+
+
+class _Recorder:
+    def __init__(self):
+        self.running: set[str] = set()
+        self.max_running = 0
+        self.log: list[str] = []
+
+    async def run(self, name: str) -> ToolReturnType:
+        self.running.add(name)
+        self.max_running = max(self.max_running, len(self.running))
+        self.log.append(f"start {name}")
+        await asyncio.sleep(0.01)
+        self.log.append(f"end {name}")
+        self.running.discard(name)
+        return ToolOk(output=name)
+
+
+def _tool(tool_name: str, recorder: _Recorder) -> CallableTool2[_Params]:
+    class _Tool(CallableTool2[_Params]):
+        name: str = tool_name
+        description: str = tool_name
+        params: type[_Params] = _Params
+
+        @override
+        async def __call__(self, params: _Params) -> ToolReturnType:
+            return await recorder.run(f"{tool_name}:{params.path}")
+
+    return _Tool()
+
+
+def _call(call_id: str, name: str, path: str | None = None) -> ToolCall:
+    arguments = json.dumps({"path": path} if path is not None else {})
+    return ToolCall(id=call_id, function=ToolCall.FunctionBody(name=name, arguments=arguments))
+
+
+def _toolset(recorder: _Recorder, max_concurrency: int = 8) -> CustomToolset:
+    toolset = CustomToolset(max_concurrency=max_concurrency)
+    for name in ["ReadFile", "WriteFile", "Shell", "Task"]:
+        toolset += _tool(name, recorder)
+    return toolset
+
+
+async def _handle_all(toolset: CustomToolset, calls: list[ToolCall]) -> list[ToolResult]:
+    futures: list[asyncio.Future[ToolResult]] = []
+    for call in calls:
+        result = toolset.handle(call)
+        assert not isinstance(result, ToolResult)
+        futures.append(result)
+    return list(await asyncio.gather(*futures))
+
+
+def test_classify_tool_call():
+    assert classify_tool_call(_call("1", "ReadFile", "/w/a.py")) == ("read_only", "/w/a.py")
+    assert classify_tool_call(_call("2", "Grep", "relative")) == ("read_only", None)
+    assert classify_tool_call(_call("3", "WriteFile", "/w/./b.py")) == ("path_write", "/w/b.py")
+    assert classify_tool_call(_call("4", "WriteFile")) == ("global", None)
+    assert classify_tool_call(_call("5", "Shell")) == ("global", None)
+    assert classify_tool_call(_call("6", "Task")) == ("subagent", None)
+
+
+@pytest.mark.asyncio
+async def test_reads_run_in_parallel_under_cap():
+    recorder = _Recorder()
+    toolset = _toolset(recorder, max_concurrency=3)
+    calls = [_call(str(i), "ReadFile", f"/w/{i}.py") for i in range(6)]
+
+    results = await _handle_all(toolset, calls)
+    assert [r.tool_call_id for r in results] == [str(i) for i in range(6)]
+    assert recorder.max_running == 3
+
+
+@pytest.mark.asyncio
+async def test_conflicting_calls_run_in_order():
+    recorder = _Recorder()
+    toolset = _toolset(recorder)
+    calls = [
+        _call("1", "ReadFile", "/w/a.py"),
+        _call("2", "WriteFile", "/w/a.py"),
+        _call("3", "WriteFile", "/w/b.py"),
+        _call("4", "ReadFile", "/w/a.py"),
+        _call("5", "Shell"),
+        _call("6", "ReadFile", "/w/c.py"),
+    ]
+
+    await _handle_all(toolset, calls)
+    log = recorder.log
+    # the write to a.py waits for the read of it, and the next read waits for the write
+    assert log.index("end ReadFile:/w/a.py") < log.index("start WriteFile:/w/a.py")
+    assert log.index("end WriteFile:/w/a.py") < log.index("start ReadFile:/w/a.py", 2)
+    # the write to b.py does not conflict with a.py
+    assert log.index("start WriteFile:/w/b.py") < log.index("end ReadFile:/w/a.py")
+    # a global call waits for everything before it, and blocks everything after it
+    assert log[-4:] == [
+        "start Shell:.",
+        "end Shell:.",
+        "start ReadFile:/w/c.py",
+        "end ReadFile:/w/c.py",
+    ]
+
+
+@pytest.mark.asyncio
+async def test_subagents_run_in_parallel():
+    recorder = _Recorder()
+    toolset = _toolset(recorder)
+    calls = [
+        _call("1", "Task", "/w/a"),
+        _call("2", "Task", "/w/b"),
+        _call("3", "ReadFile", "/w/c.py"),
+        _call("4", "WriteFile", "/w/d.py"),
+    ]
+
+    await _handle_all(toolset, calls)
+    log = recorder.log
+    # subagents overlap with each other and with reads, but a write waits for them
+    assert log[:3] == ["start Task:/w/a", "start Task:/w/b", "start ReadFile:/w/c.py"]
+    assert recorder.max_running == 3
+    assert log.index("end Task:/w/b") < log.index("start WriteFile:/w/d.py")
+
+
+@pytest.mark.asyncio
+async def test_speculative_tool_calls_while_streaming():
+    recorder = _Recorder()
+    toolset = _toolset(recorder)
+    speculator = ToolCallSpeculator(toolset)
+    parts = [
+        ToolCall(id="1", function=ToolCall.FunctionBody(name="ReadFile", arguments='{"path": ')),
+        ToolCallPart(arguments_part='"/w/a.py"}'),
+        ToolCall(id="2", function=ToolCall.FunctionBody(name="WriteFile", arguments="{}")),
+        TextPart(text="done"),
+    ]
+
+    def on_message_part(part: StreamedMessagePart) -> None:
+        speculator.feed(part)
+        if isinstance(part, ToolCall) and part.id == "2":
+            # the read has started before the response ends
+            assert recorder.log == []
+            assert toolset._speculative.keys() == {"1"}  # pyright: ignore[reportPrivateUsage]
+
+    result = await kosong.step(
+        MockChatProvider(parts), "", toolset, [], on_message_part=on_message_part
+    )
+    results = await result.tool_results()
+    speculator.cancel()
+
+    assert [r.tool_call_id for r in results] == ["1", "2"]
+    assert recorder.log.count("start ReadFile:/w/a.py") == 1
+    assert "start WriteFile:." in recorder.log  # writers are not speculated
+
+
+@pytest.mark.asyncio
+async def test_speculative_read_waits_for_earlier_write():
+    recorder = _Recorder()
+    toolset = _toolset(recorder)
+    speculator = ToolCallSpeculator(toolset)
+    parts: list[StreamedMessagePart] = [
+        ToolCall(
+            id="1",
+            function=ToolCall.FunctionBody(name="WriteFile", arguments='{"path": "/w/a.py"}'),
+        ),
+        ToolCall(
+            id="2", function=ToolCall.FunctionBody(name="ReadFile", arguments='{"path": "/w/a.py"}')
+        ),
+        ToolCall(
+            id="3", function=ToolCall.FunctionBody(name="ReadFile", arguments='{"path": "/w/b.py"}')
+        ),
+    ]
+
+    def on_message_part(part: StreamedMessagePart) -> None:
+        speculator.feed(part)
+
+    result = await kosong.step(
+        MockChatProvider(parts), "", toolset, [], on_message_part=on_message_part
+    )
+    results = await result.tool_results()
+    speculator.cancel()
+
+    assert [r.tool_call_id for r in results] == ["1", "2", "3"]
+    log = recorder.log
+    assert log.index("end WriteFile:/w/a.py") < log.index("start ReadFile:/w/a.py")
+    # reads of other paths are still speculated
+    assert log.index("start ReadFile:/w/b.py") < log.index("end WriteFile:/w/a.py")
+
+
+@pytest.mark.asyncio
+async def test_speculative_tool_call_with_other_arguments_is_discarded():
+    recorder = _Recorder()
+    toolset = _toolset(recorder)
+    assert toolset.speculate(_call("1", "ReadFile", "/w/a.py"))
+    assert not toolset.speculate(_call("2", "WriteFile", "/w/a.py"))
+
+    result = toolset.handle(_call("1", "ReadFile", "/w/b.py"))
+    assert not isinstance(result, ToolResult)
+    assert (await result).result == ToolOk(output="ReadFile:/w/b.py")
+
+    assert toolset.speculate(_call("3", "ReadFile", "/w/c.py"))
+    toolset.cancel_speculative()
+    await asyncio.sleep(0.02)
+    assert "end ReadFile:/w/c.py" not in recorder.log
+
+
+@pytest.mark.asyncio
+async def test_cached_tool_results(tmp_path: Path):
+    recorder = _Recorder()
+    toolset = CustomToolset(cache_results=True)
+    for name in ["ReadFile", "WriteFile", "Shell", "Task"]:
+        toolset += _tool(name, recorder)
+    file = tmp_path / "a.py"
+    file.write_text("a")
+    path = str(file)
+
+    async def read() -> ToolOk:
+        [result] = await _handle_all(toolset, [_call("r", "ReadFile", path)])
+        assert isinstance(result.result, ToolOk)
+        return result.result
+
+    assert CACHE_HIT_MESSAGE not in (await read()).message
+    assert CACHE_HIT_MESSAGE in (await read()).message
+    assert recorder.log.count(f"start ReadFile:{path}") == 1
+
+    # invalidated by a write tool call to the path
+    await _handle_all(toolset, [_call("w", "WriteFile", path)])
+    assert CACHE_HIT_MESSAGE not in (await read()).message
+    # invalidated by modifications by other means
+    file.write_text("changed")
+    assert CACHE_HIT_MESSAGE not in (await read()).message
+    # invalidated by a tool call with global effect
+    await _handle_all(toolset, [_call("s", "Shell")])
+    assert CACHE_HIT_MESSAGE not in (await read()).message
+    assert recorder.log.count(f"start ReadFile:{path}") == 4
+
+    toolset.clear_cache()
+    assert CACHE_HIT_MESSAGE not in (await read()).message
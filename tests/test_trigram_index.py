@@ -0,0 +1,149 @@
+"""Tests for the trigram index of Grep."""
+
+from __future__ import annotations
+
+import math
+import os
+import shutil
+from pathlib import Path
+
+import pytest
+from kosong.tooling import ToolOk
+
+from kimi_cli.config import Config
+from kimi_cli.soul.runtime import BuiltinSystemPromptArgs
+from kimi_cli.tools.file.grep import Grep, Params
+from kimi_cli.tools.file.trigram import TrigramIndex, required_trigrams
+from kimi_cli.workspace import WorkspaceIndex
+
+
+def test_required_trigrams():
+    assert required_trigrams("hello", ignore_case=False) == {b"hel", b"ell", b"llo"}
+    assert required_trigrams("HeLLo", ignore_case=True) == {b"hel", b"ell", b"llo"}
+    assert required_trigrams(r"def\s+foo\(", ignore_case=False) == {b"def", b"foo", b"oo("}
+    # the quantified character is optional
+    assert required_trigrams("abcd?", ignore_case=False) == {b"abc"}
+    assert required_trigrams("abc*", ignore_case=False) == set()
+    # the arguments of escapes are not literals
+    assert required_trigrams(r"\x41bcd", ignore_case=False) == {b"bcd"}
+    # groups and character classes are skipped
+    assert required_trigrams("(abc)?def", ignore_case=False) == {b"def"}
+    assert required_trigrams("[xyz]def", ignore_case=False) == {b"def"}
+    assert required_trigrams("[]x]def", ignore_case=False) == {b"def"}
+    assert required_trigrams("[[:digit:]]abc", ignore_case=False) == {b"abc"}
+    assert required_trigrams("[a-z&&[^x]]foo", ignore_case=False) == {b"foo"}
+    assert required_trigrams(r"[\[\]]foo", ignore_case=False) == {b"foo"}
+    assert required_trigrams("foo|bar", ignore_case=False) == set()
+    assert required_trigrams("(?x)a b c", ignore_case=False) == set()
+
+
+def _touch(path: Path, content: str) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(content)
+    # make sure the modification is noticed even within the timestamp granularity
+    st = path.stat()
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+
+
+@pytest.mark.asyncio
+async def test_trigram_index(temp_work_dir: Path, temp_share_dir: Path):
+    _touch(temp_work_dir / "a.py", "def hello():\n    pass\n")
+    _touch(temp_work_dir / "sub" / "b.py", "print('HELLO world')\n")
+    _touch(temp_work_dir / "c.txt", "nothing to see\n")
+    _touch(temp_work_dir / "node_modules" / "d.js", "hello\n")
+    (temp_work_dir / "e.bin").write_bytes(b"hello\0")
+
+    index_file = temp_share_dir / "index.db"
+    index = TrigramIndex(temp_work_dir, index_file)
+    hello = required_trigrams("hello", ignore_case=False)
+    assert await index.candidates(hello, temp_work_dir) == [
+        temp_work_dir / "a.py",
+        temp_work_dir / "sub" / "b.py",
+    ]
+    assert await index.candidates(hello, temp_work_dir / "sub") == [temp_work_dir / "sub/b.py"]
+    assert not index.covers(temp_work_dir / "node_modules")
+
+    _touch(temp_work_dir / "c.txt", "hello there\n")
+    (temp_work_dir / "a.py").unlink()
+    assert await index.candidates(hello, temp_work_dir) == [
+        temp_work_dir / "c.txt",
+        temp_work_dir / "sub" / "b.py",
+    ]
+
+    # the index is persisted
+    reopened = TrigramIndex(temp_work_dir, index_file)
+    assert await reopened.candidates(hello, temp_work_dir) == [
+        temp_work_dir / "c.txt",
+        temp_work_dir / "sub" / "b.py",
+    ]
+
+
+@pytest.mark.asyncio
+async def test_grep_with_trigram_index(
+    config: Config,
+    builtin_args: BuiltinSystemPromptArgs,
+    temp_share_dir: Path,
+    monkeypatch: pytest.MonkeyPatch,
+):
+    monkeypatch.setattr("kimi_cli.tools.file.trigram.get_share_dir", lambda: temp_share_dir)
+    config.workspace.trigram_index = True
+    work_dir = builtin_args.KIMI_WORK_DIR.resolve()
+    _touch(work_dir / "a.py", "def hello():\n    return 1\n")
+    _touch(work_dir / "b.js", "function hello() {}\n")
+    _touch(work_dir / "c.py", "def goodbye():\n    return 2\n")
+
+    grep = Grep(config, builtin_args, WorkspaceIndex(work_dir))
+    result = await grep(Params(pattern=r"def \w+llo", path=str(work_dir), glob="*.py"))
+    assert isinstance(result, ToolOk)
+    assert result.output == str(work_dir / "a.py")
+
+    result = await grep(
+        Params.model_validate(
+            {"pattern": "return", "path": str(work_dir), "output_mode": "content", "-n": True}
+        )
+    )
+    assert isinstance(result, ToolOk)
+    assert (
+        result.output
+        == f"{work_dir / 'a.py'}\n2:    return 1\n\n{work_dir / 'c.py'}\n2:    return 2\n"
+    )
+    assert list((temp_share_dir / "grep_index").iterdir())
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("ripgrep", [True, False], ids=["ripgrep", "python"])
+@pytest.mark.parametrize("started", [True, False], ids=["indexed", "walked"])
+async def test_grep_narrowed_like_not_narrowed(
+    config: Config,
+    builtin_args: BuiltinSystemPromptArgs,
+    temp_share_dir: Path,
+    monkeypatch: pytest.MonkeyPatch,
+    ripgrep: bool,
+    started: bool,
+):
+    if ripgrep and shutil.which("rg") is None:
+        pytest.skip("ripgrep is not installed")
+    if not ripgrep:
+        monkeypatch.setattr("kimi_cli.tools.file.grep._rg_retry_at", math.inf)
+    monkeypatch.setattr("kimi_cli.tools.file.trigram.get_share_dir", lambda: temp_share_dir)
+    work_dir = builtin_args.KIMI_WORK_DIR.resolve()
+    (work_dir / ".git").mkdir()  # ripgrep applies `.gitignore` files only in repositories
+    _touch(work_dir / ".gitignore", "*.log\ngenerated/\n")
+    for rel_path in ["a.py", "sub/app.log", "sub/.env", ".github/ci.yml", "generated/b.py"]:
+        _touch(work_dir / rel_path, "token = 'secret'\n")
+
+    workspace = WorkspaceIndex(work_dir)
+    if started:
+        await workspace.start()
+        assert await workspace.wait_ready()
+    outputs: list[str | None] = []
+    for trigram_index in (False, True):
+        config.workspace.trigram_index = trigram_index
+        grep = Grep(config, builtin_args, workspace)
+        result = await grep(Params(pattern="secret", path=str(work_dir)))
+        assert isinstance(result, ToolOk)
+        assert isinstance(result.output, str)
+        outputs.append(result.output)
+    await workspace.aclose()
+    # hidden and ignored files are skipped whether the files are narrowed down or not
+    assert outputs == [str(work_dir / "a.py")] * 2
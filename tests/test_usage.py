@@ -0,0 +1,57 @@
+"""Tests for the usage ledger."""
+
+from __future__ import annotations
+
+from pathlib import Path
+from typing import get_args
+
+import pytest
+from inline_snapshot import snapshot
+from kosong.chat_provider import TokenUsage
+
+import kimi_cli.cli
+import kimi_cli.usage
+from kimi_cli.usage import UsageLedger, aggregate_usage, format_usage, iter_usage_records
+
+
+@pytest.mark.asyncio
+async def test_usage_ledger(temp_share_dir: Path, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(kimi_cli.usage, "MAX_LEDGER_FILE_SIZE", 400)
+    file = temp_share_dir / "usage.jsonl"
+    ledger = UsageLedger(file, session_id="s1", work_dir=Path("/w"))
+    usage = TokenUsage(input_other=100, output=50, input_cache_read=900)
+
+    await ledger.record("step", "kimi", usage, 2.0)
+    await ledger.record("compaction", "small", usage, 1.0)
+    await ledger.for_subagent("coder").record("step", "kimi", usage, 3.0, tool_call_id="task_1")
+    other = UsageLedger(file, session_id="s2", work_dir=Path("/w"))
+    await other.record("step", "kimi", usage, 4.0)
+
+    # the ledger file has been rotated
+    assert (temp_share_dir / "usage_1.jsonl").exists()
+    records = list(iter_usage_records(file))
+    assert [r.wall_time for r in records] == [2.0, 1.0, 3.0, 4.0]
+    assert records[2].subagent == "coder" and records[2].tool_call_id == "task_1"
+    assert records[0].input_tokens == 1000 and records[0].cached_tokens == 900
+
+    by_model = aggregate_usage(records, "model")
+    assert list(by_model) == ["kimi", "small"]
+    assert by_model["kimi"].n_calls == 3
+    assert format_usage(aggregate_usage(records, "session"), "session") == snapshot("""\
+session  calls  input  cached  output   time
+s1           3  3,000   2,700     150   6.0s
+s2           1  1,000     900      50   4.0s
+total        4  4,000   3,600     200  10.0s\
+""")
+
+
+def test_iter_usage_records_skips_invalid_lines(temp_share_dir: Path):
+    file = temp_share_dir / "usage.jsonl"
+    assert list(iter_usage_records(file)) == []
+    file.write_text('{"not": "a record"}\n\n', encoding="utf-8")
+    assert list(iter_usage_records(file)) == []
+
+
+def test_cli_usage_groups():
+    # declared separately in the CLI, which does not import the usage module at startup
+    assert get_args(kimi_cli.cli.UsageGroup) == get_args(kimi_cli.usage.UsageGroup)
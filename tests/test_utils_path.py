@@ -7,7 +7,8 @@ from pathlib import Path
 
 import pytest
 
-from kimi_cli.utils.path import next_available_rotation
+from kimi_cli.utils.gitignore import GitIgnore
+from kimi_cli.utils.path import expand_braces, next_available_rotation
 
 
 @pytest.mark.asyncio
@@ -235,3 +236,49 @@ async def test_next_available_rotation_concurrent_calls(tmp_path):
         "events_4.log",
         "events_5.log",
     }
+
+
+def test_expand_braces():
+    """Test expand_braces with nested and multiple alternatives."""
+    assert expand_braces("*.py") == ["*.py"]
+    assert expand_braces("*.{js,ts}") == ["*.js", "*.ts"]
+    assert expand_braces("{src,lib}/*.{c,h}") == ["src/*.c", "src/*.h", "lib/*.c", "lib/*.h"]
+
+
+def test_gitignore(tmp_path: Path):
+    """Test GitIgnore with anchored, negated and nested rules."""
+    (tmp_path / ".gitignore").write_text("# comment\n*.log\n!keep.log\n/build/\ndocs/**/*.tmp\n")
+    (tmp_path / "sub").mkdir()
+    (tmp_path / "sub" / ".gitignore").write_text("local\n")
+    gitignore = GitIgnore(tmp_path)
+
+    def ignored(rel_path: str, is_dir: bool = False) -> bool:
+        return gitignore.is_ignored(str(tmp_path / rel_path), is_dir=is_dir)
+
+    assert ignored("debug.log")
+    assert ignored("sub/debug.log")
+    assert not ignored("keep.log")
+    assert ignored("build", is_dir=True)
+    assert not ignored("build")  # only directories
+    assert not ignored("sub/build", is_dir=True)  # anchored to the top
+    assert ignored("docs/a/b/c.tmp")
+    assert not ignored("c.tmp")
+    assert ignored("sub/local")
+    assert not ignored("local")
+
+
+def test_gitignore_extra_patterns(tmp_path: Path):
+    """Test GitIgnore with extra patterns, overridden by the `.gitignore` files."""
+    (tmp_path / ".gitignore").write_text("!fixtures/keep/\n")
+    gitignore = GitIgnore(tmp_path, ["fixtures/*/", "*.snap"])
+
+    assert gitignore.is_ignored(str(tmp_path / "fixtures" / "other"), is_dir=True)
+    assert not gitignore.is_ignored(str(tmp_path / "fixtures" / "keep"), is_dir=True)
+    assert gitignore.is_ignored(str(tmp_path / "a" / "b.snap"), is_dir=False)
+
+    # the rules of a `.gitignore` file are read again once forgotten
+    (tmp_path / ".gitignore").write_text("*.log\n")
+    assert not gitignore.is_ignored(str(tmp_path / "debug.log"), is_dir=False)
+    gitignore.forget(str(tmp_path))
+    assert gitignore.is_ignored(str(tmp_path / "debug.log"), is_dir=False)
+    assert gitignore.is_ignored(str(tmp_path / "fixtures" / "keep"), is_dir=True)
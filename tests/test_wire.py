@@ -0,0 +1,53 @@
+"""Tests for the coalescing of streamed parts in `Wire`."""
+
+from __future__ import annotations
+
+import pytest
+from kosong.message import TextPart, ThinkPart, ToolCall, ToolCallPart
+
+from kimi_cli.wire import Wire, WireMessage
+from kimi_cli.wire.message import ApprovalRequest, StepBegin
+
+
+def _drain(wire: Wire) -> list[WireMessage]:
+    messages: list[WireMessage] = []
+    while (msg := wire.ui_side.receive_nowait()) is not None:
+        messages.append(msg)
+    return messages
+
+
+@pytest.mark.asyncio
+async def test_wire_does_not_coalesce_below_threshold():
+    wire = Wire(coalesce_threshold=4)
+    for text in "abc":
+        wire.soul_side.send(TextPart(text=text))
+    assert _drain(wire) == [TextPart(text="a"), TextPart(text="b"), TextPart(text="c")]
+
+
+@pytest.mark.asyncio
+async def test_wire_coalesces_when_consumer_falls_behind():
+    wire = Wire(coalesce_threshold=2)
+    sent = [TextPart(text=text) for text in "abcdef"]
+    approval = ApprovalRequest(tool_call_id="1", sender="Bash", action="run", description="ls")
+    for part in sent[:4]:
+        wire.soul_side.send(part)
+    wire.soul_side.send(approval)
+    wire.soul_side.send(ThinkPart(think="hm"))
+    wire.soul_side.send(ThinkPart(think="m"))
+    wire.soul_side.send(StepBegin(n=2))
+    wire.soul_side.send(ToolCall(id="1", function=ToolCall.FunctionBody(name="Bash", arguments="")))
+    wire.soul_side.send(ToolCallPart(arguments_part='{"command"'))
+    wire.soul_side.send(ToolCallPart(arguments_part=': "ls"}'))
+
+    assert _drain(wire) == [
+        TextPart(text="a"),
+        TextPart(text="bcd"),
+        approval,
+        ThinkPart(think="hmm"),
+        StepBegin(n=2),
+        ToolCall(
+            id="1", function=ToolCall.FunctionBody(name="Bash", arguments='{"command": "ls"}')
+        ),
+    ]
+    # the sent parts are not modified
+    assert sent[1] == TextPart(text="b")
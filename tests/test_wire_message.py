@@ -10,7 +10,9 @@ from kimi_cli.wire.message import (
     StatusUpdate,
     StepBegin,
     StepInterrupted,
+    StepMetrics,
     SubagentEvent,
+    serialize_event,
 )
 
 
@@ -34,6 +36,19 @@ async def test_wire_message_serialization():
     msg = StatusUpdate(status=status)
     assert msg.model_dump(exclude_none=True) == snapshot({"status": {"context_usage": 0.5}})
 
+    msg = StepMetrics(llm_time=2.0, time_to_first_token=0.5, tool_times={"call_1": 0.25})
+    assert serialize_event(msg) == snapshot(
+        {
+            "type": "step_metrics",
+            "payload": {
+                "llm_time": 2.0,
+                "time_to_first_token": 0.5,
+                "tool_times": {"call_1": 0.25},
+                "context_time": 0.0,
+            },
+        }
+    )
+
     msg = TextPart(text="Hello world")
     assert msg.model_dump(exclude_none=True) == snapshot({"type": "text", "text": "Hello world"})
 
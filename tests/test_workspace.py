@@ -0,0 +1,231 @@
+"""Tests for the workspace file index."""
+
+from __future__ import annotations
+
+import math
+import os
+import shutil
+import sys
+from collections.abc import AsyncGenerator
+from contextlib import asynccontextmanager
+from pathlib import Path
+
+import pytest
+from kosong.tooling import ToolOk
+
+from kimi_cli.config import Config
+from kimi_cli.soul.runtime import BuiltinSystemPromptArgs
+from kimi_cli.tools.file import grep
+from kimi_cli.tools.file.glob import Glob, Params, _iter_glob
+from kimi_cli.workspace import WorkspaceIndex
+
+
+@pytest.fixture
+def tree(temp_work_dir: Path) -> Path:
+    for rel_path in [
+        "README.md",
+        ".gitignore",
+        "src/main.py",
+        "src/pkg/__init__.py",
+        "src/pkg/util.py",
+        "src/pkg/util.pyc",
+        "src/pkg/sub/deep.py",
+        "docs/guide/intro.md",
+        "node_modules/react/index.js",
+        "generated/out.py",
+        "fixtures/data.json",
+    ]:
+        path = temp_work_dir / rel_path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text("")
+    (temp_work_dir / ".gitignore").write_text("generated/\n")
+    return temp_work_dir
+
+
+@asynccontextmanager
+async def _started(
+    root: Path, *, watch: bool = True, poll_interval: float = 2.0
+) -> AsyncGenerator[WorkspaceIndex]:
+    workspace = WorkspaceIndex(root, ignore=["fixtures/"], watch=watch, poll_interval=poll_interval)
+    await workspace.start()
+    try:
+        assert await workspace.wait_ready()
+        yield workspace
+    finally:
+        await workspace.aclose()
+
+
+def _disk_glob(
+    workspace: WorkspaceIndex, pattern: str, under: Path, include_dirs: bool
+) -> list[str]:
+    return sorted(
+        _iter_glob(
+            under,
+            pattern,
+            include_dirs=include_dirs,
+            prune=lambda entry: workspace.prunes(entry.path),
+        )
+    )
+
+
+@pytest.mark.asyncio
+async def test_workspace_index_queries(tree: Path):
+    async with _started(tree) as index:
+        assert index.list_dir(tree) == [
+            ".gitignore",
+            "README.md",
+            "docs/",
+            "fixtures/",
+            "generated/",
+            "node_modules/",
+            "src/",
+        ]
+        # ignored directories are listed, but not descended into
+        assert index.list_dir(tree / "node_modules") == []
+        assert index.covers(tree / "src" / "pkg")
+        assert not index.covers(tree / "generated")
+        assert not index.covers(tree / "fixtures")
+
+        assert index.prefix("src/pkg/", 10) == [
+            "src/pkg/",
+            "src/pkg/__init__.py",
+            "src/pkg/sub/",
+            "src/pkg/sub/deep.py",
+            "src/pkg/util.py",
+            "src/pkg/util.pyc",
+        ]
+        assert index.files(tree / "src") == [
+            "main.py",
+            "pkg/__init__.py",
+            "pkg/sub/deep.py",
+            "pkg/util.py",
+            "pkg/util.pyc",
+        ]
+        assert index.files(tree / "generated") is None
+        # matches in the name come first
+        assert index.fuzzy("util", 3) == ["src/pkg/util.py", "src/pkg/util.pyc"]
+        assert index.fuzzy("pkdp", 3) == ["src/pkg/sub/deep.py"]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "pattern",
+    [
+        "*",
+        "**",
+        "**/*.py",
+        "src/**",
+        "src/**/*.py",
+        "*/",
+        "**/",
+        "*.{md,json}",
+        "**/pkg",
+        "*/pkg/*",
+        "src/*/sub/*",
+        "docs/*/",
+        "**/react",
+    ],
+)
+async def test_workspace_index_glob_matches_disk(tree: Path, pattern: str):
+    async with _started(tree) as index:
+        for under in (tree, tree / "src"):
+            for include_dirs in (True, False):
+                matches = index.glob(pattern, under, include_dirs=include_dirs)
+                assert matches is not None
+                assert sorted(matches) == _disk_glob(index, pattern, under, include_dirs)
+
+
+@pytest.mark.asyncio
+async def test_workspace_index_glob_falls_back(tree: Path):
+    async with _started(tree) as index:
+        # directories that are not descended into can be named explicitly
+        assert index.glob("node_modules/*", tree) is None
+        assert index.glob("generated/*.py", tree) is None
+        assert index.glob("*/react/*", tree) is not None
+        assert index.glob("*", tree / "node_modules") is None
+        assert index.glob("../*", tree / "src") is None
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("watch", [True, False], ids=["inotify", "polling"])
+async def test_workspace_index_updates(tree: Path, watch: bool):
+    if watch and not sys.platform.startswith("linux"):
+        pytest.skip("inotify is only available on Linux")
+    async with _started(tree, watch=watch, poll_interval=0.05) as workspace:
+
+        async def assert_in_sync() -> None:
+            await workspace.sync()
+            matches = workspace.glob("**/*", tree)
+            assert matches is not None
+            assert sorted(matches) == _disk_glob(workspace, "**/*", tree, True)
+
+        (tree / "lib" / "nested").mkdir(parents=True)
+        (tree / "lib" / "nested" / "a.py").write_text("")
+        await assert_in_sync()
+        assert "lib/nested/a.py" in workspace.paths()
+
+        os.rename(tree / "lib", tree / "lib2")
+        (tree / "lib2" / "nested" / "b.py").write_text("")
+        await assert_in_sync()
+        assert "lib2/nested/b.py" in workspace.paths()
+
+        shutil.rmtree(tree / "src")
+        await assert_in_sync()
+        assert not any(path.startswith("src/") for path in workspace.paths())
+
+        (tree / ".gitignore").write_text("lib2/\n")
+        st = (tree / ".gitignore").stat()
+        os.utime(tree / ".gitignore", ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+        await assert_in_sync()
+        assert "lib2/" in workspace.paths()
+        assert "lib2/nested/" not in workspace.paths()
+        assert "generated/out.py" in workspace.paths()
+
+
+@pytest.mark.asyncio
+async def test_workspace_index_gives_up_on_large_trees(tree: Path):
+    workspace = WorkspaceIndex(tree, max_paths=5)
+    await workspace.start()
+    assert not await workspace.wait_ready()
+    assert workspace.glob("**/*.py", tree) is None
+    assert workspace.files(tree) is None
+    await workspace.aclose()
+
+
+@pytest.mark.asyncio
+async def test_glob_from_workspace_index(tree: Path, builtin_args: BuiltinSystemPromptArgs):
+    async with _started(tree) as index:
+        glob = Glob(builtin_args, index)
+        (tree / "src" / "new.py").write_text("")
+
+        result = await glob(Params(pattern="src/*.py"))
+        assert isinstance(result, ToolOk)
+        assert result.output == "\n".join(
+            [os.path.join("src", "main.py"), os.path.join("src", "new.py")]
+        )
+
+        # not in the index
+        result = await glob(Params(pattern="node_modules/**/*.js"))
+        assert isinstance(result, ToolOk)
+        assert result.output == os.path.join("node_modules", "react", "index.js")
+
+
+@pytest.mark.asyncio
+async def test_grep_without_ripgrep_from_workspace_index(
+    tree: Path,
+    config: Config,
+    builtin_args: BuiltinSystemPromptArgs,
+    monkeypatch: pytest.MonkeyPatch,
+):
+    monkeypatch.setattr(grep, "_rg_retry_at", math.inf)
+    for rel_path in ["src/main.py", "generated/out.py", "node_modules/react/index.js"]:
+        (tree / rel_path).write_text("needle\n")
+    async with _started(tree) as index:
+        grep_tool = grep.Grep(config, builtin_args, index)
+        (tree / "src" / "pkg" / "util.py").write_text("needle\n")
+        result = await grep_tool(grep.Params(pattern="needle", path=str(tree)))
+        assert isinstance(result, ToolOk)
+        # ignored directories are skipped, like ripgrep does
+        assert result.output == "\n".join(
+            [str(tree / "src" / "main.py"), str(tree / "src" / "pkg" / "util.py")]
+        )